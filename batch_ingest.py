@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+Headless batch ingestion of KIGAM sheet ZIPs.
+
+Runs ZipProcessor without the plugin dialog, one standalone QgsApplication
+per worker process, and writes for every sheet:
+
+    <out_dir>/<sheet>/<sheet>.gpkg          styled, UTF-8 layers (+ layer_styles)
+    <out_dir>/<sheet>/<layer>.qml           style of each layer (symbols as ./sym/...)
+    <out_dir>/<sheet>/sym/                  raster symbol images used by the styles
+    <out_dir>/<sheet>/<sheet>_report.json   encoding, style and timing per layer
+
+plus <out_dir>/batch_report.json. From the QGIS Python environment, with the
+plugins folder on PYTHONPATH:
+
+    python -m KigamGeoDownloader.batch_ingest <zip_dir> <out_dir> --workers 4
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+_QGS_APP = None
+
+
+def _init_worker(verbose=False):
+    """Start a GUI-less QgsApplication once per worker process."""
+    global _QGS_APP
+    from qgis.core import QgsApplication
+
+    prefix_path = os.environ.get("QGIS_PREFIX_PATH")
+    if prefix_path:
+        QgsApplication.setPrefixPath(prefix_path, True)
+    _QGS_APP = QgsApplication([], False)
+    _QGS_APP.initQgis()
+
+    if verbose:
+        def echo(message, tag, _level):
+            if tag == "KIGAM Plugin":
+                print(f"[{os.getpid()}] {message}", file=sys.stderr, flush=True)
+        QgsApplication.messageLog().messageReceived.connect(echo)
+
+
+def _layer_report(layer):
+    renderer = layer.renderer()
+    report = {
+        "name": layer.name(),
+        "source": layer.source().split("|", 1)[0],
+        "features": layer.featureCount(),
+        "geometry_type": int(layer.geometryType()),
+        "encoding": layer.dataProvider().encoding(),
+        "renderer": renderer.type() if renderer else None,
+        "style_field": None,
+        "categories": 0,
+    }
+    if renderer is not None and renderer.type() == "categorizedSymbol":
+        report["style_field"] = renderer.classAttribute()
+        report["categories"] = len(renderer.categories())
+    return report
+
+
+def _bundle_symbol_images(layers, sym_dir):
+    """
+    Copy every raster symbol image used by *layers* into *sym_dir* and
+    point the symbol layers at the copies, so the saved styles no longer
+    reference the temporary extraction folder or symbol store.
+    Returns {normalized original path: copied path}.
+    """
+    from qgis.core import QgsRasterFillSymbolLayer, QgsRasterMarkerSymbolLayer
+
+    copied = {}
+    used_names = set()
+
+    def bundle(path):
+        if not path or not os.path.isfile(path):
+            return None
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in copied:
+            stem, ext = os.path.splitext(os.path.basename(path))
+            name = f"{stem}{ext}"
+            suffix = 2
+            while name.casefold() in used_names:
+                name = f"{stem}_{suffix}{ext}"
+                suffix += 1
+            used_names.add(name.casefold())
+            os.makedirs(sym_dir, exist_ok=True)
+            target = os.path.join(sym_dir, name)
+            shutil.copy2(path, target)
+            copied[key] = target
+        return copied[key]
+
+    def relink(symbol):
+        for symbol_layer in symbol.symbolLayers():
+            if isinstance(symbol_layer, QgsRasterFillSymbolLayer):
+                target = bundle(symbol_layer.imageFilePath())
+                if target:
+                    symbol_layer.setImageFilePath(target)
+            elif isinstance(symbol_layer, QgsRasterMarkerSymbolLayer):
+                target = bundle(symbol_layer.path())
+                if target:
+                    symbol_layer.setPath(target)
+        return symbol
+
+    for layer in layers:
+        renderer = layer.renderer()
+        if renderer is None:
+            continue
+        if renderer.type() == "categorizedSymbol":
+            for idx, category in enumerate(renderer.categories()):
+                if category.symbol() is not None:
+                    renderer.updateCategorySymbol(idx, relink(category.symbol().clone()))
+        elif renderer.type() == "singleSymbol" and renderer.symbol() is not None:
+            renderer.setSymbol(relink(renderer.symbol().clone()))
+    return copied
+
+
+def _relativize_qml_images(qml_path, sym_dir):
+    """
+    Rewrite imageFile paths inside *sym_dir* as ./sym/<name> relative to the
+    QML. Returns the absolute image paths left outside the bundle.
+    """
+    from .defusedxml import qml as qml_stream
+
+    sym_root = os.path.normcase(os.path.abspath(sym_dir))
+    base_dir = os.path.dirname(os.path.abspath(qml_path))
+    unbundled = []
+
+    def relink(value):
+        if not value or not os.path.isabs(value):
+            return None
+        if os.path.normcase(os.path.dirname(os.path.abspath(value))) != sym_root:
+            unbundled.append(value)
+            return None
+        return "./" + os.path.relpath(value, base_dir).replace(os.sep, "/")
+
+    qml_stream.relink_image_files(qml_path, qml_path, relink)
+    return unbundled
+
+
+def ingest_sheet(zip_path, out_dir, font_family=None, font_size=10):
+    """
+    Load, style and export one sheet ZIP. Runs inside a worker that has
+    called _init_worker. Returns the sheet report (also written as JSON).
+    """
+    from qgis.core import Qgis, QgsMessageLog, QgsProject
+    from .zip_processor import ZipProcessor, _safe_prefix
+
+    started = time.perf_counter()
+    safe_prefix = _safe_prefix(zip_path)
+    sheet_dir = os.path.join(out_dir, safe_prefix)
+    os.makedirs(sheet_dir, exist_ok=True)
+    report = {
+        "zip_path": os.path.abspath(zip_path),
+        "sheet": safe_prefix,
+        "status": "failed",
+        "geopackage": None,
+        "layers": [],
+    }
+
+    processor = ZipProcessor()
+    # Outputs are GeoPackages with their own R-trees; no .qix tasks to wait for.
+    processor.build_spatial_index = False
+    try:
+        layers = processor.process_zip(
+            zip_path, font_family=font_family, font_size=font_size)
+        if layers:
+            sym_dir = os.path.join(sheet_dir, "sym")
+            report["symbols"] = len(_bundle_symbol_images(layers, sym_dir))
+            report["geopackage"] = processor._write_sheet_geopackage(
+                sheet_dir, safe_prefix, layers)
+            for layer in layers:
+                layer_report = _layer_report(layer)
+                qml_path = os.path.join(sheet_dir, f"{layer.name()}.qml")
+                _message, saved = layer.saveNamedStyle(qml_path)
+                if saved and os.path.isdir(sym_dir):
+                    unbundled = _relativize_qml_images(qml_path, sym_dir)
+                    if unbundled:
+                        layer_report["unbundled_images"] = unbundled
+                        QgsMessageLog.logMessage(
+                            f"{qml_path}: {len(unbundled)} image path(s) not in {sym_dir}, e.g. {unbundled[0]}",
+                            "KIGAM Plugin",
+                            Qgis.MessageLevel.Warning
+                        )
+                layer_report["qml"] = qml_path if saved else None
+                report["layers"].append(layer_report)
+            if report["geopackage"]:
+                report["status"] = "ok"
+        else:
+            report["error"] = "no layers loaded"
+    except Exception as e:
+        report["error"] = str(e)
+    finally:
+        # Workers are reused; start each sheet from an empty project.
+        QgsProject.instance().clear()
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    with open(os.path.join(sheet_dir, f"{safe_prefix}_report.json"), "w", encoding="utf-8") as fp:
+        json.dump(report, fp, ensure_ascii=False, indent=2)
+    return report
+
+
+def _plan_batch(zip_paths):
+    from .zip_processor import ZipProcessor
+
+    plan = ZipProcessor().plan_batch(zip_paths)
+    return [
+        (sheet.zip_path, sheet.duplicate_of, sheet.refused)
+        for sheet in plan.sheets
+    ]
+
+
+def run_batch(zip_dir, out_dir, workers=None, font_family=None, font_size=10, verbose=False):
+    """
+    Ingest every *.zip in *zip_dir* with a process pool. Duplicate sheets and
+    ZIPs refused by the load planner are reported but not processed.
+    Returns the batch report.
+    """
+    zip_paths = sorted(
+        os.path.join(zip_dir, name)
+        for name in os.listdir(zip_dir)
+        if name.lower().endswith(".zip")
+    )
+    os.makedirs(out_dir, exist_ok=True)
+    workers = max(1, workers or (os.cpu_count() or 1))
+    started = time.perf_counter()
+
+    # Planning needs qgis.core too; do it in a throwaway worker so this
+    # process never creates a QgsApplication.
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx, initializer=_init_worker) as pool:
+        plan = pool.submit(_plan_batch, zip_paths).result()
+
+    batch = {"zip_dir": os.path.abspath(zip_dir), "sheets": [], "skipped": []}
+    to_load = []
+    for zip_path, duplicate_of, refused in plan:
+        if duplicate_of or refused:
+            batch["skipped"].append({
+                "zip_path": zip_path,
+                "duplicate_of": duplicate_of,
+                "refused": refused,
+            })
+        else:
+            to_load.append(zip_path)
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, max(1, len(to_load))),
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(verbose,)
+    ) as pool:
+        futures = {
+            pool.submit(ingest_sheet, zip_path, out_dir, font_family, font_size): zip_path
+            for zip_path in to_load
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            zip_path = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                # A crashed worker (segfault in a provider, ...) still gets a row.
+                report = {"zip_path": os.path.abspath(zip_path), "status": "failed", "error": str(e)}
+            batch["sheets"].append(report)
+            print(
+                f"[{done}/{len(to_load)}] {report['status']}: {zip_path}",
+                file=sys.stderr,
+                flush=True
+            )
+
+    batch["sheets"].sort(key=lambda item: item["zip_path"])
+    batch["seconds"] = round(time.perf_counter() - started, 3)
+    with open(os.path.join(out_dir, "batch_report.json"), "w", encoding="utf-8") as fp:
+        json.dump(batch, fp, ensure_ascii=False, indent=2)
+    return batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load, style and export a directory of KIGAM sheet ZIPs without the QGIS GUI.")
+    parser.add_argument("zip_dir", help="folder containing sheet ZIPs")
+    parser.add_argument("out_dir", help="output folder (one subfolder per sheet)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument("--font", default=None, help="label font family")
+    parser.add_argument("--font-size", type=int, default=10, help="label font size")
+    parser.add_argument("--verbose", action="store_true",
+                        help="echo plugin log messages to stderr")
+    args = parser.parse_args(argv)
+
+    batch = run_batch(
+        args.zip_dir,
+        args.out_dir,
+        workers=args.workers,
+        font_family=args.font,
+        font_size=args.font_size,
+        verbose=args.verbose
+    )
+    failed = [sheet for sheet in batch["sheets"] if sheet.get("status") != "ok"]
+    print(
+        f"{len(batch['sheets']) - len(failed)} sheet(s) ingested, {len(failed)} failed, "
+        f"{len(batch['skipped'])} skipped in {batch['seconds']:.1f}s",
+        file=sys.stderr
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -29,6 +29,23 @@ def _read_source(
         return handle.read()
 
 
+def _create_parser():
+    """Return an expat parser whose DTD/entity hooks all raise ParseError."""
+    xml_parser = expat.ParserCreate()
+    xml_parser.buffer_text = True
+
+    def reject(*_args):
+        raise ParseError(_UNSAFE_XML_ERROR)
+
+    xml_parser.StartDoctypeDeclHandler = reject
+    xml_parser.EntityDeclHandler = reject
+    xml_parser.UnparsedEntityDeclHandler = reject
+    xml_parser.NotationDeclHandler = reject
+    xml_parser.ExternalEntityRefHandler = reject
+    xml_parser.SkippedEntityHandler = reject
+    return xml_parser
+
+
 def parse(source, parser=None):
     """Parse XML without allowing DTD/entity expansion features."""
     if parser is not None:
@@ -36,11 +53,7 @@ def parse(source, parser=None):
 
     data = _read_source(source)
     tree_builder = _ET.TreeBuilder()
-    xml_parser = expat.ParserCreate()
-    xml_parser.buffer_text = True
-
-    def reject(*_args):
-        raise ParseError(_UNSAFE_XML_ERROR)
+    xml_parser = _create_parser()
 
     def start(tag, attrs):
         tree_builder.start(tag, attrs)
@@ -51,12 +64,6 @@ def parse(source, parser=None):
     xml_parser.StartElementHandler = start
     xml_parser.EndElementHandler = end
     xml_parser.CharacterDataHandler = tree_builder.data
-    xml_parser.StartDoctypeDeclHandler = reject
-    xml_parser.EntityDeclHandler = reject
-    xml_parser.UnparsedEntityDeclHandler = reject
-    xml_parser.NotationDeclHandler = reject
-    xml_parser.ExternalEntityRefHandler = reject
-    xml_parser.SkippedEntityHandler = reject
 
     try:
         xml_parser.Parse(data, True)
@@ -1,5 +1,5 @@
 """Minimal in-repo subset of defusedxml used by the plugin."""
 
-from . import ElementTree
+from . import ElementTree, qml
 
-__all__ = ["ElementTree"]
+__all__ = ["ElementTree", "qml"]
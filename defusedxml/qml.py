@@ -0,0 +1,319 @@
+"""Streaming QML reader/rewriter with the same DTD/entity rejection as parse()."""
+
+from __future__ import annotations
+
+import codecs
+import os
+import re
+from collections import namedtuple
+from typing import BinaryIO, Callable, Optional, Tuple, Union
+from xml.parsers import expat
+
+from .ElementTree import ParseError, _create_parser
+
+
+_CHUNK_SIZE = 1 << 16
+
+_XML_DECL_RE = re.compile(rb"^(\xef\xbb\xbf)?<\?xml\s[^>]*?\?>[ \t]*(\r?\n)?")
+_XML_DECL_ENCODING_RE = re.compile(rb"""encoding\s*=\s*["']([A-Za-z0-9._-]+)["']""")
+_VALUE_ATTR_RES = {
+    name: re.compile(rb"(\s" + name.encode("ascii") + rb"""\s*=\s*)(["'])(.*?)\2""", re.DOTALL)
+    for name in ("v", "value")
+}
+
+QmlRenderer = namedtuple(
+    "QmlRenderer", ["type", "attr", "symbol_images", "categories"])
+QmlRenderer.__doc__ = """\
+First <renderer-v2> of a QML document.
+
+symbol_images: [(symbol name, first descendant imageFile prop value)]
+    for each ./symbols/symbol that has one, in document order.
+categories: [(category value, symbol name)] for each ./categories/category.
+"""
+
+
+class _StopParsing(Exception):
+    pass
+
+
+def _image_file_attr(tag, attrs) -> Optional[str]:
+    """
+    Attribute holding the path when the element is a symbol imageFile:
+    ``v`` of <prop k="imageFile"> (QGIS < 3.26) or ``value`` of
+    <Option name="imageFile"> (QGIS 3.26+ writes only this form).
+    """
+    if tag == "prop" and attrs.get("k") == "imageFile":
+        return "v"
+    if tag == "Option" and attrs.get("name") == "imageFile":
+        return "value"
+    return None
+
+
+def _open_source(source: Union[BinaryIO, os.PathLike, str]):
+    if hasattr(source, "read"):
+        return source, False
+    return open(os.fspath(source), "rb"), True
+
+
+def _read_chunks(handle: BinaryIO):
+    while True:
+        chunk = handle.read(_CHUNK_SIZE)
+        if not chunk:
+            break
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        yield chunk
+
+
+def read_renderer(source) -> Optional[QmlRenderer]:
+    """
+    Extract the first <renderer-v2> (type, attr, symbol imageFile values and
+    categories) in a single event-driven pass. Parsing stops as soon as that
+    renderer element closes, so trailing layer properties are never read.
+    Non-categorized renderers are returned with empty symbol/category lists.
+    Returns None when the document has no renderer-v2.
+    """
+    xml_parser = _create_parser()
+    state = {
+        "depth": 0,
+        "renderer_depth": None,
+        "renderer": None,
+        "symbol": None,
+        # True whenever we are not inside a ./symbols/symbol still missing its image.
+        "symbol_has_image": True,
+    }
+    stack = []
+    symbol_images = []
+    categories = []
+
+    def start(tag, attrs):
+        state["depth"] += 1
+        stack.append(tag)
+        depth = state["depth"]
+
+        renderer_depth = state["renderer_depth"]
+        if renderer_depth is None:
+            if tag == "renderer-v2":
+                state["renderer_depth"] = depth
+                state["renderer"] = (attrs.get("type"), attrs.get("attr"))
+                if attrs.get("type") != "categorizedSymbol":
+                    raise _StopParsing()
+            return
+
+        relative = depth - renderer_depth
+        if relative == 2 and tag == "symbol" and stack[-2] == "symbols":
+            state["symbol"] = attrs.get("name")
+            state["symbol_has_image"] = False
+        elif relative == 2 and tag == "category" and stack[-2] == "categories":
+            categories.append((attrs.get("value"), attrs.get("symbol")))
+        elif not state["symbol_has_image"] and _image_file_attr(tag, attrs):
+            symbol_images.append((state["symbol"], attrs.get(_image_file_attr(tag, attrs))))
+            state["symbol_has_image"] = True
+
+    def end(tag):
+        depth = state["depth"]
+        renderer_depth = state["renderer_depth"]
+        if renderer_depth is not None:
+            if depth == renderer_depth:
+                raise _StopParsing()
+            if depth - renderer_depth == 2 and tag == "symbol" and stack[-2] == "symbols":
+                state["symbol"] = None
+                state["symbol_has_image"] = True
+        stack.pop()
+        state["depth"] -= 1
+
+    xml_parser.StartElementHandler = start
+    xml_parser.EndElementHandler = end
+
+    handle, owned = _open_source(source)
+    try:
+        for chunk in _read_chunks(handle):
+            xml_parser.Parse(chunk, False)
+        xml_parser.Parse(b"", True)
+    except _StopParsing:
+        pass
+    except ParseError:
+        raise
+    except expat.ExpatError as exc:
+        raise ParseError(str(exc)) from exc
+    finally:
+        if owned:
+            handle.close()
+
+    if state["renderer"] is None:
+        return None
+    renderer_type, renderer_attr = state["renderer"]
+    return QmlRenderer(renderer_type, renderer_attr, symbol_images, categories)
+
+
+def _escape_attr(value: str) -> str:
+    return (
+        value.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+        .replace("'", "&apos;")
+    )
+
+
+def _tag_end(buf: bytearray, start: int) -> int:
+    """Index of the '>' closing the start tag at *start* (quotes respected)."""
+    quote = None
+    for idx in range(start + 1, len(buf)):
+        ch = buf[idx]
+        if quote is not None:
+            if ch == quote:
+                quote = None
+        elif ch in (0x22, 0x27):  # " '
+            quote = ch
+        elif ch == 0x3E:  # >
+            return idx
+    raise ParseError("unterminated start tag")
+
+
+def _patch_value_attr(tag: bytes, value: bytes, attr: str) -> bytes:
+    match = _VALUE_ATTR_RES[attr].search(tag)
+    if match:
+        return tag[:match.start(3)] + value + tag[match.end(3):]
+
+    insert_at = len(tag) - 2 if tag.endswith(b"/>") else len(tag) - 1
+    return tag[:insert_at].rstrip() + b" " + attr.encode("ascii") + b'="' + value + b'"' + tag[insert_at:]
+
+
+class _TranscodingWriter:
+    def __init__(self, handle, source_encoding, target_encoding):
+        self._handle = handle
+        self._passthrough = codecs.lookup(source_encoding).name == codecs.lookup(target_encoding).name
+        self._decoder = codecs.getincrementaldecoder(source_encoding)()
+        self._encoder = codecs.getincrementalencoder(target_encoding)("xmlcharrefreplace")
+
+    def write_text(self, text: str):
+        self._handle.write(self._encoder.encode(text))
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        if self._passthrough:
+            self._handle.write(bytes(data))
+            return
+        self._handle.write(self._encoder.encode(self._decoder.decode(bytes(data))))
+
+    def close(self):
+        if not self._passthrough:
+            self._handle.write(self._encoder.encode(
+                self._decoder.decode(b"", True), True))
+
+
+def relink_image_files(
+    source: Union[os.PathLike, str],
+    dest: Union[os.PathLike, str],
+    relink: Callable[[str], Optional[str]],
+    encoding: str = "UTF-8",
+) -> Tuple[int, int]:
+    """
+    Stream *source* to *dest*, replacing only the path of every
+    <prop k="imageFile" v=...> and <Option name="imageFile" value=...> for
+    which ``relink(old_value)`` returns a new path.
+    All other bytes are copied through unchanged (transcoded to *encoding*,
+    with the XML declaration rewritten to match). Requires an
+    ASCII-compatible source encoding.
+
+    Returns (imageFile values seen, values relinked). *dest* is written
+    atomically and only when parsing succeeds.
+    """
+    xml_parser = _create_parser()
+    counts = {"total": 0, "relinked": 0, "processed": 0}
+    edits = []
+
+    def start(tag, attrs):
+        position = xml_parser.CurrentByteIndex
+        counts["processed"] = position
+        attr = _image_file_attr(tag, attrs)
+        if attr is None:
+            return
+        counts["total"] += 1
+        new_value = relink(attrs.get(attr) or "")
+        if new_value is not None:
+            edits.append((position, new_value, attr))
+
+    def end(_tag):
+        counts["processed"] = xml_parser.CurrentByteIndex
+
+    xml_parser.StartElementHandler = start
+    xml_parser.EndElementHandler = end
+
+    dest = os.fspath(dest)
+    tmp_path = f"{dest}.{os.getpid()}.tmp"
+    stream = {"encoding": "utf-8", "offset": 0, "writer": None}
+    buf = bytearray()
+
+    def open_output(out):
+        # The XML declaration must be complete before it can be replaced.
+        if buf[:2] in (b"\xff\xfe", b"\xfe\xff") or b"\x00" in buf[:4]:
+            raise ParseError("streaming rewrite needs an ASCII-compatible encoding")
+        decl = _XML_DECL_RE.match(buf)
+        if decl:
+            enc = _XML_DECL_ENCODING_RE.search(decl.group(0))
+            if enc:
+                stream["encoding"] = enc.group(1).decode("ascii")
+        try:
+            writer = _TranscodingWriter(out, stream["encoding"], encoding)
+        except LookupError as exc:
+            raise ParseError(str(exc)) from exc
+        writer.write_text(f"<?xml version='1.0' encoding='{encoding}'?>\n")
+        skip = decl.end() if decl else (3 if buf[:3] == b"\xef\xbb\xbf" else 0)
+        # Offsets stay absolute: expat still sees the original bytes.
+        del buf[:skip]
+        stream["offset"] = skip
+        stream["writer"] = writer
+
+    def flush(final=False):
+        writer = stream["writer"]
+        for position, new_value, attr in edits:
+            rel = position - stream["offset"]
+            if rel < 0 or buf[rel:rel + 1] != b"<":
+                raise ParseError("lost track of imageFile start tag")
+            tag_end = _tag_end(buf, rel) + 1
+            value = _escape_attr(new_value).encode(stream["encoding"], "xmlcharrefreplace")
+            writer.write(buf[:rel])
+            writer.write(_patch_value_attr(bytes(buf[rel:tag_end]), value, attr))
+            del buf[:tag_end]
+            stream["offset"] += tag_end
+            counts["relinked"] += 1
+        edits.clear()
+
+        # Everything before the last reported event has been parsed.
+        safe = len(buf) if final else counts["processed"] - stream["offset"]
+        if safe > 0:
+            writer.write(buf[:safe])
+            del buf[:safe]
+            stream["offset"] += safe
+
+    try:
+        with open(os.fspath(source), "rb") as handle, open(tmp_path, "wb") as out:
+            for chunk in _read_chunks(handle):
+                buf.extend(chunk)
+                xml_parser.Parse(chunk, False)
+                if stream["writer"] is None and len(buf) >= 1024:
+                    open_output(out)
+                if stream["writer"] is not None:
+                    flush()
+
+            xml_parser.Parse(b"", True)
+            if stream["writer"] is None:
+                open_output(out)
+            flush(final=True)
+            stream["writer"].close()
+        os.replace(tmp_path, dest)
+    except ParseError:
+        raise
+    except expat.ExpatError as exc:
+        raise ParseError(str(exc)) from exc
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    return counts["total"], counts["relinked"]
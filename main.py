@@ -3,20 +3,25 @@ from qgis.PyQt.QtWidgets import (
     QAction, QMessageBox, QFileDialog, QDialog, QVBoxLayout,
     QHBoxLayout, QLabel, QFontComboBox, QSpinBox, QDialogButtonBox,
     QPushButton, QLineEdit, QGroupBox, QFormLayout, QComboBox,
-    QListWidget, QListWidgetItem, QTextEdit
+    QListWidget, QListWidgetItem, QTextEdit, QCheckBox, QProgressBar
 )
 from qgis.PyQt.QtGui import QIcon, QDesktopServices, QFont
-from qgis.core import QgsProject, QgsCoordinateTransform
-import processing
+from qgis.core import (
+    QgsApplication, QgsProject, QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsVectorLayer
+)
 
+import contextlib
 import os.path
 import tempfile
 import shutil
+import time
 import uuid
 import numpy as np
 from osgeo import gdal
 from .zip_processor import ZipProcessor
 from . import geochem_utils
+from . import maxent_export
+from . import zonal_stats
 from .plugin_config import PLUGIN_CONFIG, DEFAULT_PLUGIN_CONFIG
 
 
@@ -52,6 +57,18 @@ def _cfg_str_list(value, default):
     return parsed or list(default)
 
 
+def _cfg_float_list(value, default):
+    if not isinstance(value, list):
+        return list(default)
+    parsed = []
+    for item in value:
+        try:
+            parsed.append(float(item))
+        except (TypeError, ValueError):
+            continue
+    return parsed or list(default)
+
+
 def _cfg_bool(value, default=False):
     if isinstance(value, bool):
         return value
@@ -145,10 +162,6 @@ NODATA_VALUE = _cfg_float(RASTER_CONFIG.get(
     "nodata"), DEFAULT_RASTER_CONFIG.get("nodata", -9999.0))
 GDAL_DATA_TYPE = _cfg_int(RASTER_CONFIG.get(
     "gdal_data_type"), DEFAULT_RASTER_CONFIG.get("gdal_data_type", 5))
-MAXENT_RASTERIZE_UNITS = _cfg_int(
-    RASTER_CONFIG.get("maxent_rasterize_units"),
-    DEFAULT_RASTER_CONFIG.get("maxent_rasterize_units", 1),
-)
 MAXENT_RESAMPLING = _cfg_int(
     RASTER_CONFIG.get("maxent_resampling"),
     DEFAULT_RASTER_CONFIG.get("maxent_resampling", 0),
@@ -157,6 +170,73 @@ GEOCHEM_FILL_NODATA_DISTANCE = _cfg_int(
     RASTER_CONFIG.get("geochem_fill_nodata_distance"),
     DEFAULT_RASTER_CONFIG.get("geochem_fill_nodata_distance", 30),
 )
+MOSAIC_MODE_DEFAULT = _cfg_bool(
+    ZIP_CONFIG.get("mosaic_mode"),
+    DEFAULT_ZIP_CONFIG.get("mosaic_mode", False),
+)
+MAXENT_COMMON_MASK = _cfg_bool(
+    RASTER_CONFIG.get("maxent_common_mask"),
+    DEFAULT_RASTER_CONFIG.get("maxent_common_mask", True),
+)
+MAXENT_CATEGORICAL_DEFAULT = _cfg_bool(
+    RASTER_CONFIG.get("maxent_categorical"),
+    DEFAULT_RASTER_CONFIG.get("maxent_categorical", False),
+)
+MAXENT_ASC_DECIMALS = max(0, _cfg_int(
+    RASTER_CONFIG.get("asc_decimal_places"),
+    DEFAULT_RASTER_CONFIG.get("asc_decimal_places", 4),
+))
+MAXENT_TILING = _cfg_str(
+    RASTER_CONFIG.get("maxent_tiling"),
+    DEFAULT_RASTER_CONFIG.get("maxent_tiling", "auto"),
+).lower()
+MAXENT_MEMORY_BUDGET_MB = max(16, _cfg_int(
+    RASTER_CONFIG.get("maxent_memory_budget_mb"),
+    DEFAULT_RASTER_CONFIG.get("maxent_memory_budget_mb", 512),
+))
+MAXENT_EXPORT_CACHE = _cfg_bool(
+    RASTER_CONFIG.get("export_cache"),
+    DEFAULT_RASTER_CONFIG.get("export_cache", True),
+)
+MAXENT_EXPORT_CACHE_MAX_MB = max(0, _cfg_int(
+    RASTER_CONFIG.get("export_cache_max_mb"),
+    DEFAULT_RASTER_CONFIG.get("export_cache_max_mb", 2048),
+))
+MAXENT_EXPORT_CACHE_DIR = os.path.join(
+    tempfile.gettempdir(),
+    _cfg_str(
+        ZIP_CONFIG.get("extract_root_name"),
+        DEFAULT_ZIP_CONFIG.get("extract_root_name", "KIGAM_Extract"),
+    ),
+    _cfg_str(
+        RASTER_CONFIG.get("export_cache_dir_name"),
+        DEFAULT_RASTER_CONFIG.get("export_cache_dir_name", "_export_cache"),
+    ),
+)
+ZONAL_FIELD_CANDIDATES = _cfg_str_list(
+    RASTER_CONFIG.get("zonal_field_candidates"),
+    DEFAULT_RASTER_CONFIG.get("zonal_field_candidates", ["LITHONAME", "LITHOIDX", "TYPE", "CODE"]),
+)
+ZONAL_PERCENTILES = [
+    percentile
+    for percentile in _cfg_float_list(
+        RASTER_CONFIG.get("zonal_percentiles"),
+        DEFAULT_RASTER_CONFIG.get("zonal_percentiles", [10, 25, 50, 75, 90]),
+    )
+    if 0 <= percentile <= 100
+]
+MAXENT_DISTANCE_MAX = max(0.0, _cfg_float(
+    RASTER_CONFIG.get("distance_max_m"),
+    DEFAULT_RASTER_CONFIG.get("distance_max_m", 0.0),
+))
+SWD_SPECIES_FIELD = _cfg_str(
+    RASTER_CONFIG.get("swd_species_field"),
+    DEFAULT_RASTER_CONFIG.get("swd_species_field", ""),
+)
+SWD_DROP_MISSING = _cfg_bool(
+    RASTER_CONFIG.get("swd_drop_missing"),
+    DEFAULT_RASTER_CONFIG.get("swd_drop_missing", True),
+)
 MAXENT_MULTITHREADING = _cfg_bool(
     RASTER_CONFIG.get("multithreading"),
     DEFAULT_RASTER_CONFIG.get("multithreading", False),
@@ -214,12 +294,23 @@ class MainDialog(QDialog):
         self.size_spin.setToolTip("지층 코드 라벨의 크기를 설정합니다.")
         load_layout.addRow("글꼴 크기:", self.size_spin)
 
+        self.mosaic_check = QCheckBox("여러 도엽을 주제별 레이어로 병합 (Mosaic)")
+        self.mosaic_check.setChecked(MOSAIC_MODE_DEFAULT)
+        self.mosaic_check.setToolTip(
+            "ZIP 여러 개를 불러올 때 같은 종류의 레이어(litho, 단층선 등)를 하나의 레이어로 합치고 통합 심볼을 적용합니다.")
+        load_layout.addRow("", self.mosaic_check)
+
         self.load_btn = QPushButton("자동 로드 및 스타일 적용")
         self.load_btn.setToolTip(
             "ZIP 압축을 해제하고 SHP 파일을 로드한 뒤 표준 심볼과 라벨을 적용합니다.")
         self.load_btn.clicked.connect(self.load_selected_zips)
         load_layout.addRow("", self.load_btn)
 
+        self.load_progress = QProgressBar()
+        self.load_progress.setFormat("%p%")
+        self.load_progress.setVisible(False)
+        load_layout.addRow("", self.load_progress)
+
         load_group.setLayout(load_layout)
         layout.addWidget(load_group)
 
@@ -269,6 +360,20 @@ class MainDialog(QDialog):
         self.geochem_btn.clicked.connect(self.run_geochem_analysis)
         geochem_layout.addRow("", self.geochem_btn)
 
+        # Zonal statistics of converted rasters per lithological unit
+        self.zonal_litho_combo = QComboBox()
+        self.zonal_litho_combo.setToolTip("암상 단위로 통계를 낼 지질도(면) 레이어를 선택하세요.")
+        geochem_layout.addRow("암상 레이어:", self.zonal_litho_combo)
+        self.zonal_raster_list = QListWidget()
+        self.zonal_raster_list.setMaximumHeight(80)
+        self.zonal_raster_list.setToolTip("통계를 낼 수치화 래스터(Pb, Cu, CaO 등)를 선택하세요.")
+        geochem_layout.addRow("수치 래스터:", self.zonal_raster_list)
+        self.zonal_btn = QPushButton("암상별 통계 (개수·평균·표준편차·최소·최대·백분위)")
+        self.zonal_btn.setToolTip(
+            "암상을 래스터 격자에 라벨로 변환한 뒤 블록 단위로 집계하여 CSV와 속성(GeoPackage)으로 저장합니다.")
+        self.zonal_btn.clicked.connect(self.run_zonal_statistics)
+        geochem_layout.addRow("", self.zonal_btn)
+
         # Add Refresh Button for Extent Combo (Reuse logic if possible or separate)
         # Actually refresh_layer_list can serve both
 
@@ -284,7 +389,7 @@ class MainDialog(QDialog):
 
         # Add descriptive help text (In-place help)
         help_lbl = QLabel(
-            "💡 팁: 여러 지질도(Vector)를 선택하면 하나로 병합됩니다.\n      수치화된 지구화학도(Raster)도 선택하여 변환할 수 있습니다.")
+            "💡 팁: 같은 주제의 여러 도엽(Vector)은 하나의 변수로 병합됩니다.\n      선택한 모든 변수는 같은 격자(범위·해상도·원점)로 각각 저장됩니다.")
         help_lbl.setStyleSheet(
             "color: #666666; font-size: 11px; margin-bottom: 5px;")
         maxent_layout.addWidget(help_lbl)
@@ -295,8 +400,23 @@ class MainDialog(QDialog):
         self.refresh_layer_list()
         maxent_layout.addWidget(self.layer_list)
 
+        maxent_layout.addWidget(QLabel("거리 변수로 만들 선/면 레이어 (단층, 지질경계 등):"))
+        self.distance_list = QListWidget()
+        self.distance_list.setMaximumHeight(100)
+        self.distance_list.setToolTip(
+            "선택한 레이어까지의 거리(m) 래스터를 같은 격자로 만듭니다. "
+            "특정 암상만 쓰려면 레이어 필터를 먼저 설정하세요.")
+        self.refresh_distance_list()
+        maxent_layout.addWidget(self.distance_list)
+        self.distance_boundary_check = QCheckBox("면 레이어는 경계선(접촉부)까지의 거리로 계산")
+        self.distance_boundary_check.setToolTip(
+            "해제하면 면 내부는 0, 바깥은 면까지의 거리입니다.")
+        maxent_layout.addWidget(self.distance_boundary_check)
+
         refresh_btn = QPushButton("레이어 목록 새로고침")
         refresh_btn.clicked.connect(self.refresh_layer_list)
+        refresh_btn.clicked.connect(self.refresh_distance_list)
+        refresh_btn.clicked.connect(self.refresh_point_layer_combos)
         maxent_layout.addWidget(refresh_btn)
 
         form_layout = QFormLayout()
@@ -305,13 +425,55 @@ class MainDialog(QDialog):
         self.res_spin.setValue(EXPORT_RES_DEFAULT)
         self.res_spin.setSuffix(" m")
         form_layout.addRow("해상도 (Resolution):", self.res_spin)
+        self.export_format_combo = QComboBox()
+        self.export_format_combo.addItem("GeoTIFF (*.tif)", "tif")
+        self.export_format_combo.addItem("ASCII Grid (*.asc)", "asc")
+        self.export_format_combo.setToolTip("MaxEnt는 ASCII Grid(.asc)를 직접 읽을 수 있습니다.")
+        form_layout.addRow("출력 형식:", self.export_format_combo)
+        self.categorical_check = QCheckBox("범주형 변수로 내보내기 (정수 코드 + 속성표)")
+        self.categorical_check.setChecked(MAXENT_CATEGORICAL_DEFAULT)
+        self.categorical_check.setToolTip(
+            "LITHONAME 등 문자열 필드를 모든 도엽에 공통인 정수 코드(Byte/UInt16)로 변환하고, "
+            "코드표를 래스터 속성표(RAT)와 <변수명>_categories.csv로 저장합니다.")
+        form_layout.addRow("", self.categorical_check)
         maxent_layout.addLayout(form_layout)
 
         self.export_btn = QPushButton("선택한 레이어를 래스터로 내보내기")
-        self.export_btn.setToolTip("선택한 레이어들을 하나의 래스터 파일로 병합하여 저장합니다.")
+        self.export_btn.setToolTip("선택한 레이어들을 같은 격자에 맞춰 변수별 래스터 파일로 출력 폴더에 저장합니다.")
         self.export_btn.clicked.connect(self.export_maxent_raster)
         maxent_layout.addWidget(self.export_btn)
 
+        export_progress_layout = QHBoxLayout()
+        self.export_progress = QProgressBar()
+        self.export_progress.setRange(0, 100)
+        self.export_progress.setFormat("%p%")
+        export_progress_layout.addWidget(self.export_progress)
+        self.export_cancel_btn = QPushButton("취소")
+        self.export_cancel_btn.setToolTip("진행 중인 내보내기를 중단하고 이번에 쓴 파일을 삭제합니다.")
+        self.export_cancel_btn.clicked.connect(self.cancel_maxent_export)
+        export_progress_layout.addWidget(self.export_cancel_btn)
+        self.export_progress.setVisible(False)
+        self.export_cancel_btn.setVisible(False)
+        maxent_layout.addLayout(export_progress_layout)
+        self._export_task = None
+        self._last_export_dir = ""
+
+        swd_layout = QFormLayout()
+        self.swd_sample_combo = QComboBox()
+        self.swd_sample_combo.setToolTip("출현 지점(유적 등) 포인트 레이어입니다.")
+        swd_layout.addRow("출현 지점:", self.swd_sample_combo)
+        self.swd_background_combo = QComboBox()
+        self.swd_background_combo.setToolTip("배경 지점 포인트 레이어입니다. 없으면 출현 지점만 추출합니다.")
+        swd_layout.addRow("배경 지점:", self.swd_background_combo)
+        maxent_layout.addLayout(swd_layout)
+        self.refresh_point_layer_combos()
+
+        self.swd_btn = QPushButton("지점별 변수값 추출 (SWD CSV)")
+        self.swd_btn.setToolTip(
+            "내보낸 변수 래스터 폴더에서 지점 위치의 값을 한 번에 읽어 MaxEnt SWD 형식 CSV로 저장합니다.")
+        self.swd_btn.clicked.connect(self.export_swd)
+        maxent_layout.addWidget(self.swd_btn)
+
         self.maxent_group.setLayout(maxent_layout)
         layout.addWidget(self.maxent_group)
 
@@ -399,6 +561,31 @@ class MainDialog(QDialog):
                 self.extent_layer_combo.addItem(
                     f"[대상지] {layer.name()}", layer.id())
 
+        current_litho = self.zonal_litho_combo.currentData()
+        checked_rasters = {
+            self.zonal_raster_list.item(i).data(Qt.ItemDataRole.UserRole)
+            for i in range(self.zonal_raster_list.count())
+            if self.zonal_raster_list.item(i).checkState() == Qt.CheckState.Checked
+        }
+        self.zonal_litho_combo.clear()
+        self.zonal_raster_list.clear()
+        for layer in layers:
+            if layer.type() == 0 and layer.geometryType() == 2 \
+                    and LITHO_LAYER_KEYWORD in layer.name().lower():
+                self.zonal_litho_combo.addItem(layer.name(), layer.id())
+            if layer.type() == 1 and '(수치화)' in layer.name() and layer.providerType() == "gdal":
+                item = QListWidgetItem(layer.name())
+                item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+                item.setCheckState(
+                    Qt.CheckState.Checked if not checked_rasters or layer.id() in checked_rasters
+                    else Qt.CheckState.Unchecked)
+                item.setData(Qt.ItemDataRole.UserRole, layer.id())
+                self.zonal_raster_list.addItem(item)
+        if current_litho:
+            idx = self.zonal_litho_combo.findData(current_litho)
+            if idx >= 0:
+                self.zonal_litho_combo.setCurrentIndex(idx)
+
         # Restore selections if possible
         if current_wms:
             idx = self.wms_layer_combo.findData(current_wms)
@@ -414,6 +601,66 @@ class MainDialog(QDialog):
             f"대상지 {self.extent_layer_combo.count() - 1}개"
         )
 
+    def run_zonal_statistics(self):
+        """
+        Statistics of the checked converted rasters per lithological unit,
+        written as CSV files and a GeoPackage with the values as attributes.
+        """
+        project = QgsProject.instance()
+        litho_layer = project.mapLayer(self.zonal_litho_combo.currentData() or "")
+        if litho_layer is None:
+            QMessageBox.warning(self, "오류", "암상(지질도) 레이어를 선택해주세요.")
+            return
+        rasters = {}
+        for i in range(self.zonal_raster_list.count()):
+            item = self.zonal_raster_list.item(i)
+            if item.checkState() != Qt.CheckState.Checked:
+                continue
+            layer = project.mapLayer(item.data(Qt.ItemDataRole.UserRole))
+            if layer is not None:
+                # Same-named rasters (e.g. Pb of two sheets) get _2, _3, ...
+                base = name = layer.name().replace("(수치화)", "").strip()
+                suffix = 2
+                while name in rasters:
+                    name = f"{base}_{suffix}"
+                    suffix += 1
+                rasters[name] = layer.source()
+        if not rasters:
+            QMessageBox.warning(self, "오류", "수치화 래스터를 하나 이상 선택해주세요.")
+            return
+
+        field_names = {f.name() for f in litho_layer.fields()}
+        zone_field = next((c for c in ZONAL_FIELD_CANDIDATES if c in field_names), None)
+        if not zone_field:
+            QMessageBox.warning(
+                self, "오류",
+                f"'{litho_layer.name()}' 레이어에 암상 필드가 없습니다. 후보: {', '.join(ZONAL_FIELD_CANDIDATES)}")
+            return
+
+        out_dir = QFileDialog.getExistingDirectory(self, "암상별 통계 저장 폴더")
+        if not out_dir:
+            return
+
+        self.log("=========== 암상별 통계 ===========")
+        self.log(f"암상 레이어: {litho_layer.name()} ({zone_field}), 래스터 {len(rasters)}개")
+        started = time.perf_counter()
+        try:
+            csv_paths, gpkg_path = zonal_stats.run_zonal_statistics(
+                [litho_layer], zone_field, rasters, out_dir,
+                percentiles=ZONAL_PERCENTILES, log=self.log)
+        except Exception as e:
+            QMessageBox.critical(self, "오류", f"통계 계산 중 오류가 발생했습니다:\n{str(e)}")
+            return
+        self.log(f"완료: {time.perf_counter() - started:.1f}초")
+
+        stats_layer = QgsVectorLayer(
+            f"{gpkg_path}|layername=zonal_statistics", f"{litho_layer.name()} 암상별 통계", "ogr")
+        if stats_layer.isValid():
+            project.addMapLayer(stats_layer)
+        QMessageBox.information(
+            self, "성공",
+            f"암상별 통계 CSV {len(csv_paths)}개와 속성 레이어를 저장했습니다:\n{out_dir}")
+
     def refresh_layer_list(self):
         self.layer_list.clear()
         layers = QgsProject.instance().mapLayers().values()
@@ -429,6 +676,42 @@ class MainDialog(QDialog):
                 item.setData(Qt.ItemDataRole.UserRole, layer.id())
                 self.layer_list.addItem(item)
 
+    def refresh_distance_list(self):
+        """List line and polygon layers that can become distance variables."""
+        checked = {
+            self.distance_list.item(i).data(Qt.ItemDataRole.UserRole)
+            for i in range(self.distance_list.count())
+            if self.distance_list.item(i).checkState() == Qt.CheckState.Checked
+        }
+        self.distance_list.clear()
+        for layer in QgsProject.instance().mapLayers().values():
+            if layer.type() == 0 and layer.geometryType() in (1, 2):  # Line, Polygon
+                item = QListWidgetItem(layer.name())
+                item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+                item.setCheckState(
+                    Qt.CheckState.Checked if layer.id() in checked else Qt.CheckState.Unchecked)
+                item.setData(Qt.ItemDataRole.UserRole, layer.id())
+                self.distance_list.addItem(item)
+
+    def refresh_point_layer_combos(self):
+        """Fill the SWD sample/background combos with point layers."""
+        current_sample = self.swd_sample_combo.currentData()
+        current_background = self.swd_background_combo.currentData()
+        self.swd_sample_combo.clear()
+        self.swd_background_combo.clear()
+        self.swd_background_combo.addItem("(없음)", None)
+        for layer in QgsProject.instance().mapLayers().values():
+            if layer.type() == 0 and layer.geometryType() == 0:  # Point
+                self.swd_sample_combo.addItem(layer.name(), layer.id())
+                self.swd_background_combo.addItem(layer.name(), layer.id())
+        for combo, current in (
+            (self.swd_sample_combo, current_sample),
+            (self.swd_background_combo, current_background),
+        ):
+            index = combo.findData(current)
+            if index >= 0:
+                combo.setCurrentIndex(index)
+
     def open_kigam_website(self):
         QDesktopServices.openUrl(
             QUrl("https://data.kigam.re.kr/search?subject=Geology"))
@@ -474,6 +757,27 @@ class MainDialog(QDialog):
             canvas.setExtent(target_layer.extent())
             canvas.refresh()
 
+    @contextlib.contextmanager
+    def _suspend_map_updates(self):
+        """
+        Freeze canvas rendering and layer-tree view repaints while a batch of
+        ZIPs is loaded; the map renders once when the block exits.
+        """
+        canvas = self.iface.mapCanvas() if self.iface else None
+        tree_view = self.iface.layerTreeView() if self.iface else None
+        if canvas is not None:
+            canvas.freeze(True)
+        if tree_view is not None:
+            tree_view.setUpdatesEnabled(False)
+        try:
+            yield
+        finally:
+            if tree_view is not None:
+                tree_view.setUpdatesEnabled(True)
+            if canvas is not None:
+                canvas.freeze(False)
+                canvas.refresh()
+
     def load_selected_zips(self):
         """
         Load one or multiple ZIP files without closing the dialog.
@@ -501,38 +805,86 @@ class MainDialog(QDialog):
         self.load_btn.setEnabled(False)
         self.browse_btn.setEnabled(False)
 
-        processor = ZipProcessor()
-        loaded_zip_count = 0
-        total_layer_count = 0
-        failed_paths = []
-        last_loaded_layers = None
-
         try:
-            for idx, zip_path in enumerate(zip_paths, start=1):
-                if not os.path.exists(zip_path):
-                    failed_paths.append(zip_path)
+            processor = ZipProcessor()
+            loaded_zip_count = 0
+            total_layer_count = 0
+            failed_paths = []
+            last_loaded_layers = None
+            sheet_layers = []
+
+            # Read every central directory first: sizes, duplicates, disk space.
+            plan = processor.plan_batch(zip_paths)
+            self.log(
+                f"Load plan: {len(plan.to_load)}/{len(plan.sheets)} ZIP(s), "
+                f"{plan.total_bytes / 1048576:.1f} MB uncompressed, "
+                f"{plan.extract_bytes / 1048576:.1f} MB to extract")
+            for sheet in plan.sheets:
+                if sheet.duplicate_of:
                     self.log(
-                        f"[{idx}/{len(zip_paths)}] Missing ZIP: {zip_path}")
-                    continue
-
-                self.log(f"[{idx}/{len(zip_paths)}] Loading ZIP: {zip_path}")
-                loaded_layers = processor.process_zip(
-                    zip_path,
-                    font_family=self.font_combo.currentFont().family(),
-                    font_size=self.size_spin.value()
-                )
-
-                if loaded_layers:
-                    loaded_zip_count += 1
-                    total_layer_count += len(loaded_layers)
-                    last_loaded_layers = loaded_layers
-                    self.log(f"  -> Loaded {len(loaded_layers)} layer(s)")
-                else:
-                    failed_paths.append(zip_path)
-                    self.log("  -> No layers loaded")
-
-            if last_loaded_layers:
-                self._zoom_to_loaded_layers(last_loaded_layers)
+                        f"  Skipping duplicate sheet: {sheet.zip_path} (same contents as {sheet.duplicate_of})")
+                elif sheet.refused:
+                    failed_paths.append(sheet.zip_path)
+                    self.log(f"  Refused: {sheet.zip_path} ({sheet.refused})")
+
+            to_load = plan.to_load
+            # KiB keeps the range inside the progress bar's int limits.
+            progress_total = max(1, sum(sheet.uncompressed_size for sheet in to_load) // 1024)
+            progress_done = 0
+            self.load_progress.setRange(0, progress_total)
+            self.load_progress.setValue(0)
+            self.load_progress.setVisible(bool(to_load))
+
+            with self._suspend_map_updates():
+                for idx, sheet in enumerate(to_load, start=1):
+                    zip_path = sheet.zip_path
+                    self.log(
+                        f"[{idx}/{len(to_load)}] Loading ZIP: {zip_path} "
+                        f"({len(sheet.shapefiles)} shapefile(s), {sheet.uncompressed_size / 1048576:.1f} MB)")
+                    QCoreApplication.processEvents()
+                    loaded_layers = processor.process_zip(
+                        zip_path,
+                        font_family=self.font_combo.currentFont().family(),
+                        font_size=self.size_spin.value()
+                    )
+                    progress_done += sheet.uncompressed_size // 1024
+                    self.load_progress.setValue(min(progress_done, progress_total))
+
+                    if loaded_layers:
+                        loaded_zip_count += 1
+                        total_layer_count += len(loaded_layers)
+                        last_loaded_layers = loaded_layers
+                        sheet_layers.append(
+                            (os.path.splitext(os.path.basename(zip_path))[0], loaded_layers))
+                        self.log(f"  -> Loaded {len(loaded_layers)} layer(s)")
+                    else:
+                        failed_paths.append(zip_path)
+                        self.log("  -> No layers loaded")
+
+                if self.mosaic_check.isChecked() and len(sheet_layers) > 1:
+                    self.log(f"Building mosaic from {len(sheet_layers)} sheet(s)...")
+                    mosaic_layers = processor.build_mosaic(
+                        sheet_layers,
+                        font_family=self.font_combo.currentFont().family(),
+                        font_size=self.size_spin.value()
+                    )
+                    if mosaic_layers:
+                        last_loaded_layers = mosaic_layers
+                        self.log(f"  -> Mosaic: {len(mosaic_layers)} theme layer(s)")
+                    else:
+                        self.log("  -> Mosaic failed, keeping per-sheet layers")
+
+                hits, misses, cache_size, _ = processor.candidate_cache_stats()
+                self.log(
+                    f"Symbol candidate-key cache: {hits} hit(s), {misses} miss(es), {cache_size} cached")
+                built, reused, _ = processor.symbol_factory_stats()
+                self.log(f"Raster symbols: {built} built, {reused} reused from cache")
+
+                if last_loaded_layers:
+                    self._zoom_to_loaded_layers(last_loaded_layers)
+                pending = processor.style_visible_layers()
+                if pending:
+                    self.log(f"Deferred styling: {pending} layer(s) will be styled when first shown")
 
             # Keep UI current for follow-up work in the same dialog.
             self.refresh_layer_list()
@@ -547,16 +899,10 @@ class MainDialog(QDialog):
                 QMessageBox.warning(
                     self, "Warning", "No layers were loaded. Check the log panel for details.")
         finally:
+            self.load_progress.setVisible(False)
             self.load_btn.setEnabled(True)
             self.browse_btn.setEnabled(True)
 
-    def _resolve_vector_export_field(self, layer):
-        fields = [f.name() for f in layer.fields()]
-        for candidate in VECTOR_EXPORT_FIELD_CANDIDATES:
-            if candidate in fields:
-                return candidate
-        return None
-
     def export_maxent_raster(self):
         """
         Rasterizes selected vector layers or exports selected raster layers for MaxEnt.
@@ -568,7 +914,13 @@ class MainDialog(QDialog):
             if item.checkState() == Qt.CheckState.Checked:
                 selected_layer_ids.append(item.data(Qt.ItemDataRole.UserRole))
 
-        if not selected_layer_ids:
+        distance_layer_ids = []
+        for i in range(self.distance_list.count()):
+            item = self.distance_list.item(i)
+            if item.checkState() == Qt.CheckState.Checked:
+                distance_layer_ids.append(item.data(Qt.ItemDataRole.UserRole))
+
+        if not selected_layer_ids and not distance_layer_ids:
             QMessageBox.warning(self, "오류", "내보낼 레이어를 하나 이상 선택해주세요.")
             return
 
@@ -578,6 +930,11 @@ class MainDialog(QDialog):
             for lid in selected_layer_ids
             if lid in all_layers
         ]
+        distance_layers = [
+            all_layers[lid]
+            for lid in distance_layer_ids
+            if lid in all_layers
+        ]
 
         # 2. Separate Vector and Raster
         vector_layers = [
@@ -591,113 +948,140 @@ class MainDialog(QDialog):
             if selected_layer.type() == 1
         ]
 
-        if not vector_layers and not raster_layers:
+        if not vector_layers and not raster_layers and not distance_layers:
             QMessageBox.warning(self, "오류", "유효한 레이어가 선택되지 않았습니다.")
             return
 
-        # 3. Get Save Path
-        save_path, _ = QFileDialog.getSaveFileName(
-            self,
-            "MaxEnt용 래스터 파일 저장",
-            "",
-            "GeoTIFF (*.tif);;ASCII Grids (*.asc)"
-        )
-        if not save_path:
+        # 3. Get Output Folder
+        out_dir = QFileDialog.getExistingDirectory(self, "MaxEnt용 변수 래스터 저장 폴더")
+        if not out_dir:
             return
 
         resolution = self.res_spin.value()
+        options = maxent_export.ExportOptions(
+            nodata=NODATA_VALUE,
+            data_type=GDAL_DATA_TYPE,
+            resampling=MAXENT_RESAMPLING,
+            multithreading=MAXENT_MULTITHREADING,
+            output_format=self.export_format_combo.currentData(),
+            common_mask=MAXENT_COMMON_MASK,
+            categorical=self.categorical_check.isChecked(),
+            asc_decimals=MAXENT_ASC_DECIMALS,
+            tiling=MAXENT_TILING,
+            memory_budget_mb=MAXENT_MEMORY_BUDGET_MB,
+            cache_dir=MAXENT_EXPORT_CACHE_DIR if MAXENT_EXPORT_CACHE else None,
+            cache_max_mb=MAXENT_EXPORT_CACHE_MAX_MB,
+            distance_max=MAXENT_DISTANCE_MAX,
+        )
 
         try:
-            target_layers = []
-
-            # A. Process Vector Layers (Merge if multiple, or use single)
-            if vector_layers:
-                if len(vector_layers) > 1:
-                    merge_params = {
-                        'LAYERS': vector_layers,
-                        'CRS': vector_layers[0].crs(),
-                        'OUTPUT': 'TEMPORARY_OUTPUT'
-                    }
-                    merged = processing.run(
-                        "native:mergevectorlayers", merge_params)['OUTPUT']
-                    export_field = self._resolve_vector_export_field(merged)
-                    if not export_field:
-                        raise ValueError(
-                            f"통합된 레이어에 사용 가능한 필드가 없습니다. 후보: {', '.join(VECTOR_EXPORT_FIELD_CANDIDATES)}")
-                    target_layers.append(('vector', merged, export_field))
-                else:
-                    export_field = self._resolve_vector_export_field(
-                        vector_layers[0])
-                    if not export_field:
-                        raise ValueError(
-                            f"'{vector_layers[0].name()}' 레이어에 사용 가능한 필드가 없습니다. 후보: {', '.join(VECTOR_EXPORT_FIELD_CANDIDATES)}")
-                    target_layers.append(
-                        ('vector', vector_layers[0], export_field))
-
-            # B. Process Raster Layers (GeoTIFF clipping/resampling to match if needed)
-            # For simplicity, we process each and the user might want them merged or separate.
-            # MaxEnt usually wants separate files in a folder or stacked.
-            # Here we follow the previous 'single output' pattern for geological maps.
-            # If user selected both, we might need to handle it.
-            # RATIONAL: If user selected MULTIPLE types, we should probably warn or handle merging.
-            # But the user said "변수로 생성", usually they are separate files.
-
-            # Implementation choice: if it's a single vector merge, we rasterize.
-            # if they selected rasters, we just export them (maybe resampled).
-
-            # Let's handle the VECTORS first as a single output.
-            if target_layers and target_layers[0][0] == 'vector':
-                v_layer = target_layers[0][1]
-                export_field = target_layers[0][2]
-                params = {
-                    'INPUT': v_layer,
-                    'FIELD': export_field,
-                    'UNITS': MAXENT_RASTERIZE_UNITS,
-                    'WIDTH': resolution,
-                    'HEIGHT': resolution,
-                    'EXTENT': v_layer.extent(),
-                    'NODATA': NODATA_VALUE,
-                    'DATA_TYPE': GDAL_DATA_TYPE,  # Float32 by default
-                    'OUTPUT': save_path
-                }
-                processing.run("gdal:rasterize", params)
-                QMessageBox.information(
-                    self, "성공", f"래스터 변환이 완료되었습니다:\n{save_path}")
+            variables = maxent_export.build_variables(
+                vector_layers, raster_layers, VECTOR_EXPORT_FIELD_CANDIDATES,
+                distance_layers=distance_layers,
+                distance_boundary=self.distance_boundary_check.isChecked())
+            grid_crs = (vector_layers or raster_layers or distance_layers)[0].crs()
+            grid = maxent_export.ReferenceGrid.from_layers(
+                vector_layers + raster_layers + distance_layers, grid_crs, resolution)
+            self.log(
+                f"기준 격자: {grid.width}x{grid.height}, {grid.resolution} m, "
+                f"원점 ({grid.x_min}, {grid.y_max}), {grid.crs.authid()}")
+
+            if not maxent_export.can_detach(variables):
+                # Memory layers cannot be reopened by a background task.
+                self.log("메모리 레이어가 포함되어 있어 내보내기를 현재 창에서 실행합니다.")
+                result = maxent_export.export_stack(
+                    grid, variables, out_dir, options, log=self.log)
+                self._on_maxent_export_finished(out_dir, result, None)
                 return
 
-            # C. If they selected Rasters
-            if raster_layers:
-                if len(raster_layers) > 1:
-                    self.log(
-                        f"[INFO] 래스터 {len(raster_layers)}개 선택됨. 첫 번째 레이어만 내보냅니다: {raster_layers[0].name()}")
-
-                r_layer = raster_layers[0]
-
-                extent = r_layer.extent()
-                extent_str = f"{extent.xMinimum()},{extent.xMaximum()},{extent.yMinimum()},{extent.yMaximum()}"
-                target_crs = r_layer.crs().authid() if r_layer.crs(
-                ) and r_layer.crs().isValid() else None
-                warp_params = {
-                    'INPUT': r_layer,
-                    'SOURCE_CRS': None,
-                    'TARGET_CRS': target_crs,
-                    'RESAMPLING': MAXENT_RESAMPLING,
-                    'NODATA': NODATA_VALUE,
-                    'TARGET_RESOLUTION': resolution,
-                    'OPTIONS': '',
-                    'DATA_TYPE': GDAL_DATA_TYPE,
-                    'TARGET_EXTENT': extent_str,
-                    'TARGET_EXTENT_CRS': target_crs,
-                    'MULTITHREADING': MAXENT_MULTITHREADING,
-                    'EXTRA': '',
-                    'OUTPUT': save_path
-                }
-                processing.run("gdal:warpreproject", warp_params)
-                QMessageBox.information(
-                    self, "성공", f"래스터 내보내기가 완료되었습니다:\n{save_path}")
-
+            task = maxent_export.MaxentExportTask(
+                grid, variables, out_dir, options,
+                on_finished=lambda result, error: self._on_maxent_export_finished(out_dir, result, error))
         except Exception as e:
             QMessageBox.critical(self, "오류", f"내보내기 중 오류가 발생했습니다:\n{str(e)}")
+            return
+
+        task.messageLogged.connect(self.log)
+        task.progressChanged.connect(lambda value: self.export_progress.setValue(int(value)))
+        self._export_task = task
+        self.export_btn.setEnabled(False)
+        self.export_progress.setValue(0)
+        self.export_progress.setVisible(True)
+        self.export_cancel_btn.setVisible(True)
+        self.export_cancel_btn.setEnabled(True)
+        QgsApplication.taskManager().addTask(task)
+        self.log("내보내기를 백그라운드 작업으로 시작했습니다.")
+
+    def cancel_maxent_export(self):
+        """Cancel the running background MaxEnt export."""
+        if self._export_task is not None:
+            self.export_cancel_btn.setEnabled(False)
+            self.log("내보내기 취소 요청...")
+            self._export_task.cancel()
+
+    def _on_maxent_export_finished(self, out_dir, result, error):
+        self._export_task = None
+        self.export_btn.setEnabled(True)
+        self.export_progress.setVisible(False)
+        self.export_cancel_btn.setVisible(False)
+        if error is not None:
+            QMessageBox.critical(self, "오류", f"내보내기 중 오류가 발생했습니다:\n{str(error)}")
+        elif result is None:
+            self.log("내보내기가 취소되었습니다.")
+        else:
+            self._last_export_dir = out_dir
+            QMessageBox.information(
+                self, "성공",
+                f"변수 {len(result.outputs)}개를 같은 격자로 내보냈습니다:\n{out_dir}")
+
+    def export_swd(self):
+        """
+        Sample every exported variable at the sample (and background)
+        points and write MaxEnt SWD CSVs into <variables folder>/swd.
+        """
+        project = QgsProject.instance()
+        sample_layer = project.mapLayer(self.swd_sample_combo.currentData() or "")
+        if sample_layer is None:
+            QMessageBox.warning(self, "오류", "출현 지점 레이어를 선택해주세요.")
+            return
+        background_id = self.swd_background_combo.currentData()
+        background_layer = project.mapLayer(background_id) if background_id else None
+
+        env_dir = QFileDialog.getExistingDirectory(
+            self, "MaxEnt 변수 래스터 폴더", self._last_export_dir)
+        if not env_dir:
+            return
+
+        try:
+            rasters = maxent_export.environment_layers(env_dir)
+            if not rasters:
+                QMessageBox.warning(self, "오류", "폴더에 .tif/.asc 변수 래스터가 없습니다.")
+                return
+            ds = gdal.Open(next(iter(rasters.values())))
+            grid_crs = QgsCoordinateReferenceSystem.fromWkt(ds.GetProjection()) if ds else sample_layer.crs()
+            ds = None
+            if not grid_crs.isValid():
+                grid_crs = sample_layer.crs()
+
+            swd_dir = os.path.join(env_dir, "swd")
+            os.makedirs(swd_dir, exist_ok=True)
+            self.log(f"SWD 추출: 변수 {len(rasters)}개 ({', '.join(rasters)})")
+            outputs = [("samples_swd.csv", sample_layer, None)]
+            if background_layer is not None:
+                outputs.append(("background_swd.csv", background_layer, "background"))
+            for file_name, layer, species in outputs:
+                points = maxent_export.collect_points(
+                    layer, grid_crs, species=species,
+                    species_field=None if species else (SWD_SPECIES_FIELD or None))
+                written, dropped = maxent_export.write_swd(
+                    os.path.join(swd_dir, file_name), rasters, [points],
+                    decimals=MAXENT_ASC_DECIMALS, drop_missing=SWD_DROP_MISSING)
+                self.log(
+                    f"  -> {file_name}: {written}개 지점 기록"
+                    + (f", 결측 {dropped}개 제외" if dropped else ""))
+            QMessageBox.information(self, "성공", f"SWD CSV를 저장했습니다:\n{swd_dir}")
+        except Exception as e:
+            QMessageBox.critical(self, "오류", f"SWD 추출 중 오류가 발생했습니다:\n{str(e)}")
 
     def run_geochem_analysis(self):
         """
@@ -950,7 +1334,8 @@ class MainDialog(QDialog):
         return {
             'zip_path': self.file_input.text(),
             'font_family': self.font_combo.currentFont().family(),
-            'font_size': self.size_spin.value()
+            'font_size': self.size_spin.value(),
+            'mosaic': self.mosaic_check.isChecked()
         }
 
 
@@ -975,6 +1360,9 @@ class KigamGeoDownloader:
         self.toolbar.addAction(self.action)
 
     def unload(self):
+        # Stop deferred styling before the module goes away
+        ZipProcessor.shutdown_lazy_styling()
+
         # Remove Menu
         self.iface.removePluginMenu("&KIGAM for Archaeology", self.action)
 
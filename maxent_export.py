@@ -0,0 +1,1512 @@
+# -*- coding: utf-8 -*-
+"""
+MaxEnt variable export for KIGAM for Archaeology
+
+Writes every selected vector and raster layer onto one reference grid
+(same CRS, origin, resolution and size), one file per variable, so the
+folder can be handed to MaxEnt as its environmental-layer directory.
+"""
+import csv
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsFeatureRequest,
+    QgsFeedback,
+    QgsGeometry,
+    QgsMessageLog,
+    QgsProject,
+    QgsRasterLayer,
+    QgsRectangle,
+    QgsSpatialIndex,
+    QgsTask,
+    QgsVectorLayer,
+    Qgis,
+    NULL,
+)
+from qgis.PyQt.QtCore import pyqtSignal
+
+from .zip_processor import _mosaic_role
+
+
+_UNSAFE_NAME_CHARS_RE = re.compile(r"[^0-9A-Za-z가-힣._-]+")
+
+# Index of the gdal:rasterize DATA_TYPE enum -> GDAL type. gdal:warpreproject
+# puts "Use input layer data type" first, so its indexes are one higher.
+_PROCESSING_DATA_TYPES = (
+    gdal.GDT_Byte,
+    gdal.GDT_Int16,
+    gdal.GDT_UInt16,
+    gdal.GDT_UInt32,
+    gdal.GDT_Int32,
+    gdal.GDT_Float32,
+    gdal.GDT_Float64,
+)
+_GTIFF_OPTIONS = ["TILED=YES", "COMPRESS=LZW", "BIGTIFF=IF_SAFER"]
+
+_INTEGER_DATA_TYPES = (
+    gdal.GDT_Byte,
+    gdal.GDT_Int16,
+    gdal.GDT_UInt16,
+    gdal.GDT_UInt32,
+    gdal.GDT_Int32,
+)
+# Index of the Processing RESAMPLING enum (gdal:warpreproject) -> gdalwarp name.
+_RESAMPLING_NAMES = (
+    "near", "bilinear", "cubic", "cubicspline", "lanczos", "average",
+    "mode", "max", "min", "med", "q1", "q3",
+)
+# GeoTIFF tile edge; export blocks are multiples of it.
+TILE_SIZE = 256
+# Cells formatted per chunk by write_asc.
+ASC_CHUNK_CELLS = 1 << 20
+
+# Bump when rasterization output changes so cached results are not reused.
+EXPORT_CACHE_VERSION = 2
+# Files next to a source that change its features or values without touching the main file.
+_SOURCE_SIDECAR_SUFFIXES = (".dbf", ".shx", ".cpg", ".prj")
+_SOURCE_APPENDED_SUFFIXES = ("-wal", ".aux.xml")
+
+# Categorical rasters reserve 0 for NoData; codes start at 1.
+CATEGORY_NODATA = 0
+
+
+@dataclass(frozen=True)
+class ReferenceGrid:
+    """North-up grid shared by every exported variable."""
+    crs: QgsCoordinateReferenceSystem
+    x_min: float
+    y_max: float
+    resolution: float
+    width: int
+    height: int
+
+    @property
+    def x_max(self) -> float:
+        return self.x_min + self.width * self.resolution
+
+    @property
+    def y_min(self) -> float:
+        return self.y_max - self.height * self.resolution
+
+    @property
+    def geotransform(self):
+        return (self.x_min, self.resolution, 0.0, self.y_max, 0.0, -self.resolution)
+
+    @property
+    def extent(self) -> QgsRectangle:
+        return QgsRectangle(self.x_min, self.y_min, self.x_max, self.y_max)
+
+    def block_extent(self, block: "GridBlock") -> QgsRectangle:
+        x_min = self.x_min + block.x_off * self.resolution
+        y_max = self.y_max - block.y_off * self.resolution
+        return QgsRectangle(
+            x_min, y_max - block.height * self.resolution,
+            x_min + block.width * self.resolution, y_max)
+
+    def block_geotransform(self, block: "GridBlock"):
+        return (
+            self.x_min + block.x_off * self.resolution, self.resolution, 0.0,
+            self.y_max - block.y_off * self.resolution, 0.0, -self.resolution)
+
+    def blocks(self, block_size: int) -> List["GridBlock"]:
+        """Row-major square blocks of *block_size* cells, clipped at the grid edge."""
+        block_size = max(1, int(block_size))
+        return [
+            GridBlock(x_off, y_off, min(block_size, self.width - x_off), min(block_size, self.height - y_off))
+            for y_off in range(0, self.height, block_size)
+            for x_off in range(0, self.width, block_size)
+        ]
+
+    def extent_string(self) -> str:
+        """Extent in the 'xmin,xmax,ymin,ymax [CRS]' form Processing expects."""
+        return f"{self.x_min},{self.x_max},{self.y_min},{self.y_max} [{self.crs.authid()}]"
+
+    @classmethod
+    def from_layers(cls, layers, crs: QgsCoordinateReferenceSystem, resolution: float) -> "ReferenceGrid":
+        """
+        Union of the layer extents in *crs*, with the origin snapped to a
+        multiple of *resolution* so grids built from different selections
+        still line up cell for cell.
+        """
+        resolution = float(resolution)
+        if resolution <= 0:
+            raise ValueError("resolution must be positive")
+
+        union = QgsRectangle()
+        union.setMinimal()
+        for layer in layers:
+            extent = layer.extent()
+            if layer.crs().isValid() and crs.isValid() and layer.crs() != crs:
+                transform = QgsCoordinateTransform(layer.crs(), crs, QgsProject.instance())
+                extent = transform.transformBoundingBox(extent)
+            union.combineExtentWith(extent)
+        if union.xMinimum() > union.xMaximum() or union.yMinimum() > union.yMaximum():
+            raise ValueError("selected layers have no extent")
+
+        x_min = math.floor(union.xMinimum() / resolution) * resolution
+        y_max = math.ceil(union.yMaximum() / resolution) * resolution
+        width = max(1, int(math.ceil((union.xMaximum() - x_min) / resolution)))
+        height = max(1, int(math.ceil((y_max - union.yMinimum()) / resolution)))
+        return cls(crs, x_min, y_max, resolution, width, height)
+
+
+@dataclass(frozen=True)
+class GridBlock:
+    x_off: int
+    y_off: int
+    width: int
+    height: int
+
+
+@dataclass
+class ExportVariable:
+    """One MaxEnt variable: a raster layer, or same-theme vector layers of several sheets."""
+    name: str
+    kind: str  # "vector" | "raster" | "distance"
+    layers: list
+    field: Optional[str] = None
+    # Category text -> integer code, for categorical vector variables.
+    categories: Optional[Dict[str, int]] = None
+    # Distance variables: measure to polygon boundaries instead of polygon areas.
+    boundary: bool = False
+
+
+@dataclass
+class ExportOptions:
+    nodata: float = -9999.0
+    data_type: int = 5  # Processing enum: Float32
+    resampling: int = 0  # Processing enum: nearest
+    multithreading: bool = False
+    output_format: str = "tif"  # "tif" | "asc"
+    common_mask: bool = True
+    burn_chunk_size: int = 5000  # features held in memory per RasterizeLayer call
+    categorical: bool = False  # burn vector fields as integer category codes
+    asc_decimals: int = 4  # decimal places of float cells in .asc output
+    tiling: str = "auto"  # "auto" | "always" | "never"
+    memory_budget_mb: int = 512  # decides the block size of tiled exports
+    cache_dir: Optional[str] = None  # per-variable result cache; None disables it
+    cache_max_mb: int = 2048  # 0 keeps every entry
+    distance_max: float = 0.0  # cap of distance variables in map units; 0 = uncapped
+
+
+@dataclass
+class ExportResult:
+    grid: ReferenceGrid
+    outputs: Dict[str, str] = field(default_factory=dict)
+    # Variable name -> category CSV, for categorical variables.
+    category_tables: Dict[str, str] = field(default_factory=dict)
+
+
+class ExportCanceled(Exception):
+    """Raised inside export_stack when its feedback has been canceled."""
+
+
+class _ExportProgress:
+    """
+    Maps variable/block steps of export_stack onto a 0-100 feedback
+    progress and raises ExportCanceled at every step once canceled.
+    """
+
+    def __init__(self, feedback: Optional[QgsFeedback], steps: int, log: Callable[[str], None]):
+        self.feedback = feedback
+        self.steps = max(1, steps)
+        self.log = log
+        self.done = 0
+        self._reported = -1
+
+    def check(self):
+        if self.feedback is not None and self.feedback.isCanceled():
+            raise ExportCanceled()
+
+    def start_step(self):
+        self.check()
+        self._reported = -1
+        self._set(0.0)
+
+    def finish_step(self):
+        self.done += 1
+        self._set(0.0)
+
+    def block(self, done: int, total: int):
+        """Called after each block; logs at most every 10% of the blocks."""
+        self._set(done / max(1, total))
+        if total > 1:
+            decile = done * 10 // total
+            if decile != self._reported:
+                self._reported = decile
+                self.log(f"  -> 블록 {done}/{total}")
+        self.check()
+
+    def _set(self, fraction: float):
+        if self.feedback is not None:
+            self.feedback.setProgress(100.0 * min(self.steps, self.done + fraction) / self.steps)
+
+
+def _safe_name(text: str) -> str:
+    return _UNSAFE_NAME_CHARS_RE.sub("_", text).strip("_") or "variable"
+
+
+def build_variables(
+    vector_layers, raster_layers, field_candidates: Sequence[str], distance_layers=(), distance_boundary=False
+) -> List[ExportVariable]:
+    """
+    Group vector layers by theme (layer name without the map-index prefix,
+    plus geometry type) so the same theme from several sheets becomes one
+    variable; every raster layer is its own variable. The burn field of a
+    vector theme is the first candidate present in any of its layers.
+    *distance_layers* are grouped the same way into "dist_<theme>"
+    variables (distance to lines, or to polygons / their boundaries).
+    """
+    variables = []
+    used_names = set()
+
+    def unique(name):
+        base = _safe_name(name)
+        candidate = base
+        suffix = 2
+        while candidate.lower() in used_names:
+            candidate = f"{base}_{suffix}"
+            suffix += 1
+        used_names.add(candidate.lower())
+        return candidate
+
+    themes = {}
+    for layer in vector_layers:
+        themes.setdefault(_mosaic_role(layer), []).append(layer)
+    for (role_name, _geometry_type), layers in themes.items():
+        field_names = set()
+        for layer in layers:
+            field_names.update(f.name() for f in layer.fields())
+        export_field = next((c for c in field_candidates if c in field_names), None)
+        if not export_field:
+            raise ValueError(
+                f"'{layers[0].name()}' 레이어에 사용 가능한 필드가 없습니다. 후보: {', '.join(field_candidates)}")
+        variables.append(ExportVariable(unique(role_name), "vector", layers, export_field))
+
+    for layer in raster_layers:
+        variables.append(ExportVariable(unique(layer.name()), "raster", [layer]))
+
+    distance_themes = {}
+    for layer in distance_layers:
+        distance_themes.setdefault(_mosaic_role(layer), []).append(layer)
+    for (role_name, geometry_type), layers in distance_themes.items():
+        boundary = bool(distance_boundary and geometry_type == 2)  # Polygon
+        prefix = "dist_contact_" if boundary else "dist_"
+        variables.append(ExportVariable(unique(prefix + role_name), "distance", layers, boundary=boundary))
+    return variables
+
+
+@dataclass(frozen=True)
+class _LayerSource:
+    """Data source of a layer, captured on the GUI thread so a task can reopen it."""
+    name: str
+    vector: bool
+    source: str
+    provider: str
+    subset: str
+    crs: QgsCoordinateReferenceSystem
+    encoding: str = ""  # vector provider encoding, e.g. CP949 for sheet shapefiles
+
+
+def can_detach(variables: Sequence[ExportVariable]) -> bool:
+    """True when every layer can be reopened from its source by a background task."""
+    return all(
+        layer.providerType() != "memory"
+        for variable in variables
+        for layer in variable.layers
+    )
+
+
+def detach_variables(variables: Sequence[ExportVariable]) -> List[ExportVariable]:
+    """
+    Copies of *variables* holding the data sources of their layers instead
+    of the project layers. Call on the GUI thread; open_detached reopens
+    them in the task, so removing a layer from the project meanwhile does
+    not affect the export.
+    """
+    detached = []
+    for variable in variables:
+        sources = []
+        for layer in variable.layers:
+            if layer.providerType() == "memory":
+                raise RuntimeError(f"{layer.name()}: 백그라운드에서 레이어를 열 수 없습니다.")
+            sources.append(_LayerSource(
+                layer.name(),
+                layer.type() == 0,
+                layer.source(),
+                layer.providerType(),
+                layer.subsetString() if layer.type() == 0 else "",
+                QgsCoordinateReferenceSystem(layer.crs()),
+                layer.dataProvider().encoding() if layer.type() == 0 and layer.dataProvider() else "",
+            ))
+        detached.append(replace(variable, layers=sources))
+    return detached
+
+
+def open_detached(variables: Sequence[ExportVariable]) -> List[ExportVariable]:
+    """Variables from detach_variables with their layers opened in the calling thread."""
+    opened = []
+    for variable in variables:
+        layers = []
+        for source in variable.layers:
+            if source.vector:
+                layer = QgsVectorLayer(source.source, source.name, source.provider)
+                if layer.isValid() and source.encoding:
+                    layer.setProviderEncoding(source.encoding)
+                if layer.isValid() and source.subset:
+                    layer.setSubsetString(source.subset)
+            else:
+                layer = QgsRasterLayer(source.source, source.name, source.provider)
+            if not layer.isValid():
+                raise RuntimeError(f"{source.name}: 백그라운드에서 레이어를 열 수 없습니다.")
+            if source.crs.isValid():
+                layer.setCrs(source.crs)
+            layers.append(layer)
+        opened.append(replace(variable, layers=layers))
+    return opened
+
+
+def _warpreproject_data_type(processing_index: int) -> int:
+    """gdal:warpreproject DATA_TYPE index of the same GDAL type as a gdal:rasterize index."""
+    return _PROCESSING_DATA_TYPES.index(gdal_data_type(processing_index)) + 1
+
+
+def gdal_data_type(processing_index: int) -> int:
+    """GDAL data type for a Processing DATA_TYPE index (Float32 when unknown)."""
+    if 0 <= int(processing_index) < len(_PROCESSING_DATA_TYPES):
+        return _PROCESSING_DATA_TYPES[int(processing_index)]
+    return gdal.GDT_Float32
+
+
+def _create_target(path: str, grid: ReferenceGrid, data_type: int, nodata: float, fill: bool = True):
+    """Tiled GeoTIFF on *grid*, pre-filled with NoData unless every block will be written."""
+    ds = gdal.GetDriverByName("GTiff").Create(
+        path, grid.width, grid.height, 1, data_type, options=_GTIFF_OPTIONS)
+    if ds is None:
+        raise RuntimeError(f"출력 파일을 만들 수 없습니다: {path}")
+    ds.SetGeoTransform(grid.geotransform)
+    ds.SetProjection(grid.crs.toWkt())
+    band = ds.GetRasterBand(1)
+    band.SetNoDataValue(nodata)
+    if fill:
+        band.Fill(nodata)
+    return ds
+
+
+def _create_block(grid: ReferenceGrid, block: GridBlock, data_type: int, nodata: float):
+    ds = gdal.GetDriverByName("MEM").Create("", block.width, block.height, 1, data_type)
+    ds.SetGeoTransform(grid.block_geotransform(block))
+    ds.SetProjection(grid.crs.toWkt())
+    band = ds.GetRasterBand(1)
+    band.SetNoDataValue(nodata)
+    band.Fill(nodata)
+    return ds
+
+
+# distance_transform holds about 48 bytes per window cell (float64/int work
+# arrays plus the mask); block_size_for_budget counts a block four times over.
+_DISTANCE_BYTES_PER_CELL = 12
+
+
+def block_size_for_budget(memory_budget_mb: int, bytes_per_cell: int = 8) -> int:
+    """
+    Edge of a square export block that fits *memory_budget_mb*. A block is
+    held about four times over (burn target, read copy, mask, write copy).
+    Rounded down to a multiple of TILE_SIZE, never below it.
+    """
+    cells = max(1, int(memory_budget_mb)) * 1024 * 1024 // (bytes_per_cell * 4)
+    return max(TILE_SIZE, int(math.sqrt(cells)) // TILE_SIZE * TILE_SIZE)
+
+
+def use_tiling(grid: ReferenceGrid, options: "ExportOptions", bytes_per_cell: int = 8) -> bool:
+    """
+    Whether to export block by block: forced by options.tiling, or in auto
+    mode when the whole grid at *bytes_per_cell* exceeds memory_budget_mb.
+    """
+    mode = str(options.tiling).lower()
+    if mode == "always":
+        return True
+    if mode == "never":
+        return False
+    return grid.width * grid.height * bytes_per_cell > max(1, int(options.memory_budget_mb)) * 1024 * 1024
+
+
+def _category_key(value) -> Optional[str]:
+    if value is None or value == NULL:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def build_category_codes(variable: ExportVariable) -> Dict[str, int]:
+    """
+    One string -> integer dictionary for all layers (sheets) of *variable*.
+    Codes follow the sorted category text, so the same set of units always
+    gets the same codes regardless of sheet order. NULL/blank stay NoData.
+    """
+    keys = set()
+    for layer in variable.layers:
+        field_idx = layer.fields().indexOf(variable.field)
+        if field_idx < 0:
+            continue
+        for value in layer.uniqueValues(field_idx):
+            key = _category_key(value)
+            if key is not None:
+                keys.add(key)
+    return {key: code for code, key in enumerate(sorted(keys), start=1)}
+
+
+def _category_data_type(category_count: int) -> int:
+    if category_count <= 255:
+        return gdal.GDT_Byte
+    if category_count <= 65535:
+        return gdal.GDT_UInt16
+    raise ValueError(f"범주가 너무 많습니다 ({category_count}개, 최대 65535)")
+
+
+def _write_category_table(path: str, categories: Dict[str, int], csv_path: str):
+    """Attach a GDAL raster attribute table to *path* and write the CSV sidecar."""
+    rat = gdal.RasterAttributeTable()
+    rat.CreateColumn("Value", gdal.GFT_Integer, gdal.GFU_MinMax)
+    rat.CreateColumn("Name", gdal.GFT_String, gdal.GFU_Name)
+    rows = sorted(categories.items(), key=lambda item: item[1])
+    rat.SetRowCount(len(rows))
+    for row, (name, code) in enumerate(rows):
+        rat.SetValueAsInt(row, 0, code)
+        rat.SetValueAsString(row, 1, name)
+    ds = gdal.Open(path, gdal.GA_Update)
+    ds.GetRasterBand(1).SetDefaultRAT(rat)
+    ds = None
+
+    # utf-8-sig so Korean unit names open correctly in Excel.
+    with open(csv_path, "w", encoding="utf-8-sig", newline="") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["code", "value"])
+        for name, code in rows:
+            writer.writerow([code, name])
+
+
+def _numeric_burn_value(value) -> float:
+    # Same as gdal_rasterize ATTRIBUTE=: NULL and non-numeric text burn 0.
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _grid_transform(layer, grid: ReferenceGrid):
+    if layer.crs().isValid() and grid.crs.isValid() and layer.crs() != grid.crs:
+        return QgsCoordinateTransform(layer.crs(), grid.crs, QgsProject.instance())
+    return None
+
+
+def _feature_chunks(layer, field_idx: int, transform, request: QgsFeatureRequest, chunk_size: int):
+    """
+    Stream (WKB in grid CRS, attribute value) pairs for *request* from the
+    layer's provider in chunks of at most *chunk_size* features. With a
+    negative *field_idx* no attributes are fetched and the value is None.
+    """
+    if field_idx >= 0:
+        request.setSubsetOfAttributes([field_idx])
+    else:
+        request.setNoAttributes()
+    chunk = []
+    for feature in layer.getFeatures(request):
+        geometry = feature.geometry()
+        if geometry is None or geometry.isEmpty():
+            continue
+        if transform is not None:
+            geometry = QgsGeometry(geometry)
+            geometry.transform(transform)
+        chunk.append((bytes(geometry.asWkb()), feature.attribute(field_idx) if field_idx >= 0 else None))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _LayerBlockIndex:
+    """Bounding-box index of one source layer, queried per export block."""
+
+    def __init__(self, layer, field_idx: int, grid: ReferenceGrid):
+        self.layer = layer
+        self.field_idx = field_idx
+        self.transform = _grid_transform(layer, grid)
+        request = QgsFeatureRequest()
+        request.setNoAttributes()
+        self.index = QgsSpatialIndex(layer.getFeatures(request))
+
+    def chunks(self, rect: QgsRectangle, chunk_size: int):
+        if self.transform is not None:
+            rect = self.transform.transformBoundingBox(rect, Qgis.TransformDirection.Reverse)
+        fids = self.index.intersects(rect)
+        if not fids:
+            return iter(())
+        request = QgsFeatureRequest()
+        request.setFilterFids(fids)
+        return _feature_chunks(self.layer, self.field_idx, self.transform, request, chunk_size)
+
+
+def _burn_chunks(ds, chunks, srs, burn_value: Callable, boundary: bool = False) -> int:
+    """
+    Burn feature chunks into band 1 of *ds* through a reusable OGR memory
+    layer. With *boundary*, polygons are burned as their outlines.
+    """
+    driver = ogr.GetDriverByName("Memory") or ogr.GetDriverByName("MEM")
+    mem_ds = driver.CreateDataSource("")
+    burned = 0
+    for chunk in chunks:
+        mem_layer = mem_ds.CreateLayer("burn", srs, ogr.wkbUnknown)
+        mem_layer.CreateField(ogr.FieldDefn("burn", ogr.OFTReal))
+        definition = mem_layer.GetLayerDefn()
+        for wkb, value in chunk:
+            geometry = ogr.CreateGeometryFromWkb(wkb)
+            if geometry is None:
+                continue
+            if boundary and geometry.GetDimension() == 2:
+                geometry = geometry.Boundary()
+            value = burn_value(value)
+            if value is None:
+                continue
+            ogr_feature = ogr.Feature(definition)
+            ogr_feature.SetGeometryDirectly(geometry)
+            ogr_feature.SetField(0, value)
+            mem_layer.CreateFeature(ogr_feature)
+            burned += 1
+        gdal.RasterizeLayer(ds, [1], mem_layer, options=["ATTRIBUTE=burn"])
+        mem_ds.DeleteLayer(0)
+    mem_ds = None
+    return burned
+
+
+def _burn_settings(variable: ExportVariable, options: ExportOptions):
+    """(GDAL data type, NoData, burn-value function) for a vector variable."""
+    if variable.categories is not None:
+        codes = variable.categories
+
+        def burn_value(value):
+            return codes.get(_category_key(value))
+        return _category_data_type(len(codes)), CATEGORY_NODATA, burn_value
+    return gdal_data_type(options.data_type), options.nodata, _numeric_burn_value
+
+
+def _rasterize_vector(
+    variable: ExportVariable, grid: ReferenceGrid, options: ExportOptions, path: str,
+    progress: Optional[_ExportProgress] = None
+):
+    """
+    Burn every layer of *variable* straight into one target band. Features
+    are streamed from each provider in chunks, so memory use is bounded by
+    burn_chunk_size rather than by the total feature count. Categorical
+    variables burn their category codes into a Byte/UInt16 band.
+    """
+    data_type, nodata, burn_value = _burn_settings(variable, options)
+    ds = _create_target(path, grid, data_type, nodata)
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(grid.crs.toWkt())
+    chunk_size = max(1, int(options.burn_chunk_size))
+    burned = 0
+    try:
+        for position, layer in enumerate(variable.layers, start=1):
+            field_idx = layer.fields().indexOf(variable.field)
+            if field_idx >= 0:
+                chunks = _feature_chunks(
+                    layer, field_idx, _grid_transform(layer, grid), QgsFeatureRequest(), chunk_size)
+                burned += _burn_chunks(ds, chunks, srs, burn_value)
+            if progress is not None:
+                progress.block(position, len(variable.layers))
+        ds.FlushCache()
+    finally:
+        ds = None
+    return burned
+
+
+def _rasterize_vector_tiled(
+    variable: ExportVariable, grid: ReferenceGrid, options: ExportOptions, path: str, blocks: Sequence[GridBlock],
+    progress: Optional[_ExportProgress] = None
+):
+    """
+    Tiled variant of _rasterize_vector: each block is burned in memory with
+    only the features whose bounding box intersects it (looked up in a
+    per-layer spatial index) and then written into the tiled GeoTIFF.
+    """
+    data_type, nodata, burn_value = _burn_settings(variable, options)
+    ds = _create_target(path, grid, data_type, nodata, fill=False)
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(grid.crs.toWkt())
+    chunk_size = max(1, int(options.burn_chunk_size))
+    indexes = []
+    for layer in variable.layers:
+        field_idx = layer.fields().indexOf(variable.field)
+        if field_idx >= 0:
+            indexes.append(_LayerBlockIndex(layer, field_idx, grid))
+
+    burned = 0
+    try:
+        band = ds.GetRasterBand(1)
+        for position, block in enumerate(blocks, start=1):
+            rect = grid.block_extent(block)
+            block_ds = _create_block(grid, block, data_type, nodata)
+            for index in indexes:
+                burned += _burn_chunks(block_ds, index.chunks(rect, chunk_size), srs, burn_value)
+            band.WriteArray(block_ds.GetRasterBand(1).ReadAsArray(), block.x_off, block.y_off)
+            block_ds = None
+            if progress is not None:
+                progress.block(position, len(blocks))
+        ds.FlushCache()
+    finally:
+        ds = None
+    return burned
+
+
+def _warp_raster(
+    variable: ExportVariable, grid: ReferenceGrid, options: ExportOptions, path: str,
+    progress: Optional[_ExportProgress] = None
+):
+    import processing
+
+    feedback = progress.feedback if progress is not None else None
+    processing.run("gdal:warpreproject", {
+        'INPUT': variable.layers[0],
+        'SOURCE_CRS': None,
+        'TARGET_CRS': grid.crs,
+        'RESAMPLING': options.resampling,
+        'NODATA': options.nodata,
+        'TARGET_RESOLUTION': grid.resolution,
+        'OPTIONS': 'COMPRESS=LZW|TILED=YES',
+        'DATA_TYPE': _warpreproject_data_type(options.data_type),
+        'TARGET_EXTENT': grid.extent_string(),
+        'TARGET_EXTENT_CRS': grid.crs,
+        'MULTITHREADING': options.multithreading,
+        'EXTRA': '',
+        'OUTPUT': path
+    }, feedback=feedback)
+    if progress is not None:
+        progress.block(1, 1)
+
+
+def _warp_raster_tiled(
+    variable: ExportVariable, grid: ReferenceGrid, options: ExportOptions, path: str, blocks: Sequence[GridBlock],
+    progress: Optional[_ExportProgress] = None
+) -> bool:
+    """
+    Warp a GDAL-readable raster onto *grid* one block at a time. Returns
+    False (nothing written) for providers GDAL cannot open directly.
+    """
+    layer = variable.layers[0]
+    if layer.providerType() != "gdal":
+        return False
+
+    data_type = gdal_data_type(options.data_type)
+    resampling = (
+        _RESAMPLING_NAMES[options.resampling]
+        if 0 <= int(options.resampling) < len(_RESAMPLING_NAMES) else "near"
+    )
+    wkt = grid.crs.toWkt()
+    ds = _create_target(path, grid, data_type, options.nodata, fill=False)
+    try:
+        band = ds.GetRasterBand(1)
+        for position, block in enumerate(blocks, start=1):
+            rect = grid.block_extent(block)
+            block_ds = gdal.Warp(
+                "", layer.source(),
+                format="MEM",
+                outputBounds=(rect.xMinimum(), rect.yMinimum(), rect.xMaximum(), rect.yMaximum()),
+                width=block.width,
+                height=block.height,
+                dstSRS=wkt,
+                resampleAlg=resampling,
+                dstNodata=options.nodata,
+                outputType=data_type,
+                multithread=options.multithreading,
+            )
+            if block_ds is None:
+                raise RuntimeError(f"{layer.name()}: 블록 변환 실패 ({block.x_off}, {block.y_off})")
+            band.WriteArray(block_ds.GetRasterBand(1).ReadAsArray(), block.x_off, block.y_off)
+            block_ds = None
+            if progress is not None:
+                progress.block(position, len(blocks))
+        ds.FlushCache()
+    finally:
+        ds = None
+    return True
+
+
+def distance_transform(mask: np.ndarray) -> np.ndarray:
+    """
+    Exact Euclidean distance, in cells, from every cell to the nearest True
+    cell of *mask*, in linear time with the separable algorithm of Meijster
+    et al. (lower envelope of parabolas as in Felzenszwalb & Huttenlocher).
+    The column pass is vectorized across columns and the row pass across
+    rows, so Python only loops over one axis at a time. Cells with no True
+    cell in the array get inf.
+    """
+    height, width = mask.shape
+    # Larger than any distance inside the array; keeps the envelope arithmetic finite.
+    far = float(height + width)
+
+    # Vertical distance to the nearest True cell in the same column.
+    g = np.empty((height, width), dtype=np.float64)
+    g[0] = np.where(mask[0], 0.0, far)
+    for y in range(1, height):
+        g[y] = np.where(mask[y], 0.0, g[y - 1] + 1.0)
+    for y in range(height - 2, -1, -1):
+        np.minimum(g[y], g[y + 1] + 1.0, out=g[y])
+    np.minimum(g, far, out=g)
+    f = g * g
+
+    # Per row: lower envelope of the parabolas (x - q)^2 + f[q].
+    rows = np.arange(height)
+    v = np.zeros((height, width), dtype=np.int64)
+    z = np.empty((height, width + 1), dtype=np.float64)
+    z[:, 0] = -np.inf
+    z[:, 1] = np.inf
+    k = np.zeros(height, dtype=np.int64)
+    for q in range(1, width):
+        fq = f[:, q] + q * q
+        while True:
+            vk = v[rows, k]
+            s = (fq - (f[rows, vk] + vk * vk)) / (2.0 * (q - vk))
+            pop = s <= z[rows, k]
+            if not pop.any():
+                break
+            k[pop] -= 1
+        k += 1
+        v[rows, k] = q
+        z[rows, k] = s
+        z[rows, k + 1] = np.inf
+
+    d = np.empty((height, width), dtype=np.float64)
+    k[:] = 0
+    for q in range(width):
+        while True:
+            advance = z[rows, k + 1] < q
+            if not advance.any():
+                break
+            k[advance] += 1
+        vk = v[rows, k]
+        d[:, q] = (q - vk) ** 2 + f[rows, vk]
+
+    d = np.sqrt(d)
+    d[d >= far] = np.inf
+    return d
+
+
+def _presence(_value):
+    return 1
+
+
+def _distance_window(grid: ReferenceGrid, options: ExportOptions, tiled: bool) -> Tuple[int, int, Optional[float]]:
+    """
+    Window edge and halo in cells of the tiled distance transform, and the
+    effective distance cap in map units (None when untiled and uncapped).
+    """
+    cap = float(options.distance_max) if options.distance_max and options.distance_max > 0 else None
+    if not tiled:
+        return 0, 0, cap
+    # The halo takes at most half of the window edge.
+    window_edge = block_size_for_budget(options.memory_budget_mb, bytes_per_cell=_DISTANCE_BYTES_PER_CELL)
+    halo = window_edge // 4
+    if cap:
+        halo = min(halo, math.ceil(cap / grid.resolution))
+    cap = min(cap, halo * grid.resolution) if cap else halo * grid.resolution
+    return window_edge, halo, cap
+
+
+def _distance_raster(
+    variable: ExportVariable, grid: ReferenceGrid, options: ExportOptions, path: str, tiled: bool,
+    blocks: Sequence[GridBlock], progress: Optional[_ExportProgress] = None
+) -> int:
+    """
+    Distance in map units from every cell to the nearest feature of
+    *variable*: the features (or polygon outlines) are burned into a
+    presence mask on the grid and measured with distance_transform.
+    Tiled exports use their own blocks sized for the transform and burn
+    each with a halo of distance_max cells (a quarter of the window when
+    uncapped or larger), so values are exact up to the halo and capped
+    there. Returns the number of features burned.
+    """
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(grid.crs.toWkt())
+    chunk_size = max(1, int(options.burn_chunk_size))
+    window_edge, halo, cap = _distance_window(grid, options, tiled)
+
+    if tiled:
+        blocks = grid.blocks(max(TILE_SIZE, (window_edge - 2 * halo) // TILE_SIZE * TILE_SIZE))
+        indexes = [_LayerBlockIndex(layer, -1, grid) for layer in variable.layers]
+    else:
+        blocks = [GridBlock(0, 0, grid.width, grid.height)]
+
+    ds = _create_target(path, grid, gdal.GDT_Float32, options.nodata, fill=False)
+    burned = 0
+    try:
+        band = ds.GetRasterBand(1)
+        for position, block in enumerate(blocks, start=1):
+            x_off = max(0, block.x_off - halo)
+            y_off = max(0, block.y_off - halo)
+            window = GridBlock(
+                x_off, y_off,
+                min(grid.width, block.x_off + block.width + halo) - x_off,
+                min(grid.height, block.y_off + block.height + halo) - y_off,
+            )
+            mask_ds = _create_block(grid, window, gdal.GDT_Byte, 0)
+            if tiled:
+                rect = grid.block_extent(window)
+                for index in indexes:
+                    burned += _burn_chunks(
+                        mask_ds, index.chunks(rect, chunk_size), srs, _presence, variable.boundary)
+            else:
+                for layer in variable.layers:
+                    chunks = _feature_chunks(
+                        layer, -1, _grid_transform(layer, grid), QgsFeatureRequest(), chunk_size)
+                    burned += _burn_chunks(mask_ds, chunks, srs, _presence, variable.boundary)
+            mask = mask_ds.GetRasterBand(1).ReadAsArray() != 0
+            mask_ds = None
+
+            distance = distance_transform(mask)[
+                block.y_off - window.y_off:block.y_off - window.y_off + block.height,
+                block.x_off - window.x_off:block.x_off - window.x_off + block.width,
+            ] * grid.resolution
+            if cap is not None:
+                np.minimum(distance, cap, out=distance)
+            distance[~np.isfinite(distance)] = options.nodata
+            band.WriteArray(distance.astype(np.float32), block.x_off, block.y_off)
+            if progress is not None:
+                progress.block(position, len(blocks))
+        ds.FlushCache()
+    finally:
+        ds = None
+    return burned
+
+
+def _apply_common_mask(
+    vector_paths: Sequence[str], paths: Sequence[str], blocks: Sequence[GridBlock],
+    progress: Optional[_ExportProgress] = None
+):
+    """
+    Set every cell outside the union of the *vector_paths* coverage to
+    NoData in all *paths*, one block at a time. Returns (valid, total) cells.
+    """
+    datasets = {path: gdal.Open(path, gdal.GA_Update) for path in paths}
+    bands = {path: ds.GetRasterBand(1) for path, ds in datasets.items()}
+    valid = total = 0
+    try:
+        for position, block in enumerate(blocks, start=1):
+            window = (block.x_off, block.y_off, block.width, block.height)
+            mask = np.zeros((block.height, block.width), dtype=bool)
+            for path in vector_paths:
+                band = bands[path]
+                mask |= band.ReadAsArray(*window) != band.GetNoDataValue()
+            for band in bands.values():
+                arr = band.ReadAsArray(*window)
+                arr[~mask] = band.GetNoDataValue()
+                band.WriteArray(arr, block.x_off, block.y_off)
+            valid += int(mask.sum())
+            total += mask.size
+            if progress is not None:
+                progress.block(position, len(blocks))
+        for band in bands.values():
+            band.FlushCache()
+    finally:
+        bands = None
+        datasets = None
+    return valid, total
+
+
+def _format_number(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def write_asc(src_path: str, asc_path: str, decimals: int = 4, integer: Optional[bool] = None) -> str:
+    """
+    Write band 1 of *src_path* as an ESRI ASCII Grid with the same header
+    semantics as GDAL's AAIGrid driver (lower-left corner, square cells,
+    NODATA_value) plus a .prj. Rows are read and formatted in chunks of
+    about ASC_CHUNK_CELLS cells with a single %-format call per chunk.
+    Float cells get *decimals* places; integer bands (or integer=True) are
+    written without decimals.
+    """
+    ds = gdal.Open(src_path)
+    if ds is None:
+        raise RuntimeError(f"래스터를 열 수 없습니다: {src_path}")
+    x_min, x_res, x_skew, y_max, y_skew, y_res = ds.GetGeoTransform()
+    if x_skew or y_skew or not math.isclose(abs(x_res), abs(y_res)):
+        raise ValueError(f"ASCII Grid에는 정사각형 북향 셀이 필요합니다: {src_path}")
+    band = ds.GetRasterBand(1)
+    width, height = ds.RasterXSize, ds.RasterYSize
+    nodata = band.GetNoDataValue()
+    if integer is None:
+        integer = band.DataType in _INTEGER_DATA_TYPES
+
+    cell_fmt = "%d" if integer else f"%.{max(0, int(decimals))}f"
+    row_fmt = " ".join([cell_fmt] * width) + "\n"
+    chunk_rows = max(1, ASC_CHUNK_CELLS // max(1, width))
+
+    tmp_path = f"{asc_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="ascii", newline="\n") as fp:
+            fp.write(f"ncols        {width}\n")
+            fp.write(f"nrows        {height}\n")
+            fp.write(f"xllcorner    {_format_number(x_min)}\n")
+            fp.write(f"yllcorner    {_format_number(y_max + height * y_res)}\n")
+            fp.write(f"cellsize     {_format_number(abs(x_res))}\n")
+            if nodata is not None:
+                fp.write(f"NODATA_value {_format_number(nodata)}\n")
+
+            for y_off in range(0, height, chunk_rows):
+                rows = min(chunk_rows, height - y_off)
+                block = band.ReadAsArray(0, y_off, width, rows)
+                if integer:
+                    block = block.astype(np.int64, copy=False)
+                elif nodata is not None:
+                    block = np.where(np.isfinite(block), block, nodata)
+                fp.write((row_fmt * rows) % tuple(block.ravel().tolist()))
+        os.replace(tmp_path, asc_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    wkt = ds.GetProjection()
+    ds = None
+    if wkt:
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt(wkt)
+        srs.MorphToESRI()
+        with open(f"{os.path.splitext(asc_path)[0]}.prj", "w", encoding="ascii") as fp:
+            fp.write(srs.ExportToWkt())
+    return asc_path
+
+
+def _render_variable(
+    variable: ExportVariable, grid: ReferenceGrid, options: ExportOptions, tif_path: str, tiled: bool,
+    blocks: Sequence[GridBlock], progress: Optional[_ExportProgress] = None
+) -> dict:
+    """Rasterize or warp one variable to *tif_path*; returns its cache metadata."""
+    if variable.kind == "vector":
+        if options.categorical:
+            variable.categories = build_category_codes(variable)
+        if tiled:
+            burned = _rasterize_vector_tiled(variable, grid, options, tif_path, blocks, progress)
+        else:
+            burned = _rasterize_vector(variable, grid, options, tif_path, progress)
+        return {"burned": burned, "categories": variable.categories}
+    if variable.kind == "distance":
+        return {"burned": _distance_raster(variable, grid, options, tif_path, tiled, blocks, progress)}
+    if not (tiled and _warp_raster_tiled(variable, grid, options, tif_path, blocks, progress)):
+        _warp_raster(variable, grid, options, tif_path, progress)
+    return {}
+
+
+def _variable_cache_key(
+    variable: ExportVariable, grid: ReferenceGrid, options: ExportOptions, tiled: bool
+) -> Optional[str]:
+    """
+    Identity of one variable export: every source's data source, subset,
+    provider encoding and the size/mtime of its file and sidecars (.dbf, .shx, .cpg, .prj,
+    GeoPackage -wal, .aux.xml), the burn field, the grid definition and
+    the options that change cell values, including the tiling mode and,
+    for distance variables, the halo and effective cap it implies. None when a source is not a local
+    file (memory layers, WMS, ...), which are never cached.
+    """
+    sources = []
+    for layer in variable.layers:
+        source = layer.source()
+        path = source.split("|", 1)[0]
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        stem = os.path.splitext(path)[0]
+        sidecars = []
+        candidates = [(stem + suffix, stem + suffix.upper()) for suffix in _SOURCE_SIDECAR_SUFFIXES]
+        candidates += [(path + suffix, path + suffix.upper()) for suffix in _SOURCE_APPENDED_SUFFIXES]
+        for names in candidates:
+            for candidate in names:
+                try:
+                    sidecar_stat = os.stat(candidate)
+                except OSError:
+                    continue
+                sidecars.append([os.path.basename(candidate), sidecar_stat.st_size, sidecar_stat.st_mtime_ns])
+                break
+        subset = layer.subsetString() if hasattr(layer, "subsetString") else ""
+        # The decoding decides category text and field names, so a layer read
+        # with the wrong encoding must not share an entry with the right one.
+        encoding = layer.dataProvider().encoding() if layer.type() == 0 and layer.dataProvider() else ""
+        sources.append([
+            layer.providerType(), source, subset, encoding, stat.st_size, stat.st_mtime_ns, sidecars,
+            layer.crs().toWkt()])
+
+    settings = {
+        "version": EXPORT_CACHE_VERSION,
+        "kind": variable.kind,
+        "sources": sources,
+        "field": variable.field,
+        "categorical": bool(options.categorical and variable.kind == "vector"),
+        "grid": [grid.crs.toWkt(), grid.x_min, grid.y_max, grid.resolution, grid.width, grid.height],
+        "nodata": options.nodata,
+        "data_type": options.data_type,
+        "resampling": options.resampling if variable.kind == "raster" else None,
+        "boundary": variable.boundary,
+        "tiled": tiled,
+        "memory_budget_mb": options.memory_budget_mb if tiled else None,
+        "distance_window": list(_distance_window(grid, options, tiled)) if variable.kind == "distance" else None,
+    }
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _link_or_copy(src: str, dst: str, allow_link: bool):
+    tmp_path = f"{dst}.{os.getpid()}.tmp"
+    try:
+        if allow_link:
+            try:
+                os.link(src, tmp_path)
+            except OSError:
+                shutil.copyfile(src, tmp_path)
+        else:
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _read_cached_variable(cache_dir: Optional[str], key: Optional[str], tif_path: str, allow_link: bool):
+    """Serve a cached export into *tif_path*; returns its metadata, or None on a miss."""
+    if not cache_dir or not key:
+        return None
+    cached_tif = os.path.join(cache_dir, f"{key}.tif")
+    meta_path = os.path.join(cache_dir, f"{key}.json")
+    if not os.path.exists(cached_tif) or not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as fp:
+            meta = json.load(fp)
+        _link_or_copy(cached_tif, tif_path, allow_link)
+    except (OSError, ValueError):
+        return None
+    # Mark as recently used for pruning.
+    os.utime(meta_path)
+    return meta
+
+
+def _store_cached_variable(cache_dir: str, key: str, tif_path: str, meta: dict, allow_link: bool, max_mb: int):
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _link_or_copy(tif_path, os.path.join(cache_dir, f"{key}.tif"), allow_link)
+        with open(os.path.join(cache_dir, f"{key}.json"), "w", encoding="utf-8") as fp:
+            json.dump(meta, fp, ensure_ascii=False)
+    except OSError:
+        return
+    if max_mb > 0:
+        _prune_cache(cache_dir, max_mb)
+
+
+def _prune_cache(cache_dir: str, max_mb: int):
+    """Drop least recently used entries until the cache fits *max_mb*."""
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json"):
+            continue
+        key = name[:-5]
+        meta_path = os.path.join(cache_dir, name)
+        tif_path = os.path.join(cache_dir, f"{key}.tif")
+        try:
+            size = os.path.getsize(tif_path)
+            used = os.path.getmtime(meta_path)
+        except OSError:
+            continue
+        entries.append((used, size, meta_path, tif_path))
+        total += size
+
+    limit = int(max_mb) * 1024 * 1024
+    for _used, size, meta_path, tif_path in sorted(entries):
+        if total <= limit:
+            break
+        for path in (meta_path, tif_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+
+
+def _check_grid(path: str, grid: ReferenceGrid):
+    ds = gdal.Open(path)
+    if ds is None:
+        raise RuntimeError(f"출력 파일을 열 수 없습니다: {path}")
+    size = (ds.RasterXSize, ds.RasterYSize)
+    geotransform = ds.GetGeoTransform()
+    ds = None
+    if size != (grid.width, grid.height) or not np.allclose(geotransform, grid.geotransform):
+        raise RuntimeError(
+            f"{os.path.basename(path)}: 격자가 기준 격자와 다릅니다 ({size[0]}x{size[1]}, {geotransform})")
+
+
+def _output_files(out_dir: str, name: str) -> Dict[str, Optional[int]]:
+    """Every file export_stack may write for variable *name*, with its current mtime (None if absent)."""
+    files = {}
+    for suffix in (".tif", ".tif.aux.xml", ".asc", ".prj", "_categories.csv"):
+        path = os.path.join(out_dir, f"{name}{suffix}")
+        try:
+            files[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            files[path] = None
+    return files
+
+
+def _remove_written(files: Dict[str, Optional[int]]) -> int:
+    """Delete the files in *files* that were created or rewritten since they were listed."""
+    removed = 0
+    for path, mtime in files.items():
+        try:
+            if os.stat(path).st_mtime_ns == mtime:
+                continue
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def export_stack(
+    grid: ReferenceGrid,
+    variables: Sequence[ExportVariable],
+    out_dir: str,
+    options: ExportOptions,
+    log: Optional[Callable[[str], None]] = None,
+    feedback: Optional[QgsFeedback] = None,
+) -> ExportResult:
+    """
+    Write every variable onto *grid* as <out_dir>/<name>.tif (or .asc).
+    With options.common_mask, cells outside the union of the vector
+    variables' coverage are set to NoData in every output, so all files
+    share one data footprint; the mask is computed once per block. Grids
+    larger than memory_budget_mb (or options.tiling == "always") are
+    rasterized and warped block by block.
+
+    Progress is reported to *feedback* per variable and per block. When it
+    is canceled, or the export fails, files already written for this
+    export are removed and ExportCanceled (or the error) is raised.
+    """
+    log = log or (lambda _message: None)
+    os.makedirs(out_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="KigamMaxent_")
+    result = ExportResult(grid)
+
+    tiled = use_tiling(grid, options)
+    # A full-grid distance transform costs far more per cell than a burn.
+    distance_tiled = use_tiling(grid, options, bytes_per_cell=_DISTANCE_BYTES_PER_CELL * 4)
+    blocks = grid.blocks(block_size_for_budget(options.memory_budget_mb))
+    if tiled:
+        log(f"타일 모드: {len(blocks)}개 블록 (메모리 한도 {options.memory_budget_mb} MB)")
+    elif distance_tiled and any(v.kind == "distance" for v in variables):
+        log(f"거리 변수 타일 모드 (메모리 한도 {options.memory_budget_mb} MB)")
+
+    vector_names = [v.name for v in variables if v.kind == "vector"]
+    # Masked outputs are rewritten in place, so they must not share a cache file.
+    mask_pending = bool(options.common_mask and vector_names and len(variables) > 1)
+    progress = _ExportProgress(
+        feedback, len(variables) + int(mask_pending) + int(options.output_format == "asc"), log)
+    written = {}
+
+    try:
+        tif_paths = {}
+        for idx, variable in enumerate(variables, start=1):
+            progress.start_step()
+            tif_path = (
+                os.path.join(out_dir, f"{variable.name}.tif")
+                if options.output_format == "tif"
+                else os.path.join(work_dir, f"{variable.name}.tif")
+            )
+            written.update(_output_files(out_dir, variable.name))
+            log(f"[{idx}/{len(variables)}] {variable.name} ({variable.kind}, {len(variable.layers)} layer(s))")
+            variable_tiled = distance_tiled if variable.kind == "distance" else tiled
+            cache_key = _variable_cache_key(variable, grid, options, variable_tiled) if options.cache_dir else None
+            meta = _read_cached_variable(options.cache_dir, cache_key, tif_path, allow_link=not mask_pending)
+            if meta is not None:
+                log(f"  -> 캐시 적중: {cache_key[:12]}")
+            else:
+                if cache_key:
+                    log(f"  -> 캐시 없음: {cache_key[:12]}")
+                meta = _render_variable(variable, grid, options, tif_path, variable_tiled, blocks, progress)
+                if cache_key:
+                    _store_cached_variable(
+                        options.cache_dir, cache_key, tif_path, meta,
+                        allow_link=not mask_pending, max_mb=options.cache_max_mb)
+            if variable.kind == "vector":
+                log(f"  -> {meta.get('burned', 0)} feature(s) burned (field {variable.field})")
+            elif variable.kind == "distance":
+                target = "경계선" if variable.boundary else "피처"
+                log(f"  -> {target} {meta.get('burned', 0)}개까지의 거리 계산")
+            if meta.get("categories") is not None:
+                variable.categories = dict(meta["categories"])
+                csv_path = os.path.join(out_dir, f"{variable.name}_categories.csv")
+                _write_category_table(tif_path, variable.categories, csv_path)
+                result.category_tables[variable.name] = csv_path
+                log(f"  -> 범주 {len(variable.categories)}개 코드화: {os.path.basename(csv_path)}")
+            _check_grid(tif_path, grid)
+            tif_paths[variable.name] = tif_path
+            progress.finish_step()
+
+        if mask_pending:
+            progress.start_step()
+            valid, total = _apply_common_mask(
+                [tif_paths[name] for name in vector_names], list(tif_paths.values()), blocks, progress)
+            log(f"공통 마스크 적용: 유효 셀 {valid}/{total}")
+            progress.finish_step()
+
+        if options.output_format == "asc":
+            progress.start_step()
+            # Formatting is GIL-bound string work, so the files are written one
+            # after another.
+            for position, variable in enumerate(variables, start=1):
+                result.outputs[variable.name] = write_asc(
+                    tif_paths[variable.name],
+                    os.path.join(out_dir, f"{variable.name}.asc"),
+                    options.asc_decimals
+                )
+                progress.block(position, len(variables))
+            log(f"ASCII Grid {len(result.outputs)}개 작성 (소수점 {options.asc_decimals}자리)")
+            progress.finish_step()
+        else:
+            for variable in variables:
+                result.outputs[variable.name] = tif_paths[variable.name]
+    except BaseException as e:
+        removed = _remove_written(written)
+        if isinstance(e, ExportCanceled):
+            log(f"내보내기 취소: 부분 출력 파일 {removed}개 삭제")
+        raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return result
+
+
+class MaxentExportTask(QgsTask):
+    """
+    Runs export_stack in the QGIS task manager. The layers' data sources
+    are captured in __init__ on the GUI thread and reopened inside run(),
+    so project layers are never read off the GUI thread. Log lines go to the plugin message log and are re-emitted
+    through messageLogged for the dialog's log panel. *on_finished* is
+    called on the GUI thread with (result, error); both are None when the
+    task was canceled.
+    """
+
+    messageLogged = pyqtSignal(str)
+
+    def __init__(
+        self,
+        grid: ReferenceGrid,
+        variables: Sequence[ExportVariable],
+        out_dir: str,
+        options: ExportOptions,
+        on_finished: Optional[Callable] = None,
+    ):
+        super().__init__(f"KIGAM MaxEnt export: {os.path.basename(out_dir) or out_dir}", QgsTask.Flag.CanCancel)
+        self.grid = grid
+        self.variables = detach_variables(variables)
+        self.out_dir = out_dir
+        self.options = options
+        self.on_finished = on_finished
+        self.feedback = QgsFeedback()
+        self.feedback.progressChanged.connect(self.setProgress)
+        self.result = None
+        self.error = None
+
+    def _log(self, message: str):
+        QgsMessageLog.logMessage(message, "KIGAM Plugin", Qgis.MessageLevel.Info)
+        self.messageLogged.emit(message)
+
+    def cancel(self):
+        self.feedback.cancel()
+        super().cancel()
+
+    def run(self):
+        try:
+            variables = open_detached(self.variables)
+            self.result = export_stack(
+                self.grid, variables, self.out_dir, self.options, log=self._log, feedback=self.feedback)
+        except ExportCanceled:
+            return False
+        except Exception as e:
+            self.error = e
+            return False
+        return True
+
+    def finished(self, result):
+        if self.error is not None:
+            QgsMessageLog.logMessage(
+                f"MaxEnt export failed: {self.error}", "KIGAM Plugin", Qgis.MessageLevel.Critical)
+        if self.on_finished is not None:
+            self.on_finished(self.result if result else None, self.error)
+
+
+# MaxEnt's default missing-data value in SWD files.
+SWD_MISSING = -9999
+
+
+@dataclass
+class SwdPoints:
+    """Point coordinates in the grid CRS, with one species label per point."""
+    species: List[str]
+    x: np.ndarray
+    y: np.ndarray
+
+
+def collect_points(layer, grid_crs: QgsCoordinateReferenceSystem, species: Optional[str] = None,
+                   species_field: Optional[str] = None) -> SwdPoints:
+    """
+    Every point of *layer* (multipoint parts included) in *grid_crs*. The
+    label is the *species_field* value when present, else *species*, else
+    the layer name.
+    """
+    transform = None
+    if layer.crs().isValid() and grid_crs.isValid() and layer.crs() != grid_crs:
+        transform = QgsCoordinateTransform(layer.crs(), grid_crs, QgsProject.instance())
+    field_idx = layer.fields().indexOf(species_field) if species_field else -1
+    request = QgsFeatureRequest()
+    if field_idx >= 0:
+        request.setSubsetOfAttributes([field_idx])
+    else:
+        request.setNoAttributes()
+
+    default_label = species or layer.name()
+    labels, xs, ys = [], [], []
+    for feature in layer.getFeatures(request):
+        geometry = feature.geometry()
+        if geometry is None or geometry.isEmpty():
+            continue
+        if transform is not None:
+            geometry.transform(transform)
+        label = default_label
+        if field_idx >= 0:
+            label = _category_key(feature.attribute(field_idx)) or default_label
+        points = geometry.asMultiPoint() if geometry.isMultipart() else [geometry.asPoint()]
+        for point in points:
+            labels.append(label)
+            xs.append(point.x())
+            ys.append(point.y())
+    return SwdPoints(labels, np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))
+
+
+def sample_raster(path: str, x: np.ndarray, y: np.ndarray, chunk_cells: int = ASC_CHUNK_CELLS):
+    """
+    Band 1 of *path* at every (x, y). Pixel indices of all points are
+    computed in one vectorized step; only the row ranges that contain
+    points are read, about *chunk_cells* cells at a time, and each range
+    is gathered with one fancy-index. Returns (values, valid, integer):
+    points outside the raster or on NoData are not valid.
+    """
+    ds = gdal.Open(path)
+    if ds is None:
+        raise RuntimeError(f"래스터를 열 수 없습니다: {path}")
+    x_min, x_res, x_skew, y_max, y_skew, y_res = ds.GetGeoTransform()
+    if x_skew or y_skew:
+        raise ValueError(f"북향 격자가 아닙니다: {path}")
+    band = ds.GetRasterBand(1)
+    width, height = ds.RasterXSize, ds.RasterYSize
+    nodata = band.GetNoDataValue()
+
+    cols = np.floor((x - x_min) / x_res).astype(np.int64)
+    rows = np.floor((y - y_max) / y_res).astype(np.int64)
+    inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+    values = np.zeros(x.shape, dtype=np.float64)
+    valid = inside.copy()
+
+    index = np.flatnonzero(inside)
+    index = index[np.argsort(rows[index], kind="stable")]
+    sorted_rows = rows[index]
+    chunk_rows = max(1, chunk_cells // max(1, width))
+    start = 0
+    while start < len(index):
+        y_off = int(sorted_rows[start])
+        stop = int(np.searchsorted(sorted_rows, y_off + chunk_rows, side="left"))
+        y_end = int(sorted_rows[stop - 1]) + 1
+        block = band.ReadAsArray(0, y_off, width, y_end - y_off)
+        selected = index[start:stop]
+        picked = block[rows[selected] - y_off, cols[selected]]
+        missing = ~np.isfinite(picked) if picked.dtype.kind == "f" else np.zeros(picked.shape, dtype=bool)
+        if nodata is not None:
+            # Compare in the band's own type so Float32 NoData matches exactly.
+            missing |= picked == np.asarray(nodata).astype(picked.dtype)
+        values[selected] = picked
+        valid[selected] = ~missing
+        start = stop
+
+    integer = band.DataType in _INTEGER_DATA_TYPES
+    ds = None
+    return values, valid, integer
+
+
+def environment_layers(folder: str) -> Dict[str, str]:
+    """Variable name -> raster of an export folder (.tif preferred over .asc)."""
+    layers = {}
+    for name in sorted(os.listdir(folder)):
+        stem, ext = os.path.splitext(name)
+        ext = ext.lower()
+        if ext == ".tif" or (ext == ".asc" and stem not in layers):
+            layers[stem] = os.path.join(folder, name)
+    return layers
+
+
+def write_swd(csv_path: str, rasters: Dict[str, str], point_sets: Sequence[SwdPoints], decimals: int = 4,
+              drop_missing: bool = True):
+    """
+    Write a MaxEnt samples-with-data CSV: species, x, y and one column per
+    variable in *rasters*, named like the environmental layer files.
+    Integer (categorical) variables are written as plain codes. Points
+    with a missing value in any variable are dropped, or written with
+    SWD_MISSING when *drop_missing* is False. Returns (written, dropped).
+    """
+    species = [label for points in point_sets for label in points.species]
+    x = np.concatenate([points.x for points in point_sets]) if point_sets else np.empty(0)
+    y = np.concatenate([points.y for points in point_sets]) if point_sets else np.empty(0)
+
+    columns = []
+    complete = np.ones(x.shape, dtype=bool)
+    for name, path in rasters.items():
+        values, valid, integer = sample_raster(path, x, y)
+        complete &= valid
+        columns.append((name, values, valid, integer))
+    keep = complete if drop_missing else np.ones(x.shape, dtype=bool)
+
+    formatted = []
+    for _name, values, valid, integer in columns:
+        values, valid = np.where(valid, values, SWD_MISSING)[keep], valid[keep]
+        if integer:
+            formatted.append([str(v) for v in values.astype(np.int64).tolist()])
+        else:
+            text = np.char.mod(f"%.{max(0, int(decimals))}f", values).astype(object)
+            text[~valid] = str(SWD_MISSING)
+            formatted.append(text.tolist())
+    kept = np.flatnonzero(keep)
+
+    tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["species", "x", "y"] + [name for name, *_rest in columns])
+            writer.writerows(
+                [species[i], repr(float(x[i])), repr(float(y[i]))] + [column[row] for column in formatted]
+                for row, i in enumerate(kept.tolist())
+            )
+        os.replace(tmp_path, csv_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return len(kept), len(x) - len(kept)
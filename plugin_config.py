@@ -39,6 +39,21 @@ DEFAULT_PLUGIN_CONFIG = {
         "label_field_candidates": ["LITHOIDX", "LITHONAME"],
         "reference_layer_keywords": ["frame", "crosssectionline"],
         "litho_layer_keyword": "litho",
+        "candidate_cache_size": 8192,
+        "symbol_match_sample_size": 2000,
+        "symbol_store_enabled": True,
+        "symbol_store_dir_name": "_symbol_store",
+        "style_cache_dir_name": "_style_cache",
+        "reuse_extractions": True,
+        "build_spatial_index": True,
+        "consolidate_geopackage": False,
+        "snapshot_cache": True,
+        "snapshot_dir_name": "_snapshots",
+        "lazy_styling": False,
+        "temp_space_margin_mb": 256,
+        "mosaic_mode": False,
+        "mosaic_dir_name": "_mosaic",
+        "mosaic_group_name": "KIGAM Mosaic",
     },
     "raster": {
         "vector_export_field_candidates": ["LITHOIDX", "LITHONAME", "TYPE", "CODE", "ASGN_CODE", "SIGN"],
@@ -48,6 +63,19 @@ DEFAULT_PLUGIN_CONFIG = {
         "maxent_resampling": 0,
         "geochem_fill_nodata_distance": 30,
         "multithreading": False,
+        "maxent_common_mask": True,
+        "maxent_categorical": False,
+        "asc_decimal_places": 4,
+        "maxent_tiling": "auto",
+        "maxent_memory_budget_mb": 512,
+        "export_cache": True,
+        "export_cache_dir_name": "_export_cache",
+        "export_cache_max_mb": 2048,
+        "distance_max_m": 0,
+        "zonal_field_candidates": ["LITHONAME", "LITHOIDX", "TYPE", "CODE"],
+        "zonal_percentiles": [10, 25, 50, 75, 90],
+        "swd_species_field": "",
+        "swd_drop_missing": True,
     },
 }
 
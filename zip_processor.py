@@ -1,21 +1,41 @@
 # -*- coding: utf-8 -*-
+import functools
+import hashlib
+import json
 import os
 import re
+import shutil
+import time
 import zipfile
 import tempfile
 import unicodedata
-from .defusedxml import ElementTree as ET
+from dataclasses import dataclass, field
+import numpy as np
+from .defusedxml import qml as qml_stream
 from .plugin_config import PLUGIN_CONFIG, DEFAULT_PLUGIN_CONFIG
 from qgis.core import (
     QgsProject,
     QgsVectorLayer,
+    QgsVectorFileWriter,
+    QgsFields,
+    QgsField,
+    QgsFeature,
+    QgsWkbTypes,
+    QgsCoordinateTransform,
+    QgsCsException,
     QgsRasterMarkerSymbolLayer,
     QgsRasterFillSymbolLayer,
     QgsMarkerSymbol,
     QgsFillSymbol,
     QgsCategorizedSymbolRenderer,
     QgsRendererCategory,
+    QgsSingleSymbolRenderer,
+    QgsSymbol,
+    QgsLayerTreeLayer,
+    QgsLayerDefinition,
     QgsMessageLog,
+    QgsApplication,
+    QgsTask,
     Qgis
 )
 
@@ -92,6 +112,566 @@ if not LABEL_FIELD_CANDIDATES:
 if not LABEL_FIELD_CANDIDATES:
     LABEL_FIELD_CANDIDATES = ["LITHOIDX", "LITHONAME"]
 
+try:
+    CANDIDATE_CACHE_SIZE = max(0, int(
+        ZIP_CONFIG.get("candidate_cache_size", DEFAULT_ZIP_CONFIG.get(
+            "candidate_cache_size", 8192))
+    ))
+except (TypeError, ValueError):
+    CANDIDATE_CACHE_SIZE = 8192
+
+try:
+    SYMBOL_MATCH_SAMPLE_SIZE = max(1, int(
+        ZIP_CONFIG.get("symbol_match_sample_size", DEFAULT_ZIP_CONFIG.get(
+            "symbol_match_sample_size", 2000))
+    ))
+except (TypeError, ValueError):
+    SYMBOL_MATCH_SAMPLE_SIZE = 2000
+
+SYMBOL_STORE_ENABLED = bool(ZIP_CONFIG.get(
+    "symbol_store_enabled", DEFAULT_ZIP_CONFIG.get("symbol_store_enabled", True)))
+STYLE_CACHE_DIR_NAME = str(
+    ZIP_CONFIG.get("style_cache_dir_name", DEFAULT_ZIP_CONFIG.get(
+        "style_cache_dir_name", "_style_cache"))
+).strip() or "_style_cache"
+SYMBOL_STORE_DIR_NAME = str(
+    ZIP_CONFIG.get("symbol_store_dir_name", DEFAULT_ZIP_CONFIG.get(
+        "symbol_store_dir_name", "_symbol_store"))
+).strip() or "_symbol_store"
+
+REUSE_EXTRACTIONS = bool(ZIP_CONFIG.get(
+    "reuse_extractions", DEFAULT_ZIP_CONFIG.get("reuse_extractions", True)))
+BUILD_SPATIAL_INDEX = bool(ZIP_CONFIG.get(
+    "build_spatial_index", DEFAULT_ZIP_CONFIG.get("build_spatial_index", True)))
+CONSOLIDATE_GEOPACKAGE = bool(ZIP_CONFIG.get(
+    "consolidate_geopackage", DEFAULT_ZIP_CONFIG.get("consolidate_geopackage", False)))
+MOSAIC_DIR_NAME = str(
+    ZIP_CONFIG.get("mosaic_dir_name", DEFAULT_ZIP_CONFIG.get(
+        "mosaic_dir_name", "_mosaic"))
+).strip() or "_mosaic"
+MOSAIC_GROUP_NAME = str(
+    ZIP_CONFIG.get("mosaic_group_name", DEFAULT_ZIP_CONFIG.get(
+        "mosaic_group_name", "KIGAM Mosaic"))
+).strip() or "KIGAM Mosaic"
+SNAPSHOT_CACHE = bool(ZIP_CONFIG.get(
+    "snapshot_cache", DEFAULT_ZIP_CONFIG.get("snapshot_cache", True)))
+SNAPSHOT_DIR_NAME = str(
+    ZIP_CONFIG.get("snapshot_dir_name", DEFAULT_ZIP_CONFIG.get(
+        "snapshot_dir_name", "_snapshots"))
+).strip() or "_snapshots"
+# Bump when the styling pipeline changes so stale snapshots are ignored.
+SNAPSHOT_FORMAT_VERSION = 1
+LAZY_STYLING = bool(ZIP_CONFIG.get(
+    "lazy_styling", DEFAULT_ZIP_CONFIG.get("lazy_styling", False)))
+try:
+    TEMP_SPACE_MARGIN_MB = max(0, int(
+        ZIP_CONFIG.get("temp_space_margin_mb", DEFAULT_ZIP_CONFIG.get(
+            "temp_space_margin_mb", 256))
+    ))
+except (TypeError, ValueError):
+    TEMP_SPACE_MARGIN_MB = 256
+MOSAIC_SHEET_FIELD = "SHEET"
+EXTRACT_MARKER_NAME = ".kigam_extract.json"
+
+# OGR field types that can never hold a PNG stem.
+UNMATCHABLE_FIELD_TYPE_NAMES = ("date", "time", "datetime", "binary", "blob", "bool", "boolean")
+
+_TOKEN_SEPARATOR_RE = re.compile(r"[\s_\-./]+")
+_BRACKETED_TEXT_RE = re.compile(r"\(.*?\)|\[.*?\]")
+# Common map index prefixes like FF23_, GF03_, etc.
+_MAP_INDEX_PREFIX_RE = re.compile(r"^[A-Za-z]{1,4}\d{2,3}_")
+_UNSAFE_PREFIX_CHARS_RE = re.compile(r"[^A-Za-z0-9._-]+")
+_NUMERIC_TEXT_RE = re.compile(r"^[+-]?\d+(\.\d+)?$")
+
+_REDECODE_CODEC_PAIRS = (
+    ("latin1", "utf-8"),
+    ("cp1252", "utf-8"),
+    ("latin1", "cp949"),
+    ("cp1252", "cp949"),
+    ("latin1", "euc-kr"),
+    ("cp1252", "euc-kr"),
+    ("utf-8", "cp949"),
+    ("cp949", "utf-8")
+)
+
+
+def _normalize_token(text):
+    if text is None:
+        return ""
+    normalized = unicodedata.normalize("NFC", str(text)).strip()
+    if not normalized:
+        return ""
+    normalized = normalized.casefold()
+    normalized = _TOKEN_SEPARATOR_RE.sub("", normalized)
+    return normalized
+
+
+def _redecode_variants(text):
+    """
+    Recover common mojibake cases caused by wrong codec assumptions.
+    """
+    variants = set()
+    if not text:
+        return variants
+
+    for src_codec, dst_codec in _REDECODE_CODEC_PAIRS:
+        try:
+            converted = text.encode(src_codec).decode(dst_codec)
+        except (LookupError, UnicodeEncodeError, UnicodeDecodeError, ValueError):
+            converted = None
+
+        if converted and converted != text:
+            variants.add(converted)
+
+    return variants
+
+
+@functools.lru_cache(maxsize=CANDIDATE_CACHE_SIZE)
+def _candidate_keys(raw):
+    """
+    Memoized candidate-key generation for an NFC-normalized, stripped value.
+    The cache lives at module level so it is shared by every layer and ZIP
+    loaded in the same QGIS session; lithology codes repeat across sheets.
+    """
+    candidates = set()
+
+    def add_candidate(text):
+        token = _normalize_token(text)
+        if token:
+            candidates.add(token)
+
+    source_values = {raw}
+    source_values.update(_redecode_variants(raw))
+
+    for src in source_values:
+        add_candidate(src)
+        add_candidate(src.replace(" ", ""))
+        add_candidate(src.replace("_", ""))
+        add_candidate(src.replace("-", ""))
+        add_candidate(_BRACKETED_TEXT_RE.sub("", src).strip())
+        add_candidate(_MAP_INDEX_PREFIX_RE.sub("", src))
+
+        if "_" in src:
+            add_candidate(src.split("_")[-1])
+        if "-" in src:
+            add_candidate(src.split("-")[-1])
+        if "/" in src:
+            add_candidate(src.split("/")[-1])
+
+    return frozenset(candidates)
+
+
+def _build_text_quality_table():
+    """
+    Per-codepoint score table for the BMP plus one trailing zero slot that
+    every codepoint above U+FFFF is clipped to.
+    """
+    table = np.zeros(0x10001, dtype=np.int32)
+    table[0x20:0x7F] = 1         # Normal printable ASCII
+    table[0x80:0xA0] = -4        # C1 control chars — strong mojibake
+    table[0xC0:0x100] = -2       # Latin Extended — mojibake indicator
+    table[0x1100:0x1200] = 2     # Hangul Jamo
+    table[0x3130:0x3190] = 2     # Hangul Compatibility Jamo
+    table[0x4E00:0xA000] = 1     # CJK Unified Ideographs
+    table[0xAC00:0xD7A4] = 3     # Hangul syllables — very good
+    table[0xFFFD] = -5           # Unicode replacement char — failed decode
+    return table
+
+
+_TEXT_QUALITY_TABLE = _build_text_quality_table()
+_TEXT_QUALITY_OVERFLOW = len(_TEXT_QUALITY_TABLE) - 1
+
+
+def _score_text_batch(texts):
+    """
+    Sum the text-quality score of every string in *texts* in one pass:
+    all strings are packed into a single UTF-32 codepoint array and looked
+    up in _TEXT_QUALITY_TABLE. The score is additive per character, so this
+    equals the sum of per-string scores.
+    """
+    joined = "".join(t for t in texts if t)
+    if not joined:
+        return 0
+    codepoints = np.frombuffer(
+        joined.encode("utf-32-le", "surrogatepass"), dtype="<u4")
+    codepoints = np.minimum(codepoints, _TEXT_QUALITY_OVERFLOW)
+    return int(_TEXT_QUALITY_TABLE[codepoints].sum())
+
+
+_FILE_HASH_CACHE = {}
+
+
+def _file_content_hash(png_path):
+    """
+    SHA-1 of a file's bytes (sym/ PNGs, sidecar QMLs), memoized on
+    (path, size, mtime) so each file is read at most once per session and
+    re-hashed whenever it changes.
+    """
+    try:
+        stat = os.stat(png_path)
+    except OSError:
+        return None
+
+    key = (os.path.normcase(os.path.abspath(png_path)), stat.st_size, stat.st_mtime_ns)
+    digest = _FILE_HASH_CACHE.get(key)
+    if digest is None:
+        hasher = hashlib.sha1()
+        try:
+            with open(png_path, "rb") as handle:
+                for chunk in iter(lambda: handle.read(65536), b""):
+                    hasher.update(chunk)
+        except OSError:
+            return None
+        digest = hasher.hexdigest()
+        _FILE_HASH_CACHE[key] = digest
+    return digest
+
+
+# QML content hash -> (renderer attr, category value -> image stem)
+_QML_MAPPING_CACHE = {}
+# relink key -> (relinked qml path or None, relinked count, imageFile count)
+_RELINKED_QML_CACHE = {}
+
+
+def _zip_identity(zip_path):
+    """Cheap identity of a ZIP on disk: SHA-1 of (abs path, size, mtime)."""
+    stat = os.stat(zip_path)
+    key = f"{os.path.normcase(os.path.abspath(zip_path))}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _safe_prefix(zip_path):
+    zip_basename = os.path.splitext(os.path.basename(zip_path))[0]
+    return _UNSAFE_PREFIX_CHARS_RE.sub("_", zip_basename).strip("_") or "kigam_map"
+
+
+@dataclass
+class SheetPlan:
+    """What one sheet ZIP holds, read from its central directory only."""
+    zip_path: str
+    shapefiles: list = field(default_factory=list)
+    sidecar_qmls: list = field(default_factory=list)
+    symbol_files: list = field(default_factory=list)
+    uncompressed_size: int = 0
+    signature: str = None
+    reused: bool = False
+    duplicate_of: str = None
+    refused: str = None
+
+    @property
+    def extract_bytes(self):
+        """Bytes this sheet still needs on the temp drive."""
+        return 0 if self.reused else self.uncompressed_size
+
+    @property
+    def loadable(self):
+        return self.duplicate_of is None and self.refused is None
+
+
+@dataclass
+class LoadPlan:
+    sheets: list
+    free_bytes: int = None
+
+    @property
+    def to_load(self):
+        return [sheet for sheet in self.sheets if sheet.loadable]
+
+    @property
+    def total_bytes(self):
+        return sum(sheet.uncompressed_size for sheet in self.to_load)
+
+    @property
+    def extract_bytes(self):
+        return sum(sheet.extract_bytes for sheet in self.to_load)
+
+
+def _scan_zip_members(sheet):
+    """Fill *sheet* from its ZIP central directory; nothing is decompressed."""
+    with zipfile.ZipFile(sheet.zip_path, "r") as zip_ref:
+        infos = [info for info in zip_ref.infolist() if not info.is_dir()]
+
+    members = {info.filename.replace("\\", "/").lower() for info in infos}
+    for info in infos:
+        name = info.filename.replace("\\", "/")
+        lower = name.lower()
+        if lower.endswith(".shp"):
+            sheet.shapefiles.append(name)
+        elif lower.endswith(".qml"):
+            if f"{lower[:-4]}.shp" in members:
+                sheet.sidecar_qmls.append(name)
+        elif "sym" in lower.split("/")[:-1]:
+            sheet.symbol_files.append(name)
+        sheet.uncompressed_size += info.file_size
+
+    hasher = hashlib.sha1()
+    for info in sorted(infos, key=lambda item: item.filename):
+        hasher.update(f"{info.filename}\0{info.CRC:08x}\0{info.file_size}\n".encode("utf-8"))
+    sheet.signature = hasher.hexdigest()
+
+
+def _build_spatial_indexes(task, shp_paths):
+    """
+    QgsTask body: write a .qix next to each shapefile through OGR. The
+    shapefile is opened read-only, since the QGIS provider already has it
+    open; only the .qix is written. Returns [(shp_path, ok, seconds, error)].
+    """
+    from osgeo import gdal, ogr
+
+    timings = []
+    for position, shp_path in enumerate(shp_paths, start=1):
+        if task.isCanceled():
+            break
+
+        started = time.perf_counter()
+        ok = False
+        error = None
+        gdal.ErrorReset()
+        try:
+            ds = ogr.Open(shp_path, 0)
+            if ds is None or ds.GetLayerCount() == 0:
+                error = gdal.GetLastErrorMsg() or "cannot open shapefile"
+            else:
+                layer_name = ds.GetLayer(0).GetName()
+                ds.ExecuteSQL(f'CREATE SPATIAL INDEX ON "{layer_name}"')
+                ds = None
+                ok = os.path.exists(f"{os.path.splitext(shp_path)[0]}.qix")
+                if not ok:
+                    error = gdal.GetLastErrorMsg() or ".qix was not written"
+        except RuntimeError as e:
+            error = str(e)
+        timings.append((shp_path, ok, time.perf_counter() - started, error))
+        task.setProgress(100.0 * position / len(shp_paths))
+
+    return timings
+
+
+def _string_field(name):
+    try:
+        from qgis.PyQt.QtCore import QMetaType
+        return QgsField(name, QMetaType.Type.QString)
+    except (ImportError, AttributeError, TypeError):
+        from qgis.PyQt.QtCore import QVariant
+        return QgsField(name, QVariant.String)
+
+
+def _mosaic_role(layer):
+    """
+    Theme key used to merge layers across sheets: the layer name without a
+    map-index prefix (FF23_, GF03_, ...), case-folded, plus geometry type.
+    """
+    name = _MAP_INDEX_PREFIX_RE.sub("", layer.name()).strip()
+    return name.casefold(), int(QgsWkbTypes.geometryType(layer.wkbType()))
+
+
+class _SymbolFactoryCache:
+    """
+    Session-wide raster symbol prototypes keyed by
+    (PNG content hash, geometry kind, symbol size/width).
+    Adjacent sheets ship identical sym/ PNGs, so each distinct symbol is
+    built once and every later request gets a clone of the prototype.
+    """
+
+    def __init__(self):
+        self._prototypes = {}
+        self.built = 0
+        self.reused = 0
+
+    def symbol_for(self, png_path, geometry_type):
+        if geometry_type == 0:  # Point
+            kind, size = "marker", MARKER_SYMBOL_SIZE
+        elif geometry_type == 2:  # Polygon
+            kind, size = "fill", FILL_SYMBOL_WIDTH
+        else:
+            return None
+
+        digest = _file_content_hash(png_path) or os.path.normcase(os.path.abspath(png_path))
+        key = (digest, kind, size)
+        prototype = self._prototypes.get(key)
+        if prototype is not None:
+            self.reused += 1
+            return prototype.clone()
+
+        if kind == "marker":
+            # Create Raster Marker
+            symbol_layer = QgsRasterMarkerSymbolLayer(png_path)
+            # Configurable default size
+            symbol_layer.setSize(size)
+            prototype = QgsMarkerSymbol()
+        else:
+            # Create Raster Fill
+            symbol_layer = QgsRasterFillSymbolLayer()
+            symbol_layer.setImageFilePath(png_path)
+            # Configurable pattern scale
+            symbol_layer.setWidth(size)
+            prototype = QgsFillSymbol()
+        prototype.changeSymbolLayer(0, symbol_layer)
+
+        self._prototypes[key] = prototype
+        self.built += 1
+        return prototype.clone()
+
+    def stats(self):
+        return self.built, self.reused, len(self._prototypes)
+
+
+_SYMBOL_FACTORY = _SymbolFactoryCache()
+
+
+class _SymbolMatchIndex:
+    """
+    Inverted value -> PNG lookup over one sym/ folder and its QML category
+    map, shared by every field and encoding trial of a layer. Each distinct
+    value is resolved once; later lookups hit the memo.
+    """
+
+    def __init__(self, processor, raw_sym_files, normalized_sym_files, qml_value_to_image, qml_normalized_map):
+        self._processor = processor
+        self._raw_sym_files = raw_sym_files
+        self._normalized_sym_files = normalized_sym_files
+        self._qml_value_to_image = qml_value_to_image
+        self._qml_normalized_map = qml_normalized_map
+        self._resolved = {}
+
+        self.symbol_count = len(set(raw_sym_files.values()))
+        # Checked on the normalized candidates so prefixed stems such as
+        # FF23_101 still let Integer code fields through.
+        self.has_numeric_keys = any(
+            _NUMERIC_TEXT_RE.match(key)
+            for key in list(normalized_sym_files) + list(qml_normalized_map)
+        )
+
+    def resolve(self, value):
+        key = None if value is None else str(value)
+        if key in self._resolved:
+            return self._resolved[key]
+
+        png_path = self._processor._resolve_symbol_with_qml_map(
+            value,
+            self._qml_value_to_image,
+            self._qml_normalized_map,
+            self._raw_sym_files,
+            self._normalized_sym_files
+        )
+        self._resolved[key] = png_path
+        return png_path
+
+
+class _LazyStyler:
+    """
+    Defers the styling of a layer until it is first drawn: checked visible in
+    the layer tree and intersecting the map canvas extent. One watch list is
+    shared by every ZipProcessor, so consecutive loads feed the same queue.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._canvas = None
+
+    def _map_canvas(self):
+        if self._canvas is not None:
+            return self._canvas
+        try:
+            from qgis.utils import iface
+        except ImportError:
+            iface = None
+        canvas = iface.mapCanvas() if iface is not None else None
+        if canvas is None:
+            return None
+
+        self._canvas = canvas
+        canvas.extentsChanged.connect(self.check)
+        project = QgsProject.instance()
+        project.layerTreeRoot().visibilityChanged.connect(self.check)
+        project.layersWillBeRemoved.connect(self._forget)
+        return canvas
+
+    def defer(self, layer, style_fn):
+        """
+        Queue *style_fn* for *layer*. Returns False when there is no map
+        canvas to watch, in which case the caller styles immediately.
+        """
+        if self._map_canvas() is None:
+            return False
+        self._pending[layer.id()] = (layer, style_fn)
+        return True
+
+    def activate(self, layer):
+        entry = self._pending.pop(layer.id(), None) if layer is not None else None
+        if entry is None:
+            return False
+
+        started = time.perf_counter()
+        entry[1]()
+        layer.triggerRepaint()
+        QgsMessageLog.logMessage(
+            f"{layer.name()}: styled on first view in {time.perf_counter() - started:.2f}s "
+            f"({len(self._pending)} layer(s) still deferred)",
+            "KIGAM Plugin",
+            Qgis.MessageLevel.Info
+        )
+        return True
+
+    def check(self, *_args):
+        canvas = self._canvas
+        if canvas is None or not self._pending:
+            return
+
+        extent = canvas.extent()
+        if extent.isEmpty():
+            return
+        dest_crs = canvas.mapSettings().destinationCrs()
+        root = QgsProject.instance().layerTreeRoot()
+        for layer_id, (layer, _style_fn) in list(self._pending.items()):
+            node = root.findLayer(layer_id)
+            if node is None or not node.isVisible():
+                continue
+            if self._intersects(layer, extent, dest_crs):
+                self.activate(layer)
+
+    @staticmethod
+    def _intersects(layer, extent, dest_crs):
+        layer_extent = layer.extent()
+        if layer.crs().isValid() and dest_crs.isValid() and layer.crs() != dest_crs:
+            try:
+                transform = QgsCoordinateTransform(
+                    layer.crs(), dest_crs, QgsProject.instance())
+                layer_extent = transform.transformBoundingBox(layer_extent)
+            except QgsCsException:
+                # Cannot place it on this map; style it rather than guess.
+                return True
+        return layer_extent.intersects(extent)
+
+    def _forget(self, layer_ids):
+        for layer_id in layer_ids:
+            self._pending.pop(layer_id, None)
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def shutdown(self):
+        """
+        Disconnect from the canvas and project and drop the watch list;
+        layers still waiting keep their placeholder renderer.
+        """
+        canvas, self._canvas = self._canvas, None
+        self._pending.clear()
+        if canvas is None:
+            return
+        project = QgsProject.instance()
+        for signal, slot in (
+            (canvas.extentsChanged, self.check),
+            (project.layerTreeRoot().visibilityChanged, self.check),
+            (project.layersWillBeRemoved, self._forget),
+        ):
+            try:
+                signal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass
+
+
+_LAZY_STYLER = _LazyStyler()
+
 
 class ZipProcessor:
     def __init__(self):
@@ -105,94 +685,141 @@ class ZipProcessor:
         if not os.path.exists(self.extract_root):
             os.makedirs(self.extract_root)
 
+        # One canonical copy per unique PNG content, shared by every sheet.
+        self.symbol_store = None
+        if SYMBOL_STORE_ENABLED:
+            self.symbol_store = os.path.join(
+                self.extract_root, SYMBOL_STORE_DIR_NAME)
+            try:
+                os.makedirs(self.symbol_store, exist_ok=True)
+            except OSError:
+                self.symbol_store = None
+
+        self.build_spatial_index = BUILD_SPATIAL_INDEX
+        self._index_tasks = []
+
+        # Layer-definition snapshots of fully styled sheet groups.
+        self.snapshot_dir = None
+        if SNAPSHOT_CACHE and REUSE_EXTRACTIONS:
+            self.snapshot_dir = os.path.join(self.extract_root, SNAPSHOT_DIR_NAME)
+            try:
+                os.makedirs(self.snapshot_dir, exist_ok=True)
+            except OSError:
+                self.snapshot_dir = None
+
+        # Relinked sidecar QMLs, reused across loads of the same sheet.
+        self.style_cache = os.path.join(self.extract_root, STYLE_CACHE_DIR_NAME)
+        try:
+            os.makedirs(self.style_cache, exist_ok=True)
+        except OSError:
+            self.style_cache = None
+
     @staticmethod
     def _normalize_token(text):
-        if text is None:
-            return ""
-        normalized = unicodedata.normalize("NFC", str(text)).strip()
-        if not normalized:
-            return ""
-        normalized = normalized.casefold()
-        normalized = re.sub(r"[\s_\-./]+", "", normalized)
-        return normalized
+        return _normalize_token(text)
 
     @staticmethod
     def _redecode_variants(text):
         """
         Recover common mojibake cases caused by wrong codec assumptions.
         """
-        variants = set()
-        if not text:
-            return variants
-
-        codec_pairs = [
-            ("latin1", "utf-8"),
-            ("cp1252", "utf-8"),
-            ("latin1", "cp949"),
-            ("cp1252", "cp949"),
-            ("latin1", "euc-kr"),
-            ("cp1252", "euc-kr"),
-            ("utf-8", "cp949"),
-            ("cp949", "utf-8")
-        ]
-
-        for src_codec, dst_codec in codec_pairs:
-            try:
-                converted = text.encode(src_codec).decode(dst_codec)
-            except (LookupError, UnicodeEncodeError, UnicodeDecodeError, ValueError):
-                converted = None
-
-            if converted and converted != text:
-                variants.add(converted)
-
-        return variants
+        return _redecode_variants(text)
 
     def _value_candidates(self, value):
         """
         Build multiple comparable keys from a field value/symbol name.
         This absorbs region prefixes and small text-format differences.
+        Results are memoized per session (see candidate_cache_stats()).
         """
         if value is None:
-            return set()
+            return frozenset()
 
         raw = unicodedata.normalize("NFC", str(value)).strip()
         if not raw:
-            return set()
+            return frozenset()
 
-        candidates = set()
+        return _candidate_keys(raw)
 
-        def add_candidate(text):
-            token = self._normalize_token(text)
-            if token:
-                candidates.add(token)
+    @staticmethod
+    def candidate_cache_stats():
+        """
+        Return (hits, misses, currsize, maxsize) of the session-wide
+        candidate-key cache.
+        """
+        info = _candidate_keys.cache_info()
+        return info.hits, info.misses, info.currsize, info.maxsize
 
-        source_values = {raw}
-        source_values.update(self._redecode_variants(raw))
+    @staticmethod
+    def symbol_factory_stats():
+        """
+        Return (built, reused, prototypes) of the session-wide raster symbol cache.
+        """
+        return _SYMBOL_FACTORY.stats()
 
-        for src in source_values:
-            add_candidate(src)
-            add_candidate(src.replace(" ", ""))
-            add_candidate(src.replace("_", ""))
-            add_candidate(src.replace("-", ""))
-            add_candidate(re.sub(r"\(.*?\)|\[.*?\]", "", src).strip())
+    def _log_symbol_factory_stats(self, context):
+        built, reused, prototypes = self.symbol_factory_stats()
+        QgsMessageLog.logMessage(
+            f"{context}: raster symbols built {built}, reused {reused} ({prototypes} prototype(s) cached)",
+            "KIGAM Plugin",
+            Qgis.MessageLevel.Info
+        )
 
-            # Remove common map index prefixes like FF23_, GF03_, etc.
-            add_candidate(re.sub(r"^[A-Za-z]{1,4}\d{2,3}_", "", src))
+    def _log_candidate_cache_stats(self, context):
+        hits, misses, currsize, maxsize = self.candidate_cache_stats()
+        lookups = hits + misses
+        hit_rate = (100.0 * hits / lookups) if lookups else 0.0
+        QgsMessageLog.logMessage(
+            f"{context}: candidate-key cache {hits} hit(s) / {misses} miss(es) "
+            f"({hit_rate:.1f}% hit rate, {currsize}/{maxsize} entries)",
+            "KIGAM Plugin",
+            Qgis.MessageLevel.Info
+        )
 
-            if "_" in src:
-                add_candidate(src.split("_")[-1])
-            if "-" in src:
-                add_candidate(src.split("-")[-1])
-            if "/" in src:
-                add_candidate(src.split("/")[-1])
+    def _canonical_symbol_path(self, png_path):
+        """
+        Map a sheet's sym/ PNG to its canonical copy in the shared symbol
+        store (<sha1>.png), so every sheet's categories point at one file
+        per unique image and QGIS decodes/caches it once. The sheet's own
+        copy is replaced with a hard link to the canonical file when the
+        filesystem allows it. Falls back to *png_path* on any error.
+        """
+        if not self.symbol_store:
+            return png_path
 
-        return candidates
+        digest = _file_content_hash(png_path)
+        if not digest:
+            return png_path
+
+        canonical = os.path.join(self.symbol_store, f"{digest}.png")
+        if not os.path.exists(canonical):
+            tmp_path = f"{canonical}.{os.getpid()}.tmp"
+            try:
+                shutil.copyfile(png_path, tmp_path)
+                os.replace(tmp_path, canonical)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+                return png_path
+
+        try:
+            if not os.path.samefile(png_path, canonical):
+                link_path = f"{png_path}.kigam_link"
+                os.link(canonical, link_path)
+                os.replace(link_path, png_path)
+        except OSError:
+            pass
+
+        return canonical
 
     def _build_symbol_index(self, sym_path):
         """
         Returns:
         - raw name -> png path
         - normalized candidate -> png path
+        Paths point into the shared symbol store when it is enabled.
         """
         raw_map = {}
         normalized_map = {}
@@ -202,7 +829,8 @@ class ZipProcessor:
                 continue
 
             symbol_name = os.path.splitext(file_name)[0]
-            png_path = os.path.join(sym_path, file_name)
+            png_path = self._canonical_symbol_path(
+                os.path.join(sym_path, file_name))
             raw_map[symbol_name] = png_path
 
             for key in self._value_candidates(symbol_name):
@@ -234,41 +862,46 @@ class ZipProcessor:
         Parse sidecar QML and extract:
         - categorized field name (renderer attr)
         - category value -> image stem mapping
+        Parsed mappings are cached per QML content hash for the session.
         """
         if not qml_path or not os.path.exists(qml_path):
             return None, {}
 
+        qml_digest = _file_content_hash(qml_path)
+        cached = _QML_MAPPING_CACHE.get(qml_digest) if qml_digest else None
+        if cached is not None:
+            return cached[0], dict(cached[1])
+
+        field_name, value_to_image = ZipProcessor._read_qml_mapping(qml_path)
+        if qml_digest:
+            _QML_MAPPING_CACHE[qml_digest] = (field_name, dict(value_to_image))
+        return field_name, value_to_image
+
+    @staticmethod
+    def _read_qml_mapping(qml_path):
         try:
-            tree = ET.parse(qml_path)
-            root = tree.getroot()
+            renderer = qml_stream.read_renderer(qml_path)
         except Exception:
             return None, {}
 
-        renderer = root.find(".//renderer-v2")
-        if renderer is None or renderer.get("type") != "categorizedSymbol":
+        if renderer is None or renderer.type != "categorizedSymbol":
             return None, {}
 
-        field_name = (renderer.get("attr") or "").strip() or None
+        field_name = (renderer.attr or "").strip() or None
 
         symbol_to_image = {}
-        for symbol_node in renderer.findall("./symbols/symbol"):
-            symbol_id = symbol_node.get("name")
+        for symbol_id, image_value in renderer.symbol_images:
             if not symbol_id:
                 continue
 
-            image_prop = symbol_node.find(".//prop[@k='imageFile']")
-            if image_prop is None:
-                continue
-
-            image_value = (image_prop.get("v") or "").replace("\\", "/")
+            image_value = (image_value or "").replace("\\", "/")
             image_name = os.path.basename(image_value)
             image_stem = os.path.splitext(image_name)[0].strip()
             if image_stem:
                 symbol_to_image[symbol_id] = image_stem
 
         value_to_image = {}
-        for category_node in renderer.findall("./categories/category"):
-            symbol_id = category_node.get("symbol")
+        for value, symbol_id in renderer.categories:
             if not symbol_id:
                 continue
 
@@ -276,7 +909,7 @@ class ZipProcessor:
             if not image_stem:
                 continue
 
-            value = (category_node.get("value") or "").strip()
+            value = (value or "").strip()
             value_to_image[value] = image_stem
 
         return field_name, value_to_image
@@ -312,6 +945,53 @@ class ZipProcessor:
 
         return self._resolve_symbol_path(raw_value, raw_sym_files, normalized_sym_files)
 
+    def _build_match_index(
+        self,
+        raw_sym_files,
+        normalized_sym_files,
+        qml_value_to_image,
+        qml_normalized_map
+    ):
+        return _SymbolMatchIndex(
+            self,
+            raw_sym_files,
+            normalized_sym_files,
+            qml_value_to_image,
+            qml_normalized_map
+        )
+
+    @staticmethod
+    def _is_matchable_field(field, has_numeric_keys):
+        """
+        Fields whose type can never produce a PNG stem are skipped up front:
+        dates/binary always, numeric fields only when no symbol stem (or QML
+        category value) is numeric.
+        """
+        type_name = (field.typeName() or "").strip().lower()
+        if type_name in UNMATCHABLE_FIELD_TYPE_NAMES:
+            return False
+
+        try:
+            is_numeric = bool(field.isNumeric())
+        except Exception:
+            is_numeric = type_name in ("integer", "integer64", "int", "real", "double", "float")
+        if is_numeric and not has_numeric_keys:
+            return False
+        return True
+
+    @staticmethod
+    def _sample_unique_values(layer, idx):
+        """
+        Return (values, sampled). High-cardinality fields (ID columns, free
+        text) are capped at SYMBOL_MATCH_SAMPLE_SIZE distinct values.
+        """
+        unique_values = layer.uniqueValues(idx, SYMBOL_MATCH_SAMPLE_SIZE + 1)
+        if len(unique_values) <= SYMBOL_MATCH_SAMPLE_SIZE:
+            return list(unique_values), False
+
+        ordered = sorted(unique_values, key=lambda v: "" if v is None else str(v))
+        return ordered[:SYMBOL_MATCH_SAMPLE_SIZE], True
+
     def _find_best_matching_field(
         self,
         layer,
@@ -319,14 +999,32 @@ class ZipProcessor:
         normalized_sym_files,
         qml_field,
         qml_value_to_image,
-        qml_normalized_map
+        qml_normalized_map,
+        match_index=None
     ):
+        """
+        Pick the field whose values resolve to the most sym/ PNGs.
+
+        Fields are scored in priority order (QML renderer attr, then
+        SYMBOL_PRIORITY_FIELDS, then the rest). Scoring stops as soon as a
+        field resolves to every symbol, and a field is abandoned once its
+        remaining values can no longer beat the current best.
+        """
+        if match_index is None:
+            match_index = self._build_match_index(
+                raw_sym_files,
+                normalized_sym_files,
+                qml_value_to_image,
+                qml_normalized_map
+            )
+
         best_field = None
         max_matches = -1
         best_value_count = 0
 
+        fields = layer.fields()
         priority_fields = list(SYMBOL_PRIORITY_FIELDS)
-        all_fields = [f.name() for f in layer.fields()]
+        all_fields = [f.name() for f in fields]
 
         if qml_field and qml_field in all_fields:
             priority_fields = [qml_field] + \
@@ -335,30 +1033,46 @@ class ZipProcessor:
         sorted_fields = [f for f in priority_fields if f in all_fields] + \
             [f for f in all_fields if f not in priority_fields]
 
+        symbol_total = match_index.symbol_count
         for field_name in sorted_fields:
-            idx = layer.fields().indexOf(field_name)
+            idx = fields.indexOf(field_name)
             if idx < 0:
                 continue
+            if not self._is_matchable_field(fields.at(idx), match_index.has_numeric_keys):
+                continue
 
-            unique_values = layer.uniqueValues(idx)
+            unique_values, sampled = self._sample_unique_values(layer, idx)
             value_count = len(unique_values)
-            matches = 0
+            # Ties keep the earlier (higher-priority) field, so a field with
+            # no more values than the current best cannot win.
+            if value_count <= max_matches:
+                continue
 
+            matches = 0
+            matched_symbols = set()
+            remaining = value_count
             for val in unique_values:
-                png_path = self._resolve_symbol_with_qml_map(
-                    val,
-                    qml_value_to_image,
-                    qml_normalized_map,
-                    raw_sym_files,
-                    normalized_sym_files
-                )
+                remaining -= 1
+                png_path = match_index.resolve(val)
                 if png_path:
                     matches += 1
+                    matched_symbols.add(png_path)
+                elif matches + remaining <= max_matches:
+                    break
 
             if matches > max_matches:
                 max_matches = matches
                 best_field = field_name
                 best_value_count = value_count
+                if sampled:
+                    QgsMessageLog.logMessage(
+                        f"{layer.name()}: field '{field_name}' scored on a sample of {value_count} values",
+                        "KIGAM Plugin",
+                        Qgis.MessageLevel.Info
+                    )
+
+            if symbol_total and len(matched_symbols) >= symbol_total:
+                break
 
         return best_field, max_matches, best_value_count
 
@@ -379,44 +1093,27 @@ class ZipProcessor:
           commonly appear when CP949/EUC-KR bytes are mis-decoded as UTF-8,
           or when UTF-8 bytes are mis-decoded as CP949.
         A higher score means the text looks more plausible for the encoding.
+        Per-codepoint weights live in _TEXT_QUALITY_TABLE.
         """
         if not text:
             return 0
-        score = 0
-        for ch in text:
-            cp = ord(ch)
-            if 0xAC00 <= cp <= 0xD7A3:   # Hangul syllables — very good
-                score += 3
-            elif 0x1100 <= cp <= 0x11FF:  # Hangul Jamo
-                score += 2
-            elif 0x3130 <= cp <= 0x318F:  # Hangul Compatibility Jamo
-                score += 2
-            elif 0x4E00 <= cp <= 0x9FFF:  # CJK Unified Ideographs
-                score += 1
-            elif 0x20 <= cp <= 0x7E:      # Normal printable ASCII
-                score += 1
-            elif 0xC0 <= cp <= 0xFF:      # Latin Extended — mojibake indicator
-                score -= 2
-            elif 0x80 <= cp <= 0x9F:      # C1 control chars — strong mojibake
-                score -= 4
-            elif cp == 0xFFFD:            # Unicode replacement char — failed decode
-                score -= 5
-        return score
+        return _score_text_batch((text,))
 
     @classmethod
     def _layer_text_score(cls, layer, max_fields=10, max_values=30):
         """
         Sample string field values from *layer* and return an aggregate
-        text-quality score using _score_text_quality().
+        text-quality score (same weights as _score_text_quality()).
         Only the first *max_fields* string fields and *max_values* unique
-        values per field are examined to keep this fast.
+        values per field are examined, and the whole sample is scored as
+        one batch.
         """
-        total = 0
         string_fields = [
             f.name() for f in layer.fields()
             if f.typeName().lower() in ("string", "varchar", "text", "character")
                or str(f.type()) in ("10",)  # QVariant.String == 10
         ]
+        samples = []
         for field_name in string_fields[:max_fields]:
             idx = layer.fields().indexOf(field_name)
             if idx < 0:
@@ -424,8 +1121,8 @@ class ZipProcessor:
             for val in list(layer.uniqueValues(idx))[:max_values]:
                 if val is None:
                     continue
-                total += cls._score_text_quality(str(val))
-        return total
+                samples.append(str(val))
+        return _score_text_batch(samples)
 
     def _load_layer_with_best_encoding(self, shp_path, layer_name, sym_path=None, qml_path=None):
         raw_sym_files, normalized_sym_files = self._build_symbol_index(
@@ -438,6 +1135,13 @@ class ZipProcessor:
                 if candidate not in qml_normalized_map:
                     qml_normalized_map[candidate] = image_stem
 
+        match_index = self._build_match_index(
+            raw_sym_files,
+            normalized_sym_files,
+            qml_value_to_image,
+            qml_normalized_map
+        ) if raw_sym_files else None
+
         candidate_encodings = list(CANDIDATE_ENCODINGS)
         best_layer = None
         best_encoding = None
@@ -459,7 +1163,8 @@ class ZipProcessor:
                     normalized_sym_files,
                     qml_field,
                     qml_value_to_image,
-                    qml_normalized_map
+                    qml_normalized_map,
+                    match_index=match_index
                 )
             else:
                 field_name, matches, total_values = (None, 0, 0)
@@ -485,42 +1190,109 @@ class ZipProcessor:
         return best_layer, best_encoding, best_field, best_matches, best_total_values
 
     def _build_relinked_qml(self, qml_path, raw_sym_files, normalized_sym_files):
+        """
+        Stream the sidecar QML into <name>_kigam_relinked.qml, rewriting only
+        imageFile values that resolve to a PNG in the symbol index.
+        Results are cached in the style cache folder, keyed on the QML
+        content and the resolved symbol paths, so reloading a sheet reuses
+        the earlier output without any XML work.
+        """
         if not qml_path or not os.path.exists(qml_path):
             return None, 0, 0
 
-        try:
-            tree = ET.parse(qml_path)
-            root = tree.getroot()
-        except Exception:
-            return None, 0, 0
-
-        total_image_props = 0
-        relinked_count = 0
-        for prop in root.findall(".//prop[@k='imageFile']"):
-            total_image_props += 1
-            image_value = (prop.get("v") or "").replace("\\", "/")
+        def relink(image_value):
+            image_value = (image_value or "").replace("\\", "/")
             image_name = os.path.basename(image_value)
             image_stem = os.path.splitext(image_name)[0].strip()
             if not image_stem:
-                continue
+                return None
 
             png_path = self._resolve_symbol_path(
                 image_stem, raw_sym_files, normalized_sym_files)
             if not png_path:
-                continue
+                return None
+            return png_path.replace("\\", "/")
+
+        qml_digest = _file_content_hash(qml_path)
+        if not qml_digest or not self.style_cache:
+            try:
+                return self._write_relinked_qml(
+                    qml_path,
+                    os.path.join(
+                        os.path.dirname(qml_path),
+                        f"{os.path.splitext(os.path.basename(qml_path))[0]}_kigam_relinked.qml"
+                    ),
+                    relink
+                )
+            except Exception:
+                return None, 0, 0
+
+        # The relinked output depends on the QML content, the resolved symbol
+        # paths (canonical store paths when the symbol store is enabled) and
+        # the write encoding.
+        hasher = hashlib.sha1()
+        hasher.update(qml_digest.encode("ascii"))
+        hasher.update(QML_WRITE_ENCODING.encode("utf-8"))
+        hasher.update(str(self.symbol_store).encode("utf-8"))
+        for stem, png_path in sorted(raw_sym_files.items()):
+            hasher.update(f"\0{stem}\0{png_path}".encode("utf-8"))
+        relink_key = hasher.hexdigest()
+
+        cached = _RELINKED_QML_CACHE.get(relink_key)
+        if cached is not None and (cached[0] is None or os.path.exists(cached[0])):
+            return cached
+
+        qml_stem = os.path.splitext(os.path.basename(qml_path))[0]
+        relinked_qml = os.path.join(
+            self.style_cache, f"{qml_stem}_{relink_key[:16]}_kigam_relinked.qml")
+        counts_path = f"{os.path.splitext(relinked_qml)[0]}.json"
+
+        result = None
+        if os.path.exists(counts_path):
+            try:
+                with open(counts_path, "r", encoding="utf-8") as fp:
+                    counts = json.load(fp)
+                relinked_count = int(counts["relinked"])
+                total_image_props = int(counts["total"])
+            except (OSError, KeyError, TypeError, ValueError):
+                total_image_props = None
+            if total_image_props == 0:
+                result = (None, 0, 0)
+            elif total_image_props and os.path.exists(relinked_qml):
+                result = (relinked_qml, relinked_count, total_image_props)
+
+        if result is None:
+            try:
+                result = self._write_relinked_qml(qml_path, relinked_qml, relink)
+            except Exception:
+                # Record no counts for a failed relink so the next load retries.
+                return None, 0, 0
+            try:
+                with open(counts_path, "w", encoding="utf-8") as fp:
+                    json.dump({"relinked": result[1], "total": result[2]}, fp)
+            except OSError:
+                pass
 
-            prop.set("v", png_path.replace("\\", "/"))
-            relinked_count += 1
+        _RELINKED_QML_CACHE[relink_key] = result
+        return result
+
+    @staticmethod
+    def _write_relinked_qml(qml_path, relinked_qml, relink):
+        """
+        Relink *qml_path* into *relinked_qml*. Returns (path, relinked,
+        total), with no path when the QML has no imageFile values; parse
+        and write errors propagate to the caller.
+        """
+        total_image_props, relinked_count = qml_stream.relink_image_files(
+            qml_path, relinked_qml, relink, encoding=QML_WRITE_ENCODING)
 
         if total_image_props == 0:
+            try:
+                os.remove(relinked_qml)
+            except OSError:
+                pass
             return None, 0, 0
 
-        relinked_qml = os.path.join(
-            os.path.dirname(qml_path),
-            f"{os.path.splitext(os.path.basename(qml_path))[0]}_kigam_relinked.qml"
-        )
-        tree.write(relinked_qml, encoding=QML_WRITE_ENCODING,
-                   xml_declaration=True)
         return relinked_qml, relinked_count, total_image_props
 
     @staticmethod
@@ -553,6 +1325,456 @@ class ZipProcessor:
             suffix += 1
         return unique_group_name
 
+    def _reused_extract_dir(self, zip_path, safe_prefix):
+        return os.path.join(
+            self.extract_root, f"{safe_prefix}_{_zip_identity(zip_path)[:12]}")
+
+    def plan_batch(self, zip_paths):
+        """
+        Read the central directory of every ZIP before anything is
+        extracted: shapefile members, sidecar QMLs, sym/ assets and
+        uncompressed size. Sheets whose members (names and CRCs) repeat an
+        earlier ZIP are marked as duplicates; unreadable ZIPs, ZIPs without
+        shapefiles and ZIPs that would overflow the temp drive (keeping
+        temp_space_margin_mb free) are refused. Returns a LoadPlan.
+        """
+        try:
+            free_bytes = shutil.disk_usage(self.extract_root).free
+        except OSError:
+            free_bytes = None
+        plan = LoadPlan(sheets=[], free_bytes=free_bytes)
+
+        budget = None
+        if free_bytes is not None:
+            budget = free_bytes - TEMP_SPACE_MARGIN_MB * 1024 * 1024
+        seen = {}
+        for zip_path in zip_paths:
+            sheet = SheetPlan(zip_path=zip_path)
+            plan.sheets.append(sheet)
+            if not os.path.exists(zip_path):
+                sheet.refused = "file not found"
+                continue
+            try:
+                _scan_zip_members(sheet)
+            except (OSError, zipfile.BadZipFile) as e:
+                sheet.refused = f"unreadable ZIP ({e})"
+                continue
+
+            if not sheet.shapefiles:
+                sheet.refused = "no shapefiles"
+                continue
+            if sheet.signature in seen:
+                sheet.duplicate_of = seen[sheet.signature]
+                continue
+            seen[sheet.signature] = zip_path
+
+            sheet.reused = REUSE_EXTRACTIONS and os.path.exists(os.path.join(
+                self._reused_extract_dir(zip_path, _safe_prefix(zip_path)),
+                EXTRACT_MARKER_NAME))
+            if budget is not None:
+                if sheet.extract_bytes > budget:
+                    sheet.refused = (
+                        f"needs {sheet.extract_bytes / 1048576:.0f} MB, "
+                        f"{max(budget, 0) / 1048576:.0f} MB left on the temp drive")
+                    continue
+                budget -= sheet.extract_bytes
+
+        QgsMessageLog.logMessage(
+            f"Load plan: {len(plan.to_load)}/{len(plan.sheets)} ZIP(s), "
+            f"{plan.total_bytes / 1048576:.1f} MB uncompressed, "
+            f"{plan.extract_bytes / 1048576:.1f} MB to extract",
+            "KIGAM Plugin",
+            Qgis.MessageLevel.Info
+        )
+        return plan
+
+    def _extract_zip(self, zip_path, safe_prefix):
+        """
+        Extract *zip_path* and return the folder. With reuse_extractions the
+        folder is keyed on the ZIP identity and kept between loads, so files
+        derived from the extraction (.qix indexes, ...) are built only once.
+        """
+        if not REUSE_EXTRACTIONS:
+            # Keep a unique extraction folder per load so symbol file paths remain valid.
+            extract_dir = tempfile.mkdtemp(
+                prefix=f"{safe_prefix}_", dir=self.extract_root)
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                zip_ref.extractall(extract_dir)
+            return extract_dir
+
+        extract_dir = self._reused_extract_dir(zip_path, safe_prefix)
+        if os.path.exists(os.path.join(extract_dir, EXTRACT_MARKER_NAME)):
+            QgsMessageLog.logMessage(
+                f"Reusing cached extraction: {extract_dir}",
+                "KIGAM Plugin",
+                Qgis.MessageLevel.Info
+            )
+            return extract_dir
+
+        # Extract into a staging folder and move it into place only when
+        # complete, so an interrupted extraction is never mistaken for a cached one.
+        staging_dir = tempfile.mkdtemp(
+            prefix=f"{safe_prefix}_", dir=self.extract_root)
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(staging_dir)
+        with open(os.path.join(staging_dir, EXTRACT_MARKER_NAME), "w", encoding="utf-8") as fp:
+            json.dump({"zip_path": os.path.abspath(zip_path)}, fp)
+
+        if os.path.exists(extract_dir):
+            shutil.rmtree(extract_dir, ignore_errors=True)
+        try:
+            os.replace(staging_dir, extract_dir)
+        except OSError:
+            return staging_dir
+        return extract_dir
+
+    def _schedule_spatial_indexes(self, layers, context):
+        """
+        Build missing .qix spatial indexes for *layers* in a background
+        QgsTask. Indexes are stored next to the shapefiles, so a reused
+        extraction never rebuilds them.
+        """
+        if not self.build_spatial_index:
+            return None
+
+        shp_paths = []
+        for layer in layers:
+            shp_path = layer.source().split("|", 1)[0]
+            if not shp_path.lower().endswith(".shp"):
+                continue
+            if os.path.exists(f"{os.path.splitext(shp_path)[0]}.qix"):
+                continue
+            shp_paths.append(shp_path)
+        if not shp_paths:
+            return None
+
+        def on_finished(exception, timings=None):
+            if exception is not None:
+                QgsMessageLog.logMessage(
+                    f"{context}: spatial index build failed: {exception}",
+                    "KIGAM Plugin",
+                    Qgis.MessageLevel.Warning
+                )
+            for shp_path, ok, seconds, error in timings or []:
+                name = os.path.splitext(os.path.basename(shp_path))[0]
+                QgsMessageLog.logMessage(
+                    f"{name}: spatial index built in {seconds:.2f}s" if ok else
+                    f"{name}: spatial index not built ({error})",
+                    "KIGAM Plugin",
+                    Qgis.MessageLevel.Info if ok else Qgis.MessageLevel.Warning
+                )
+            if task in self._index_tasks:
+                self._index_tasks.remove(task)
+
+        task = QgsTask.fromFunction(
+            f"KIGAM spatial index: {context}",
+            _build_spatial_indexes,
+            shp_paths,
+            on_finished=on_finished
+        )
+        # Hold a reference until the task manager is done with it.
+        self._index_tasks.append(task)
+        QgsApplication.taskManager().addTask(task)
+        return task
+
+    @staticmethod
+    def _sheet_geopackage_paths(extract_dir, safe_prefix):
+        gpkg_path = os.path.join(extract_dir, f"{safe_prefix}.gpkg")
+        return gpkg_path, f"{gpkg_path}.json"
+
+    def _open_sheet_geopackage(self, extract_dir, safe_prefix):
+        """
+        Open every layer of a previously consolidated sheet GeoPackage.
+        Encoding is already UTF-8 and the style loads from layer_styles, so
+        no encoding trials or symbol matching are needed. Returns [] when
+        there is no complete GeoPackage for this extraction.
+        """
+        gpkg_path, manifest_path = self._sheet_geopackage_paths(
+            extract_dir, safe_prefix)
+        if not os.path.exists(gpkg_path) or not os.path.exists(manifest_path):
+            return []
+
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as fp:
+                layer_names = list(json.load(fp).get("layers", []))
+        except (OSError, TypeError, ValueError, AttributeError):
+            return []
+
+        layers = []
+        for layer_name in layer_names:
+            layer = QgsVectorLayer(
+                f"{gpkg_path}|layername={layer_name}", layer_name, "ogr")
+            if not layer.isValid():
+                QgsMessageLog.logMessage(
+                    f"Sheet GeoPackage layer '{layer_name}' is invalid, reloading from shapefiles",
+                    "KIGAM Plugin",
+                    Qgis.MessageLevel.Warning
+                )
+                return []
+            layers.append(layer)
+
+        QgsMessageLog.logMessage(
+            f"Loaded {len(layers)} layer(s) from sheet GeoPackage {gpkg_path}",
+            "KIGAM Plugin",
+            Qgis.MessageLevel.Info
+        )
+        return layers
+
+    def _write_sheet_geopackage(self, extract_dir, safe_prefix, layers):
+        """
+        Consolidate a freshly loaded sheet into one GeoPackage: features are
+        written as UTF-8 using each layer's resolved encoding, the GPKG driver
+        builds an R-tree per table, and the current style (renderer and
+        labels) is saved as the default in layer_styles. The staging file is
+        written in rollback-journal mode and every handle on it is dropped
+        before it is renamed into place.
+        """
+        from osgeo import gdal
+        from qgis.PyQt.QtXml import QDomDocument
+
+        gpkg_path, manifest_path = self._sheet_geopackage_paths(
+            extract_dir, safe_prefix)
+        staging_path = f"{gpkg_path}.{os.getpid()}.tmp.gpkg"
+        started = time.perf_counter()
+        transform_context = QgsProject.instance().transformContext()
+
+        # WAL mode would leave -wal/-shm files (and SQLite handles) attached to
+        # the staging path; a rollback journal is removed on each commit.
+        previous_journal = gdal.GetConfigOption("OGR_SQLITE_JOURNAL")
+        gdal.SetConfigOption("OGR_SQLITE_JOURNAL", "DELETE")
+        layer_names = []
+        gpkg_layer = None
+        try:
+            for layer in layers:
+                layer_name = layer.name()
+                suffix = 2
+                while layer_name in layer_names:
+                    layer_name = f"{layer.name()}_{suffix}"
+                    suffix += 1
+
+                options = QgsVectorFileWriter.SaveVectorOptions()
+                options.driverName = "GPKG"
+                options.layerName = layer_name
+                options.fileEncoding = "UTF-8"
+                options.actionOnExistingFile = (
+                    QgsVectorFileWriter.ActionOnExistingFile.CreateOrOverwriteLayer
+                    if layer_names else
+                    QgsVectorFileWriter.ActionOnExistingFile.CreateOrOverwriteFile
+                )
+                if hasattr(QgsVectorFileWriter, "writeAsVectorFormatV3"):
+                    result = QgsVectorFileWriter.writeAsVectorFormatV3(
+                        layer, staging_path, transform_context, options)
+                else:
+                    result = QgsVectorFileWriter.writeAsVectorFormatV2(
+                        layer, staging_path, transform_context, options)
+                if result[0] != QgsVectorFileWriter.WriterError.NoError:
+                    raise RuntimeError(f"{layer.name()}: {result[1]}")
+
+                gpkg_layer = QgsVectorLayer(
+                    f"{staging_path}|layername={layer_name}", layer_name, "ogr")
+                style_doc = QDomDocument()
+                layer.exportNamedStyle(style_doc)
+                gpkg_layer.importNamedStyle(style_doc)
+                gpkg_layer.saveStyleToDatabase(
+                    layer_name, "KIGAM for Archaeology", True, "")
+                # Deleting the layer closes its provider's dataset.
+                gpkg_layer = None
+                layer_names.append(layer_name)
+
+            os.replace(staging_path, gpkg_path)
+            with open(manifest_path, "w", encoding="utf-8") as fp:
+                json.dump({"layers": layer_names}, fp, ensure_ascii=False)
+        except Exception as e:
+            QgsMessageLog.logMessage(
+                f"Failed to write sheet GeoPackage {gpkg_path}: {e}",
+                "KIGAM Plugin",
+                Qgis.MessageLevel.Warning
+            )
+            gpkg_layer = None
+            for path in (staging_path, f"{staging_path}-journal", f"{staging_path}-wal", f"{staging_path}-shm"):
+                if os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            return None
+        finally:
+            gdal.SetConfigOption("OGR_SQLITE_JOURNAL", previous_journal)
+
+        QgsMessageLog.logMessage(
+            f"Wrote sheet GeoPackage {gpkg_path} ({len(layer_names)} layer(s), "
+            f"{time.perf_counter() - started:.2f}s)",
+            "KIGAM Plugin",
+            Qgis.MessageLevel.Info
+        )
+        return gpkg_path
+
+    def _snapshot_path(self, zip_path, extract_dir, safe_prefix, font_family, font_size):
+        """
+        Path of the .qlr snapshot for this ZIP, keyed on its content hash,
+        the extraction folder the snapshot points into, the label font and
+        every config value that changes the styled result. None when
+        snapshots are disabled.
+        """
+        if self.snapshot_dir is None:
+            return None
+        zip_digest = _file_content_hash(zip_path)
+        if zip_digest is None:
+            return None
+
+        settings = {
+            "format": SNAPSHOT_FORMAT_VERSION,
+            "zip": zip_digest,
+            "extract_dir": os.path.normcase(os.path.abspath(extract_dir)),
+            "font": [font_family, font_size],
+            "symbol_priority_fields": SYMBOL_PRIORITY_FIELDS,
+            "candidate_encodings": CANDIDATE_ENCODINGS,
+            "encoding_preference": ENCODING_PREFERENCE,
+            "qml_write_encoding": QML_WRITE_ENCODING,
+            "fill_symbol_width": FILL_SYMBOL_WIDTH,
+            "marker_symbol_size": MARKER_SYMBOL_SIZE,
+            "reference_layer_keywords": REFERENCE_LAYER_KEYWORDS,
+            "litho_layer_keyword": LITHO_LAYER_KEYWORD,
+            "label_field_candidates": LABEL_FIELD_CANDIDATES,
+            "symbol_match_sample_size": SYMBOL_MATCH_SAMPLE_SIZE,
+            "symbol_store": self.symbol_store,
+            "consolidate_geopackage": CONSOLIDATE_GEOPACKAGE,
+        }
+        key = hashlib.sha1(json.dumps(
+            settings, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        return os.path.join(self.snapshot_dir, f"{safe_prefix}_{key[:16]}.qlr")
+
+    def _restore_snapshot(self, snapshot_path, group):
+        """
+        Load a sheet snapshot into *group*. Returns the restored layers, or
+        [] (with *group* emptied) when the snapshot is missing or unusable.
+        """
+        if not snapshot_path or not os.path.exists(snapshot_path):
+            return []
+
+        ok, error = QgsLayerDefinition.loadLayerDefinition(
+            snapshot_path, QgsProject.instance(), group)
+        layers = [node.layer() for node in group.findLayers()]
+        if ok and layers and all(layer is not None and layer.isValid() for layer in layers):
+            QgsMessageLog.logMessage(
+                f"Restored {len(layers)} layer(s) from snapshot {snapshot_path}",
+                "KIGAM Plugin",
+                Qgis.MessageLevel.Info
+            )
+            return layers
+
+        QgsMessageLog.logMessage(
+            f"Ignoring unusable snapshot {snapshot_path}: {error or 'invalid layers'}",
+            "KIGAM Plugin",
+            Qgis.MessageLevel.Warning
+        )
+        QgsProject.instance().removeMapLayers(
+            [layer.id() for layer in layers if layer is not None])
+        group.removeAllChildren()
+        try:
+            os.remove(snapshot_path)
+        except OSError:
+            pass
+        return []
+
+    @staticmethod
+    def _write_snapshot(snapshot_path, group):
+        staging_path = f"{snapshot_path}.{os.getpid()}.tmp.qlr"
+        ok, error = QgsLayerDefinition.exportLayerDefinition(
+            staging_path, group.children())
+        if ok:
+            try:
+                os.replace(staging_path, snapshot_path)
+            except OSError as e:
+                ok, error = False, str(e)
+        if not ok:
+            QgsMessageLog.logMessage(
+                f"Failed to write snapshot {snapshot_path}: {error}",
+                "KIGAM Plugin",
+                Qgis.MessageLevel.Warning
+            )
+            if os.path.exists(staging_path):
+                try:
+                    os.remove(staging_path)
+                except OSError:
+                    pass
+            return None
+        return snapshot_path
+
+    @staticmethod
+    def _log_encoding_choice(layer_name, used_encoding, pre_field, pre_matches, pre_total):
+        if used_encoding is None:
+            enc_label = "default"
+        else:
+            enc_label = used_encoding
+        QgsMessageLog.logMessage(
+            f"{layer_name}: loaded with encoding '{enc_label}' (pre-match {pre_matches}/{pre_total}, field={pre_field})",
+            "KIGAM Plugin",
+            Qgis.MessageLevel.Info
+        )
+
+    def _style_layer(self, layer, sym_path, qml_path, font_family, font_size):
+        # Apply Styling if sym path exists
+        if sym_path:
+            self.apply_sym_styling(layer, sym_path, qml_path)
+
+        # Apply Labeling for Litho layers
+        if LITHO_LAYER_KEYWORD in layer.name().lower():
+            self.apply_labeling(layer, font_family, font_size)
+
+    @staticmethod
+    def _apply_placeholder_renderer(layer):
+        symbol = QgsSymbol.defaultSymbol(layer.geometryType())
+        if symbol is None:
+            return
+        from qgis.PyQt.QtGui import QColor
+        symbol.setColor(QColor(160, 160, 160))
+        symbol.setOpacity(0.4)
+        layer.setRenderer(QgsSingleSymbolRenderer(symbol))
+
+    def _load_deferred_layer(self, shp_path, layer_name, sym_path, qml_path, font_family, font_size):
+        """
+        Open a shapefile once with a plain placeholder renderer and queue the
+        encoding trials, symbol matching, QML relinking and labeling for when
+        the layer is first drawn. Returns None when deferral is unavailable
+        (no map canvas) or the file does not open.
+        """
+        layer = QgsVectorLayer(shp_path, layer_name, "ogr")
+        if not layer.isValid():
+            return None
+
+        def style_fn():
+            _, used_encoding, pre_field, pre_matches, pre_total = self._load_layer_with_best_encoding(
+                shp_path,
+                layer_name,
+                sym_path=sym_path,
+                qml_path=qml_path
+            )
+            if used_encoding is not None:
+                layer.setProviderEncoding(used_encoding)
+            self._log_encoding_choice(
+                layer_name, used_encoding, pre_field, pre_matches, pre_total)
+            self._style_layer(layer, sym_path, qml_path, font_family, font_size)
+
+        if not _LAZY_STYLER.defer(layer, style_fn):
+            return None
+        self._apply_placeholder_renderer(layer)
+        return layer
+
+    @staticmethod
+    def style_visible_layers():
+        """
+        Style every deferred layer that is currently visible on the canvas.
+        Returns the number of layers still waiting.
+        """
+        _LAZY_STYLER.check()
+        return _LAZY_STYLER.pending_count()
+
+    @staticmethod
+    def shutdown_lazy_styling():
+        """Stop deferred styling; called when the plugin is unloaded."""
+        _LAZY_STYLER.shutdown()
+
     def process_zip(self, zip_path, font_family=None, font_size=10):
         """
         Extracts ZIP, loads shapefiles, and applies styling.
@@ -561,21 +1783,31 @@ class ZipProcessor:
             font_family = DEFAULT_FONT_FAMILY
 
         zip_basename = os.path.splitext(os.path.basename(zip_path))[0]
-        safe_prefix = re.sub(r"[^A-Za-z0-9._-]+", "_",
-                             zip_basename).strip("_") or "kigam_map"
-        # Keep a unique extraction folder per load so symbol file paths remain valid.
-        extract_dir = tempfile.mkdtemp(
-            prefix=f"{safe_prefix}_", dir=self.extract_root)
+        safe_prefix = _safe_prefix(zip_path)
 
         # Extract ZIP
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
+            extract_dir = self._extract_zip(zip_path, safe_prefix)
         except Exception as e:
             QgsMessageLog.logMessage(
                 f"Failed to extract ZIP: {str(e)}", "KIGAM Plugin", Qgis.MessageLevel.Critical)
             return []
 
+        # A styled snapshot of this exact sheet skips all detection and matching.
+        tree_root = QgsProject.instance().layerTreeRoot()
+        snapshot_path = self._snapshot_path(
+            zip_path, extract_dir, safe_prefix, font_family, font_size)
+        if snapshot_path and os.path.exists(snapshot_path):
+            unique_group_name = self._build_unique_group_name(
+                tree_root, zip_basename)
+            target_group = tree_root.addGroup(unique_group_name)
+            restored_layers = self._restore_snapshot(snapshot_path, target_group)
+            if restored_layers:
+                target_group.setExpanded(True)
+                self._schedule_spatial_indexes(restored_layers, zip_basename)
+                return restored_layers
+            tree_root.removeChildNode(target_group)
+
         # Locate 'sym' folder
         sym_path = None
         for root, dirs, files in os.walk(extract_dir):
@@ -589,16 +1821,34 @@ class ZipProcessor:
                 "No 'sym' folder found in the ZIP.", "KIGAM Plugin", Qgis.MessageLevel.Warning)
 
         # Load Shapefiles
-        tree_root = QgsProject.instance().layerTreeRoot()
         loaded_layers = []
-        target_group = None
-        for root, dirs, files in os.walk(extract_dir):
+
+        use_geopackage = CONSOLIDATE_GEOPACKAGE and REUSE_EXTRACTIONS
+        cached_layers = self._open_sheet_geopackage(
+            extract_dir, safe_prefix) if use_geopackage else []
+        for layer in cached_layers:
+            loaded_layers.append(layer)
+
+            # Renderer comes from layer_styles; labels follow the current font choice.
+            if LITHO_LAYER_KEYWORD in layer.name().lower():
+                self.apply_labeling(layer, font_family, font_size)
+
+        deferred = 0
+        for root, dirs, files in ([] if cached_layers else os.walk(extract_dir)):
             for file in files:
                 if file.lower().endswith(".shp"):
                     shp_path = os.path.join(root, file)
                     layer_name = os.path.splitext(file)[0]
                     qml_path = os.path.join(root, f"{layer_name}.qml")
                     qml_path = qml_path if os.path.exists(qml_path) else None
+                    if LAZY_STYLING:
+                        layer = self._load_deferred_layer(
+                            shp_path, layer_name, sym_path, qml_path, font_family, font_size)
+                        if layer is not None:
+                            loaded_layers.append(layer)
+                            deferred += 1
+                            continue
+
                     layer, used_encoding, pre_field, pre_matches, pre_total = self._load_layer_with_best_encoding(
                         shp_path,
                         layer_name,
@@ -611,46 +1861,283 @@ class ZipProcessor:
                             f"Failed to load layer: {shp_path}", "KIGAM Plugin", Qgis.MessageLevel.Warning)
                         continue
 
-                    if used_encoding is None:
-                        enc_label = "default"
-                    else:
-                        enc_label = used_encoding
-                    QgsMessageLog.logMessage(
-                        f"{layer_name}: loaded with encoding '{enc_label}' (pre-match {pre_matches}/{pre_total}, field={pre_field})",
-                        "KIGAM Plugin",
-                        Qgis.MessageLevel.Info
-                    )
-
-                    if target_group is None:
-                        unique_group_name = self._build_unique_group_name(
-                            tree_root, zip_basename)
-                        target_group = tree_root.addGroup(unique_group_name)
-                        QgsMessageLog.logMessage(
-                            f"Created layer group: {unique_group_name}",
-                            "KIGAM Plugin",
-                            Qgis.MessageLevel.Info
-                        )
-
-                    # Add to project without auto-placement, then place directly in this ZIP group.
-                    # This avoids inheriting currently selected layer-tree insertion context.
-                    QgsProject.instance().addMapLayer(layer, False)
-                    target_group.addLayer(layer)
+                    self._log_encoding_choice(
+                        layer_name, used_encoding, pre_field, pre_matches, pre_total)
                     loaded_layers.append(layer)
+                    self._style_layer(layer, sym_path, qml_path, font_family, font_size)
 
-                    # Apply Styling if sym path exists
-                    if sym_path:
-                        self.apply_sym_styling(layer, sym_path, qml_path)
+        if deferred:
+            QgsMessageLog.logMessage(
+                f"{zip_basename}: styling of {deferred} layer(s) deferred until first view",
+                "KIGAM Plugin",
+                Qgis.MessageLevel.Info
+            )
+        if use_geopackage and loaded_layers and not cached_layers:
+            if deferred:
+                # Only finished styles may be saved as layer_styles defaults.
+                QgsMessageLog.logMessage(
+                    f"{zip_basename}: sheet GeoPackage not written while styling is deferred",
+                    "KIGAM Plugin",
+                    Qgis.MessageLevel.Info
+                )
+            else:
+                self._write_sheet_geopackage(extract_dir, safe_prefix, loaded_layers)
 
-                    # Apply Labeling for Litho layers
-                    if LITHO_LAYER_KEYWORD in layer_name.lower():
-                        self.apply_labeling(layer, font_family, font_size)
+        # Insert the whole sheet, already ordered, into its dedicated group.
+        if loaded_layers:
+            unique_group_name = self._build_unique_group_name(
+                tree_root, zip_basename)
+            target_group = tree_root.addGroup(unique_group_name)
+            QgsMessageLog.logMessage(
+                f"Created layer group: {unique_group_name}",
+                "KIGAM Plugin",
+                Qgis.MessageLevel.Info
+            )
+            self._insert_layers_into_group(target_group, loaded_layers)
+            # Deferred layers still carry placeholder renderers.
+            if snapshot_path and not deferred:
+                self._write_snapshot(snapshot_path, target_group)
+            self._schedule_spatial_indexes(loaded_layers, zip_basename)
+
+        self._log_candidate_cache_stats(zip_basename)
+        self._log_symbol_factory_stats(zip_basename)
+        return loaded_layers
 
-        # Reorder inside the dedicated group.
-        if target_group is not None and loaded_layers:
-            self.organize_layers(target_group, loaded_layers)
 
-        return loaded_layers
+    def _merge_categorized_renderers(self, layers):
+        """
+        One categorized renderer for a mosaic: categories of every source
+        renderer that classifies on the most common attribute, first value
+        wins. Falls back to a clone of the first layer's renderer.
+        """
+        renderers = [
+            layer.renderer() for layer in layers
+            if isinstance(layer.renderer(), QgsCategorizedSymbolRenderer)
+        ]
+        if not renderers:
+            renderer = layers[0].renderer()
+            return renderer.clone() if renderer is not None else None
+
+        attr_counts = {}
+        for renderer in renderers:
+            attr = renderer.classAttribute()
+            attr_counts[attr] = attr_counts.get(attr, 0) + 1
+        class_attr = max(attr_counts, key=attr_counts.get)
+
+        categories = []
+        seen_values = set()
+        for renderer in renderers:
+            if renderer.classAttribute() != class_attr:
+                continue
+            for category in renderer.categories():
+                key = str(category.value())
+                if key in seen_values:
+                    continue
+                seen_values.add(key)
+                categories.append(QgsRendererCategory(
+                    category.value(),
+                    category.symbol().clone(),
+                    category.label(),
+                    category.renderState()
+                ))
+
+        return QgsCategorizedSymbolRenderer(class_attr, categories)
+
+    def _write_mosaic_table(self, gpkg_path, table_name, layers, sheet_names, overwrite_file):
+        """
+        Append every feature of *layers* into one GeoPackage table with the
+        union of their fields (conflicting types become strings) plus a
+        SHEET column. Geometries are promoted to multi-part and transformed
+        to the first layer's CRS.
+        """
+        target_crs = layers[0].crs()
+        fields = QgsFields()
+        field_types = {}
+        for layer in layers:
+            for src_field in layer.fields():
+                name = src_field.name()
+                if name not in field_types:
+                    fields.append(QgsField(src_field))
+                    field_types[name] = src_field.type()
+                elif field_types[name] != src_field.type():
+                    idx = fields.indexOf(name)
+                    replaced = QgsFields()
+                    for i, existing in enumerate(fields):
+                        replaced.append(_string_field(name) if i == idx else existing)
+                    fields = replaced
+                    field_types[name] = fields.at(idx).type()
+        if fields.indexOf(MOSAIC_SHEET_FIELD) < 0:
+            fields.append(_string_field(MOSAIC_SHEET_FIELD))
+        string_type = _string_field(MOSAIC_SHEET_FIELD).type()
+
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "GPKG"
+        options.layerName = table_name
+        options.fileEncoding = "UTF-8"
+        options.actionOnExistingFile = (
+            QgsVectorFileWriter.ActionOnExistingFile.CreateOrOverwriteFile
+            if overwrite_file else
+            QgsVectorFileWriter.ActionOnExistingFile.CreateOrOverwriteLayer
+        )
+        transform_context = QgsProject.instance().transformContext()
+        writer = QgsVectorFileWriter.create(
+            gpkg_path,
+            fields,
+            QgsWkbTypes.multiType(layers[0].wkbType()),
+            target_crs,
+            transform_context,
+            options
+        )
+        if writer.hasError() != QgsVectorFileWriter.WriterError.NoError:
+            raise RuntimeError(writer.errorMessage())
+
+        sheet_idx = fields.indexOf(MOSAIC_SHEET_FIELD)
+        feature_count = 0
+        try:
+            for layer, sheet_name in zip(layers, sheet_names):
+                transform = None
+                if layer.crs() != target_crs:
+                    transform = QgsCoordinateTransform(
+                        layer.crs(), target_crs, QgsProject.instance())
+                index_map = [fields.indexOf(f.name()) for f in layer.fields()]
+
+                for source in layer.getFeatures():
+                    attributes = [None] * fields.count()
+                    for src_idx, value in enumerate(source.attributes()):
+                        dst_idx = index_map[src_idx]
+                        if dst_idx < 0:
+                            continue
+                        if fields.at(dst_idx).type() == string_type and value is not None \
+                                and not isinstance(value, str):
+                            value = None if str(value) == "NULL" else str(value)
+                        attributes[dst_idx] = value
+                    attributes[sheet_idx] = sheet_name
+
+                    geometry = source.geometry()
+                    if transform is not None and not geometry.isNull():
+                        geometry.transform(transform)
+                    if not geometry.isNull():
+                        geometry.convertToMultiType()
+
+                    feature = QgsFeature(fields)
+                    feature.setGeometry(geometry)
+                    feature.setAttributes(attributes)
+                    writer.addFeature(feature)
+                    feature_count += 1
+        finally:
+            # Deleting the writer flushes and closes the table.
+            del writer
+
+        return feature_count
+
+    def build_mosaic(self, sheet_layers, font_family=None, font_size=10):
+        """
+        Merge same-role layers of several loaded sheets into one layer per
+        theme, stored in a merged GeoPackage with a single categorized
+        renderer, and replace the per-sheet layers and groups with a mosaic
+        group.
+
+        sheet_layers: [(sheet name, [layers])] as returned by process_zip.
+        Returns the mosaic layers (empty when nothing was merged).
+        """
+        if not font_family:
+            font_family = DEFAULT_FONT_FAMILY
+
+        roles = {}
+        role_order = []
+        for sheet_name, layers in sheet_layers:
+            for layer in layers:
+                if layer is None or not layer.isValid():
+                    continue
+                # Categories are merged from final renderers.
+                _LAZY_STYLER.activate(layer)
+                role = _mosaic_role(layer)
+                if role not in roles:
+                    roles[role] = []
+                    role_order.append(role)
+                roles[role].append((sheet_name, layer))
+        if not roles:
+            return []
 
+        mosaic_dir = os.path.join(self.extract_root, MOSAIC_DIR_NAME)
+        os.makedirs(mosaic_dir, exist_ok=True)
+        # A fresh file per build: earlier mosaics may still be open in the project.
+        fd, gpkg_path = tempfile.mkstemp(prefix="mosaic_", suffix=".gpkg", dir=mosaic_dir)
+        os.close(fd)
+
+        started = time.perf_counter()
+        mosaic_layers = []
+        table_names = set()
+        for role in role_order:
+            members = roles[role]
+            layers = [layer for _, layer in members]
+            base_name = _MAP_INDEX_PREFIX_RE.sub("", layers[0].name()).strip() or layers[0].name()
+            table_name = base_name
+            suffix = 2
+            while table_name.casefold() in table_names:
+                table_name = f"{base_name}_{suffix}"
+                suffix += 1
+
+            try:
+                feature_count = self._write_mosaic_table(
+                    gpkg_path,
+                    table_name,
+                    layers,
+                    [sheet_name for sheet_name, _ in members],
+                    overwrite_file=not table_names
+                )
+            except Exception as e:
+                QgsMessageLog.logMessage(
+                    f"Mosaic: failed to merge '{base_name}': {e}",
+                    "KIGAM Plugin",
+                    Qgis.MessageLevel.Warning
+                )
+                return []
+            table_names.add(table_name.casefold())
+
+            mosaic_layer = QgsVectorLayer(
+                f"{gpkg_path}|layername={table_name}", table_name, "ogr")
+            if not mosaic_layer.isValid():
+                return []
+
+            renderer = self._merge_categorized_renderers(layers)
+            if renderer is not None:
+                mosaic_layer.setRenderer(renderer)
+            if LITHO_LAYER_KEYWORD in table_name.lower():
+                self.apply_labeling(mosaic_layer, font_family, font_size)
+            mosaic_layers.append(mosaic_layer)
+
+            QgsMessageLog.logMessage(
+                f"Mosaic: {table_name} <- {len(layers)} sheet layer(s), {feature_count} feature(s)",
+                "KIGAM Plugin",
+                Qgis.MessageLevel.Info
+            )
+
+        # Swap the per-sheet layers (and their now-empty groups) for the mosaic.
+        project = QgsProject.instance()
+        tree_root = project.layerTreeRoot()
+        source_ids = [layer.id() for members in roles.values() for _, layer in members]
+        sheet_groups = set()
+        for layer_id in source_ids:
+            node = tree_root.findLayer(layer_id)
+            if node is not None and node.parent() is not None and node.parent() != tree_root:
+                sheet_groups.add(node.parent())
+        project.removeMapLayers(source_ids)
+        for group in sheet_groups:
+            if not group.children() and group.parent() is not None:
+                group.parent().removeChildNode(group)
+
+        group = tree_root.insertGroup(
+            0, self._build_unique_group_name(tree_root, MOSAIC_GROUP_NAME))
+        self._insert_layers_into_group(group, mosaic_layers)
+
+        QgsMessageLog.logMessage(
+            f"Mosaic: {len(mosaic_layers)} theme layer(s) from {len(sheet_layers)} sheet(s) "
+            f"in {time.perf_counter() - started:.2f}s ({gpkg_path})",
+            "KIGAM Plugin",
+            Qgis.MessageLevel.Success
+        )
+        return mosaic_layers
 
     def apply_sym_styling(self, layer, sym_path, qml_path=None):
         """
@@ -733,23 +2220,8 @@ class ZipProcessor:
                 normalized_sym_files
             )
             if png_path:
-
-                if layer.geometryType() == 0:  # Point
-                    # Create Raster Marker
-                    symbol_layer = QgsRasterMarkerSymbolLayer(png_path)
-                    # Configurable default size
-                    symbol_layer.setSize(MARKER_SYMBOL_SIZE)
-                    symbol = QgsMarkerSymbol()
-                    symbol.changeSymbolLayer(0, symbol_layer)
-
-                elif layer.geometryType() == 2:  # Polygon
-                    # Create Raster Fill
-                    symbol_layer = QgsRasterFillSymbolLayer()
-                    symbol_layer.setImageFilePath(png_path)
-                    # Configurable pattern scale
-                    symbol_layer.setWidth(FILL_SYMBOL_WIDTH)
-                    symbol = QgsFillSymbol()
-                    symbol.changeSymbolLayer(0, symbol_layer)
+                symbol = _SYMBOL_FACTORY.symbol_for(
+                    png_path, layer.geometryType())
 
             # If no symbol found (or geometry not supported for raster), default symbol is used (random color)
             if symbol:
@@ -832,17 +2304,13 @@ class ZipProcessor:
         layer.setLabeling(QgsVectorLayerSimpleLabeling(settings))
         layer.setLabelsEnabled(True)
 
-    def organize_layers(self, group, layers):
+    @staticmethod
+    def _layer_tree_order(layers):
         """
-        Organize layers in an existing ZIP group:
-        2. Points (Top)
-        3. Lines (Middle)
-        4. Polygons (Bottom)
-        5. Reference/Frame (Very Bottom, Hidden)
+        Return (layers top-to-bottom, ids of reference layers).
+        Bottom to top: Reference -> Polygons -> Lines -> Points, each class
+        stacked so the first-loaded layer ends up lowest.
         """
-        if group is None or not layers:
-            return
-
         # Separate layers by type/role
         points = []
         lines = []
@@ -860,36 +2328,63 @@ class ZipProcessor:
             else:  # Polygon
                 polygons.append(layer)
 
-        # Desired Order in Group (Bottom to Top):
-        # Reference -> Polygons -> Lines -> Points
-        all_ordered = reference + polygons + lines + points
+        bottom_to_top = reference + polygons + lines + points
+        return list(reversed(bottom_to_top)), {layer.id() for layer in reference}
+
+    def _insert_layers_into_group(self, group, layers):
+        """
+        Register *layers* with the project in one call and insert them into
+        *group* already ordered, as a single batch of layer-tree nodes.
+        """
+        if group is None or not layers:
+            return
 
-        for layer in all_ordered:
+        ordered, reference_ids = self._layer_tree_order(layers)
+        # Add to project without auto-placement, then place directly in this ZIP group.
+        # This avoids inheriting currently selected layer-tree insertion context.
+        QgsProject.instance().addMapLayers(ordered, False)
+
+        nodes = []
+        for layer in ordered:
+            node = QgsLayerTreeLayer(layer)
+            if layer.id() in reference_ids:
+                node.setItemVisibilityChecked(False)
+            nodes.append(node)
+        group.insertChildNodes(0, nodes)
+        group.setExpanded(True)
+
+    def organize_layers(self, group, layers):
+        """
+        Organize layers in an existing ZIP group:
+        2. Points (Top)
+        3. Lines (Middle)
+        4. Polygons (Bottom)
+        5. Reference/Frame (Very Bottom, Hidden)
+        Nodes are detached and re-inserted as one batch.
+        """
+        if group is None or not layers:
+            return
+
+        ordered, reference_ids = self._layer_tree_order(layers)
+
+        originals = []
+        clones = []
+        for layer in ordered:
             node = group.findLayer(layer.id())
-            if node:
-                # Move into group
-                clone = node.clone()
-                # Insert at top of group (index 0) so reversed order works?
-                # No, if we append, they go to bottom.
-                # If we want Points at top, we should insert them last or ...
-                # Let's verify standard behavior. addGroup adds to TOP of Tree.
-                # We want Points at Top of Group.
-                # So if we iterate All Ordered (Ref -> ... -> Points) and insert at 0,
-                # Reference goes to 0.
-                # Polygon goes to 0 (Ref becomes 1).
-                # ...
-                # Point goes to 0.
-                # So the order at 0 will be Points. Correct.
-
-                group.insertChildNode(0, clone)
-                group.removeChildNode(node)
-
-                # Check visibility for reference layers
-                if layer in reference:
-                    # We need to get the node from the group now
-                    # But wait, clone is the new node? No, clone is a QgsLayerTreeLayer object.
-                    # QgsLayerTreeNode.setItemVisibilityChecked(False)
-                    clone.setItemVisibilityChecked(False)
-
-                # Expand group
-                group.setExpanded(True)
+            if not node:
+                continue
+            clone = node.clone()
+            if layer.id() in reference_ids:
+                clone.setItemVisibilityChecked(False)
+            originals.append(node)
+            clones.append(clone)
+        if not clones:
+            return
+
+        if len(originals) == len(group.children()):
+            group.removeAllChildren()
+        else:
+            for node in originals:
+                node.parent().removeChildNode(node)
+        group.insertChildNodes(0, clones)
+        group.setExpanded(True)
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Zonal statistics of geochem rasters over lithology polygons
+
+Burns the lithological units of a polygon layer into a label raster on the
+geochem raster's own grid, then reduces every unit in streaming row blocks
+with np.bincount, instead of querying the raster feature by feature.
+"""
+import csv
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from osgeo import gdal, osr
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsField,
+    QgsFields,
+    QgsProject,
+    QgsVectorFileWriter,
+    QgsWkbTypes,
+)
+
+from .maxent_export import (
+    ASC_CHUNK_CELLS,
+    CATEGORY_NODATA,
+    ExportVariable,
+    _burn_chunks,
+    _category_data_type,
+    _category_key,
+    _feature_chunks,
+    _safe_name,
+    build_category_codes,
+)
+
+
+# Per-unit histogram bins used for percentiles (error <= unit range / bins).
+HISTOGRAM_BINS = 4096
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+
+
+@dataclass
+class ZonalResult:
+    """Statistics per unit; arrays are indexed by unit code - 1."""
+    raster_path: str
+    zones: List[str]
+    count: np.ndarray
+    mean: np.ndarray
+    std: np.ndarray
+    minimum: np.ndarray
+    maximum: np.ndarray
+    percentiles: Dict[float, np.ndarray] = field(default_factory=dict)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Statistic name -> per-unit values, in output column order."""
+        columns = {
+            "count": self.count,
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.minimum,
+            "max": self.maximum,
+        }
+        for percentile, values in self.percentiles.items():
+            columns[f"p{percentile:g}"] = values
+        return columns
+
+
+def _double_field(name):
+    try:
+        from qgis.PyQt.QtCore import QMetaType
+        return QgsField(name, QMetaType.Type.Double)
+    except (ImportError, AttributeError, TypeError):
+        from qgis.PyQt.QtCore import QVariant
+        return QgsField(name, QVariant.Double)
+
+
+def _grid_signature(ds) -> tuple:
+    return ds.GetGeoTransform(), ds.RasterXSize, ds.RasterYSize, ds.GetProjection()
+
+
+def burn_zone_labels(layers, zone_field: str, raster_path: str, label_path: str,
+                     codes: Dict[str, int], chunk_size: int = 5000) -> int:
+    """
+    Burn the unit code of every polygon into a Byte/UInt16 GeoTIFF with the
+    grid of *raster_path* (0 = outside any unit). Features are streamed
+    from the providers in chunks. Returns the number of features burned.
+    """
+    src = gdal.Open(raster_path)
+    if src is None:
+        raise RuntimeError(f"래스터를 열 수 없습니다: {raster_path}")
+    wkt = src.GetProjection()
+    ds = gdal.GetDriverByName("GTiff").Create(
+        label_path, src.RasterXSize, src.RasterYSize, 1, _category_data_type(len(codes)),
+        options=["TILED=YES", "COMPRESS=LZW"])
+    if ds is None:
+        raise RuntimeError(f"출력 파일을 만들 수 없습니다: {label_path}")
+    ds.SetGeoTransform(src.GetGeoTransform())
+    ds.SetProjection(wkt)
+    src = None
+    band = ds.GetRasterBand(1)
+    band.SetNoDataValue(CATEGORY_NODATA)
+    band.Fill(CATEGORY_NODATA)
+
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(wkt)
+    raster_crs = QgsCoordinateReferenceSystem.fromWkt(wkt)
+
+    def burn_value(value):
+        return codes.get(_category_key(value))
+
+    burned = 0
+    try:
+        for layer in layers:
+            field_idx = layer.fields().indexOf(zone_field)
+            if field_idx < 0:
+                continue
+            transform = None
+            if layer.crs().isValid() and raster_crs.isValid() and layer.crs() != raster_crs:
+                transform = QgsCoordinateTransform(layer.crs(), raster_crs, QgsProject.instance())
+            chunks = _feature_chunks(layer, field_idx, transform, QgsFeatureRequest(), chunk_size)
+            burned += _burn_chunks(ds, chunks, srs, burn_value)
+        ds.FlushCache()
+    finally:
+        ds = None
+    return burned
+
+
+def _row_blocks(value_band, label_band, width: int, height: int, nodata: Optional[float]):
+    """Yield (labels, values) of the valid cells, about ASC_CHUNK_CELLS at a time."""
+    chunk_rows = max(1, ASC_CHUNK_CELLS // max(1, width))
+    for y_off in range(0, height, chunk_rows):
+        rows = min(chunk_rows, height - y_off)
+        values = value_band.ReadAsArray(0, y_off, width, rows)
+        labels = label_band.ReadAsArray(0, y_off, width, rows)
+        valid = labels != CATEGORY_NODATA
+        if values.dtype.kind == "f":
+            valid &= np.isfinite(values)
+        if nodata is not None:
+            valid &= values != np.asarray(nodata).astype(values.dtype)
+        yield labels[valid].astype(np.int64), values[valid].astype(np.float64)
+
+
+def zonal_statistics(raster_path: str, label_path: str, zones: Sequence[str],
+                     percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+                     bins: int = HISTOGRAM_BINS) -> ZonalResult:
+    """
+    Count, mean, standard deviation, min, max and *percentiles* of band 1
+    of *raster_path* per unit of *label_path* (codes 1..len(zones)).
+
+    Two streaming passes over row blocks: the first merges per-block
+    np.bincount moments (Chan's parallel update, so the variance stays
+    stable) and reduceat minima/maxima; the second fills a per-unit
+    histogram over each unit's own [min, max] for the percentiles.
+    """
+    ds = gdal.Open(raster_path)
+    labels_ds = gdal.Open(label_path)
+    if ds is None or labels_ds is None:
+        raise RuntimeError(f"래스터를 열 수 없습니다: {raster_path}")
+    if _grid_signature(ds)[:3] != _grid_signature(labels_ds)[:3]:
+        raise ValueError(f"라벨 래스터의 격자가 다릅니다: {label_path}")
+    value_band = ds.GetRasterBand(1)
+    label_band = labels_ds.GetRasterBand(1)
+    width, height = ds.RasterXSize, ds.RasterYSize
+    nodata = value_band.GetNoDataValue()
+
+    size = len(zones) + 1
+    count = np.zeros(size, dtype=np.float64)
+    mean = np.zeros(size, dtype=np.float64)
+    m2 = np.zeros(size, dtype=np.float64)
+    minimum = np.full(size, np.inf)
+    maximum = np.full(size, -np.inf)
+
+    for labels, values in _row_blocks(value_band, label_band, width, height, nodata):
+        if not len(labels):
+            continue
+        block_count = np.bincount(labels, minlength=size).astype(np.float64)
+        present = block_count > 0
+        block_mean = np.zeros(size)
+        block_mean[present] = np.bincount(labels, weights=values, minlength=size)[present] / block_count[present]
+        block_m2 = np.bincount(labels, weights=(values - block_mean[labels]) ** 2, minlength=size)
+
+        total = count + block_count
+        delta = block_mean - mean
+        ratio = np.divide(block_count, total, out=np.zeros(size), where=total > 0)
+        mean += delta * ratio
+        m2 += block_m2 + delta * delta * count * ratio
+        count = total
+
+        order = np.argsort(labels, kind="stable")
+        sorted_labels = labels[order]
+        sorted_values = values[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        units = sorted_labels[starts]
+        minimum[units] = np.minimum(minimum[units], np.minimum.reduceat(sorted_values, starts))
+        maximum[units] = np.maximum(maximum[units], np.maximum.reduceat(sorted_values, starts))
+
+    histogram = np.zeros((size, bins), dtype=np.int64)
+    if percentiles:
+        span = np.where(maximum > minimum, maximum - minimum, 1.0)
+        for labels, values in _row_blocks(value_band, label_band, width, height, nodata):
+            if not len(labels):
+                continue
+            bin_idx = ((values - minimum[labels]) / span[labels] * bins).astype(np.int64)
+            np.clip(bin_idx, 0, bins - 1, out=bin_idx)
+            histogram += np.bincount(labels * bins + bin_idx, minlength=size * bins).reshape(size, bins)
+    ds = None
+    labels_ds = None
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.sqrt(m2 / count)
+    empty = count == 0
+    mean[empty] = np.nan
+    minimum[empty] = np.nan
+    maximum[empty] = np.nan
+
+    result = ZonalResult(
+        raster_path, list(zones), count[1:].astype(np.int64), mean[1:], std[1:], minimum[1:], maximum[1:])
+    cumulative = np.cumsum(histogram, axis=1)
+    width_per_bin = (maximum - minimum) / bins
+    rows = np.arange(size)
+    last = np.maximum(count - 1, 0)
+
+    def order_statistic(index):
+        """Estimated value of the index-th smallest cell of every unit."""
+        bin_idx = np.minimum((cumulative <= index[:, None]).sum(axis=1), bins - 1)
+        before = np.where(bin_idx > 0, cumulative[rows, np.maximum(bin_idx - 1, 0)], 0)
+        in_bin = np.maximum(histogram[rows, bin_idx], 1)
+        # The cells of a bin are spread evenly across it.
+        fraction = np.clip((index - before + 0.5) / in_bin, 0.0, 1.0)
+        values = np.where(maximum > minimum, minimum + (bin_idx + fraction) * width_per_bin, minimum)
+        values = np.where(index <= 0, minimum, values)
+        return np.where(index >= last, maximum, values)
+
+    for percentile in percentiles:
+        # Linear interpolation between order statistics, as numpy.percentile.
+        rank = (float(percentile) / 100.0) * last
+        lower = np.floor(rank)
+        values = order_statistic(lower)
+        upper_values = order_statistic(np.minimum(lower + 1, last))
+        values = values + (rank - lower) * (upper_values - values)
+        values[empty] = np.nan
+        result.percentiles[percentile] = values[1:]
+    return result
+
+
+def write_zonal_csv(csv_path: str, zone_field: str, result: ZonalResult, decimals: int = 4) -> str:
+    """One row per unit: unit value, code and every statistic (empty units have count 0)."""
+    columns = result.columns()
+    with open(csv_path, "w", encoding="utf-8-sig", newline="") as fp:
+        writer = csv.writer(fp)
+        writer.writerow([zone_field, "code"] + list(columns))
+        for idx, zone in enumerate(result.zones):
+            row = [zone, idx + 1]
+            for name, values in columns.items():
+                value = values[idx]
+                if name == "count":
+                    row.append(int(value))
+                else:
+                    row.append("" if np.isnan(value) else f"{value:.{decimals}f}")
+            writer.writerow(row)
+    return csv_path
+
+
+def write_zonal_layer(gpkg_path: str, table_name: str, layers, zone_field: str,
+                      results: Dict[str, ZonalResult]) -> int:
+    """
+    Copy the polygons of *layers* into a GeoPackage table with one
+    "<raster>_<statistic>" column per result, filled from the unit of each
+    feature. The source layers are not modified. Returns the feature count.
+    """
+    target_crs = layers[0].crs()
+    fields = QgsFields()
+    for source_field in layers[0].fields():
+        fields.append(QgsField(source_field))
+    stat_columns = []
+    for prefix, result in results.items():
+        codes = {zone: idx for idx, zone in enumerate(result.zones)}
+        for name, values in result.columns().items():
+            column = f"{prefix}_{name}"
+            fields.append(_double_field(column))
+            stat_columns.append((fields.indexOf(column), codes, values))
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    options.layerName = table_name
+    options.fileEncoding = "UTF-8"
+    options.actionOnExistingFile = QgsVectorFileWriter.ActionOnExistingFile.CreateOrOverwriteFile
+    writer = QgsVectorFileWriter.create(
+        gpkg_path,
+        fields,
+        QgsWkbTypes.multiType(layers[0].wkbType()),
+        target_crs,
+        QgsProject.instance().transformContext(),
+        options
+    )
+    if writer.hasError() != QgsVectorFileWriter.WriterError.NoError:
+        raise RuntimeError(writer.errorMessage())
+
+    feature_count = 0
+    try:
+        for layer in layers:
+            transform = None
+            if layer.crs() != target_crs:
+                transform = QgsCoordinateTransform(layer.crs(), target_crs, QgsProject.instance())
+            index_map = [fields.indexOf(f.name()) for f in layer.fields()]
+            zone_idx = layer.fields().indexOf(zone_field)
+            for source in layer.getFeatures():
+                attributes = [None] * fields.count()
+                for src_idx, value in enumerate(source.attributes()):
+                    if index_map[src_idx] >= 0:
+                        attributes[index_map[src_idx]] = value
+                zone = _category_key(source.attribute(zone_idx)) if zone_idx >= 0 else None
+                for dst_idx, codes, values in stat_columns:
+                    idx = codes.get(zone)
+                    if idx is not None and not np.isnan(values[idx]):
+                        attributes[dst_idx] = float(values[idx])
+
+                geometry = source.geometry()
+                if transform is not None and not geometry.isNull():
+                    geometry.transform(transform)
+                if not geometry.isNull():
+                    geometry.convertToMultiType()
+                feature = QgsFeature(fields)
+                feature.setGeometry(geometry)
+                feature.setAttributes(attributes)
+                if not writer.addFeature(feature):
+                    raise RuntimeError(
+                        f"{layer.name()} 피처 {source.id()} 기록 실패: {writer.errorMessage()}")
+                feature_count += 1
+    finally:
+        # Deleting the writer flushes and closes the table.
+        del writer
+    return feature_count
+
+
+def run_zonal_statistics(layers, zone_field: str, rasters: Dict[str, str], out_dir: str,
+                         percentiles: Sequence[float] = DEFAULT_PERCENTILES, log=None):
+    """
+    Zonal statistics of every raster in *rasters* (name -> path) over the
+    units of *layers*. Writes <out_dir>/<name>_zonal.csv per raster and
+    <out_dir>/zonal_<zone_field>.gpkg with the statistics as attributes.
+    Rasters on the same grid share one label raster.
+    Returns (csv paths, GeoPackage path).
+    """
+    log = log or (lambda _message: None)
+    os.makedirs(out_dir, exist_ok=True)
+    codes = build_category_codes(ExportVariable("zones", "vector", list(layers), zone_field))
+    if not codes:
+        raise ValueError(f"'{zone_field}' 필드에 암상 값이 없습니다.")
+    zones = sorted(codes, key=codes.get)
+    log(f"암상 단위 {len(zones)}개 ({zone_field})")
+
+    work_dir = tempfile.mkdtemp(prefix="KigamZonal_")
+    labels_by_grid = {}
+    results = {}
+    csv_paths = []
+    try:
+        for name, raster_path in rasters.items():
+            ds = gdal.Open(raster_path)
+            if ds is None:
+                raise RuntimeError(f"래스터를 열 수 없습니다: {raster_path}")
+            signature = _grid_signature(ds)
+            ds = None
+            label_path = labels_by_grid.get(signature)
+            if label_path is None:
+                label_path = os.path.join(work_dir, f"labels_{len(labels_by_grid)}.tif")
+                burned = burn_zone_labels(layers, zone_field, raster_path, label_path, codes)
+                labels_by_grid[signature] = label_path
+                log(f"  -> 라벨 래스터: 피처 {burned}개 ({signature[1]}x{signature[2]})")
+
+            result = zonal_statistics(raster_path, label_path, zones, percentiles)
+            # Different names can sanitize to the same prefix; never overwrite.
+            base = prefix = _safe_name(name)
+            suffix = 2
+            while prefix.lower() in (existing.lower() for existing in results):
+                prefix = f"{base}_{suffix}"
+                suffix += 1
+            results[prefix] = result
+            csv_paths.append(write_zonal_csv(os.path.join(out_dir, f"{prefix}_zonal.csv"), zone_field, result))
+            log(f"  -> {name}: 유효 셀 {int(result.count.sum())}개, {os.path.basename(csv_paths[-1])}")
+
+        gpkg_path = os.path.join(out_dir, f"zonal_{_safe_name(zone_field)}.gpkg")
+        write_zonal_layer(gpkg_path, "zonal_statistics", layers, zone_field, results)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return csv_paths, gpkg_path